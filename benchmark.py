@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+"""
+Leaflow 签到脚本离线基准测试
+启动本地模拟站点，把脚本指向它并运行 N 个账号，统计单账号耗时、吞吐量和峰值内存
+
+示例：
+    python benchmark.py --accounts 10 --concurrency 2
+    python benchmark.py --accounts 20 --concurrency 4 --shared-browser --rounds 2 --session-cache
+    python benchmark.py --accounts 10 --no-http --compare-backends
+    python benchmark.py --accounts 10 --no-http --disk-cache
+    python benchmark.py --accounts 20 --no-http --remote-webdrivers http://127.0.0.1:9515*2,http://127.0.0.1:9516*2
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import tempfile
+import threading
+
+from mock_leaflow import MockLeaflow, add_mock_arguments, mock_options
+
+
+class MemorySampler:
+    """定期采样当前进程及其子进程（chromedriver、Chrome）的常驻内存总和，记录峰值"""
+
+    def __init__(self, interval=0.2):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='memory-sampler', daemon=True)
+
+    def _run(self):
+        from leaflow_checkin import process_tree, process_rss
+
+        while not self._stop.is_set():
+            total = sum(process_rss(pid) for pid in process_tree(os.getpid()))
+            self.peak = max(self.peak, total)
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, round(fraction * (len(values) - 1))))
+    return values[index]
+
+
+def warm_sessions(leaflow, emails, base_url):
+    """通过HTTP登录模拟站点并写入会话缓存，模拟前一天留下的有效会话"""
+    import requests
+
+    store = leaflow.SessionStore.from_env()
+    for email in emails:
+        session = requests.Session()
+        session.post(f'{base_url}/login', data={'email': email, 'password': 'password'}, timeout=10)
+        store.save(email, leaflow.session_to_cookies(session))
+
+
+def run_round(leaflow, mock, round_index, lean=False, backend='selenium'):
+    os.environ['LEAFLOW_LEAN'] = 'true' if lean else 'false'
+    os.environ['LEAFLOW_BACKEND'] = backend
+    manager = leaflow.MultiAccountManager()
+    with mock.state.lock:
+        requests_before = mock.state.requests
+    start = time.perf_counter()
+    with MemorySampler() as sampler:
+        _, results = manager.run_all()
+    elapsed = time.perf_counter() - start
+
+    latencies = [record['total_seconds'] for record in manager.metrics.records]
+    commands = [record['webdriver_commands'] for record in manager.metrics.records]
+    command_seconds = sum(record['webdriver_seconds'] for record in manager.metrics.records)
+    success = sum(1 for _, ok, _, _ in results if ok)
+    network = manager.metrics.network_totals()
+    return {
+        'round': round_index,
+        'backend': backend,
+        'lean': lean,
+        'accounts': len(results),
+        'success': success,
+        'wall_seconds': round(elapsed, 3),
+        'throughput_per_min': round(len(results) / elapsed * 60, 2) if elapsed else 0.0,
+        'latency_mean': round(sum(latencies) / len(latencies), 3) if latencies else 0.0,
+        'latency_p50': round(percentile(latencies, 0.5), 3),
+        'latency_p95': round(percentile(latencies, 0.95), 3),
+        'latency_max': round(max(latencies), 3) if latencies else 0.0,
+        'webdriver_commands_mean': round(sum(commands) / len(commands), 1) if commands else 0.0,
+        'command_ms_mean': round(command_seconds / sum(commands) * 1000, 2) if sum(commands) else 0.0,
+        'peak_rss_mb': round(sampler.peak / 1024 / 1024, 1),
+        'site_requests': mock.state.requests - requests_before,
+        'transferred_kb': round((network or {}).get('transferred_bytes', 0) / 1024, 1),
+        'cache_hit_rate': round(network['cache_hits'] / network['static_requests'], 3)
+        if network and network.get('static_requests') else 0.0,
+        'cache_saved_kb': round((network or {}).get('cache_saved_bytes', 0) / 1024, 1),
+        'blocked_requests': (network or {}).get('blocked_requests', 0)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Leaflow 签到脚本离线基准测试')
+    parser.add_argument('--accounts', type=int, default=5, help='模拟账号数量')
+    parser.add_argument('--concurrency', type=int, default=None, help='并发数（LEAFLOW_CONCURRENCY），默认 1')
+    parser.add_argument('--rounds', type=int, default=1, help='运行轮数，每轮开始前重置签到状态')
+    parser.add_argument('--shared-browser', action='store_true', help='启用共享浏览器（LEAFLOW_SHARED_BROWSER）')
+    parser.add_argument('--session-cache', action='store_true', help='启用会话缓存，第二轮起可跳过登录')
+    parser.add_argument('--warm-sessions', action='store_true', help='运行前预先写入有效会话（隐含 --session-cache）')
+    parser.add_argument('--no-http', action='store_true', help='禁用HTTP签到，总是使用浏览器')
+    parser.add_argument('--lean', action='store_true', help='启用精简模式（LEAFLOW_LEAN），拦截图片、字体和第三方请求')
+    parser.add_argument('--compare-lean', action='store_true', help='每轮分别以普通模式和精简模式各运行一次并报告节省的流量')
+    parser.add_argument('--disk-cache', action='store_true',
+                        help='启用共享磁盘缓存（LEAFLOW_CACHE_DIR），报告静态资源的缓存命中率和节省的流量')
+    parser.add_argument('--backend', choices=['selenium', 'cdp'], default='selenium',
+                        help='浏览器驱动后端（LEAFLOW_BACKEND）')
+    parser.add_argument('--compare-backends', action='store_true',
+                        help='每轮分别用 selenium 和 cdp 后端各运行一次并报告命令延迟和单账号耗时的变化')
+    parser.add_argument('--remote-webdrivers', metavar='URLS',
+                        help='使用远程WebDriver端点（LEAFLOW_REMOTE_WEBDRIVERS），未指定 --concurrency 时并发数等于槽位总数')
+    parser.add_argument('--output', help='把结果以JSON写入该文件')
+    parser.add_argument('--verbose', action='store_true', help='显示签到脚本的日志')
+    add_mock_arguments(parser)
+    args = parser.parse_args()
+
+    mock = MockLeaflow(**mock_options(args)).start()
+    workdir = tempfile.mkdtemp(prefix='leaflow-bench-')
+    emails = [f'user{i}@bench.local' for i in range(1, args.accounts + 1)]
+
+    # 必须在导入签到脚本之前设置好环境变量
+    for name in ('TELEGRAM_BOT_TOKEN', 'TELEGRAM_CHAT_ID', 'LEAFLOW_EMAIL', 'LEAFLOW_PASSWORD',
+                 'LEAFLOW_METRICS_FILE', 'LEAFLOW_PROM_FILE'):
+        os.environ.pop(name, None)
+    os.environ.update({
+        'LEAFLOW_BASE_URL': mock.base_url,
+        'LEAFLOW_CHECKIN_URL': mock.checkin_url,
+        'LEAFLOW_ACCOUNTS': ','.join(f'{email}:password' for email in emails),
+        'LEAFLOW_HEADLESS': '1',
+        'LEAFLOW_CONCURRENCY': str(args.concurrency or ''),
+        'LEAFLOW_SHARED_BROWSER': 'true' if args.shared_browser else 'false',
+        'LEAFLOW_HTTP_CHECKIN': 'false' if args.no_http else 'true',
+        'LEAFLOW_SELECTOR_STATS': os.path.join(workdir, 'selector_stats.json'),
+        'LEAFLOW_NETWORK_STATS': 'true',
+        # 每轮都要重新签到，不能被签到账本跳过
+        'LEAFLOW_LEDGER_DB': 'off',
+        'LEAFLOW_HISTORY_DB': 'off',
+    })
+    if args.session_cache or args.warm_sessions:
+        os.environ['LEAFLOW_SESSION_KEY'] = 'benchmark'
+        os.environ['LEAFLOW_SESSION_DIR'] = os.path.join(workdir, 'sessions')
+    else:
+        os.environ.pop('LEAFLOW_SESSION_KEY', None)
+    if args.remote_webdrivers:
+        os.environ['LEAFLOW_REMOTE_WEBDRIVERS'] = args.remote_webdrivers
+    else:
+        os.environ.pop('LEAFLOW_REMOTE_WEBDRIVERS', None)
+    if args.disk_cache:
+        os.environ['LEAFLOW_CACHE_DIR'] = os.path.join(workdir, 'cache')
+    else:
+        os.environ.pop('LEAFLOW_CACHE_DIR', None)
+
+    import leaflow_checkin
+    logging.getLogger().setLevel(logging.INFO if args.verbose else logging.WARNING)
+
+    if args.warm_sessions:
+        warm_sessions(leaflow_checkin, emails, mock.base_url)
+
+    rounds = []
+    try:
+        for round_index in range(1, args.rounds + 1):
+            modes = [False, True] if args.compare_lean else [args.lean]
+            backends = ['selenium', 'cdp'] if args.compare_backends else [args.backend]
+            for backend in backends:
+                for lean in modes:
+                    mock.state.checked_in.clear()
+                    rounds.append(run_round(leaflow_checkin, mock, round_index, lean, backend))
+    finally:
+        mock.stop()
+
+    columns = ['round', 'backend', 'lean', 'accounts', 'success', 'wall_seconds', 'throughput_per_min', 'latency_p50',
+               'latency_p95', 'latency_max', 'webdriver_commands_mean', 'command_ms_mean', 'peak_rss_mb',
+               'site_requests', 'transferred_kb', 'blocked_requests', 'cache_hit_rate', 'cache_saved_kb']
+    print('\t'.join(columns))
+    for result in rounds:
+        print('\t'.join(str(result[column]) for column in columns))
+
+    if args.compare_lean:
+        baseline = sum(result['transferred_kb'] for result in rounds if not result['lean'])
+        lean = sum(result['transferred_kb'] for result in rounds if result['lean'])
+        print(f'精简模式节省流量: {baseline - lean:.1f} KB（普通 {baseline:.1f} KB，精简 {lean:.1f} KB）')
+
+    if args.compare_backends:
+        averages = {}
+        for backend in ('selenium', 'cdp'):
+            selected = [result for result in rounds if result['backend'] == backend]
+            averages[backend] = (sum(result['command_ms_mean'] for result in selected) / len(selected),
+                                 sum(result['latency_mean'] for result in selected) / len(selected))
+            print(f'{backend}: 平均命令延迟 {averages[backend][0]:.2f} ms，平均单账号耗时 {averages[backend][1]:.3f} 秒')
+        failed = sorted({result['backend'] for result in rounds if result['success'] < result['accounts']})
+        if failed:
+            # 失败的账号往往在很早的步骤就结束了，耗时会偏低，不能用来比较
+            print(f'{"、".join(failed)} 后端有账号签到失败，耗时对比无效')
+        else:
+            print(f'DevTools后端单账号平均节省: {averages["selenium"][1] - averages["cdp"][1]:.3f} 秒')
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'options': vars(args), 'rounds': rounds}, f, ensure_ascii=False, indent=2)
+
+    return 0 if all(result['success'] == result['accounts'] for result in rounds) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
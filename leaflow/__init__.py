@@ -0,0 +1 @@
+"""Leaflow 签到脚本的各个子系统，入口仍然是 leaflow_checkin.py"""
@@ -0,0 +1,506 @@
+"""
+DevTools后端：不经过chromedriver，直接通过DevTools协议控制本机Chrome
+"""
+
+import os
+import re
+import json
+import time
+import base64
+import socket
+import hashlib
+import logging
+import threading
+import subprocess
+from collections import deque
+from types import SimpleNamespace
+from urllib.parse import urlparse
+
+# 只有选择DevTools后端时才导入本模块，此时Selenium已经导入；沿用其异常类型，签到流程的错误处理无需区分后端
+from selenium.common.exceptions import (
+    TimeoutException, StaleElementReferenceException, SessionNotCreatedException,
+    WebDriverException, NoSuchElementException, NoSuchWindowException
+)
+
+from .process import kill_process_tree
+
+logger = logging.getLogger(__name__)
+
+class DevToolsSocket:
+    """最小的WebSocket客户端（RFC 6455），只用于和本机Chrome的DevTools端口收发文本消息"""
+    
+    GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+    
+    def __init__(self, url, timeout=10):
+        parsed = urlparse(url)
+        self.sock = socket.create_connection((parsed.hostname, parsed.port or 80), timeout=timeout)
+        # 命令都是小消息，关闭Nagle算法避免每条命令额外等待
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._buffer = bytearray()
+        
+        key = base64.b64encode(os.urandom(16)).decode()
+        self.sock.sendall((
+            f"GET {parsed.path or '/'} HTTP/1.1\r\nHost: {parsed.netloc}\r\n"
+            f"Upgrade: websocket\r\nConnection: Upgrade\r\n"
+            f"Sec-WebSocket-Key: {key}\r\nSec-WebSocket-Version: 13\r\n\r\n"
+        ).encode())
+        while b'\r\n\r\n' not in self._buffer:
+            self._fill(len(self._buffer) + 1)
+        end = self._buffer.index(b'\r\n\r\n') + 4
+        header = bytes(self._buffer[:end])
+        del self._buffer[:end]
+        accept = base64.b64encode(hashlib.sha1((key + self.GUID).encode()).digest())
+        if header.split(b' ', 2)[1:2] != [b'101'] or accept not in header:
+            status = header.split(b'\r\n', 1)[0].decode('latin-1')
+            raise ConnectionError(f"DevTools WebSocket握手失败: {status}")
+    
+    def _fill(self, size):
+        """确保缓冲区中至少有size字节，超时时已读到的数据保留在缓冲区中"""
+        while len(self._buffer) < size:
+            chunk = self.sock.recv(65536)
+            if not chunk:
+                raise ConnectionError("DevTools连接已断开")
+            self._buffer += chunk
+    
+    def send(self, text, opcode=0x1):
+        payload = text.encode('utf-8') if isinstance(text, str) else text
+        length = len(payload)
+        header = bytearray([0x80 | opcode])
+        if length < 126:
+            header.append(0x80 | length)
+        elif length < 65536:
+            header.append(0x80 | 126)
+            header += length.to_bytes(2, 'big')
+        else:
+            header.append(0x80 | 127)
+            header += length.to_bytes(8, 'big')
+        # 客户端发出的帧必须加掩码，整段按整数异或比逐字节处理快得多
+        mask = os.urandom(4)
+        repeated = (mask * (length // 4 + 1))[:length]
+        masked = (int.from_bytes(payload, 'little') ^ int.from_bytes(repeated, 'little')).to_bytes(length, 'little')
+        self.sock.sendall(bytes(header) + mask + masked)
+    
+    def recv(self, timeout=None):
+        """读取一条完整的文本消息，自动回应ping；超时抛出 socket.timeout"""
+        self.sock.settimeout(timeout)
+        message = bytearray()
+        while True:
+            # 整帧到齐后才从缓冲区取走，超时不会读出半个帧
+            self._fill(2)
+            first, second = self._buffer[0], self._buffer[1]
+            length, offset = second & 0x7F, 2
+            if length == 126:
+                self._fill(4)
+                length, offset = int.from_bytes(self._buffer[2:4], 'big'), 4
+            elif length == 127:
+                self._fill(10)
+                length, offset = int.from_bytes(self._buffer[2:10], 'big'), 10
+            self._fill(offset + length)
+            payload = bytes(self._buffer[offset:offset + length])
+            del self._buffer[:offset + length]
+            
+            opcode = first & 0x0F
+            if opcode == 0x8:
+                raise ConnectionError("DevTools连接已关闭")
+            if opcode == 0x9:
+                self.send(payload, opcode=0xA)
+            elif opcode in (0x0, 0x1, 0x2):
+                message += payload
+                if first & 0x80:
+                    return message.decode('utf-8')
+    
+    def close(self):
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+
+# 在页面中执行脚本的包装：参数和返回值中的元素通过页面内的元素表传递，
+# 元素表随文档重建，旧文档的元素引用会被识别为失效，与WebDriver的 stale element 语义一致
+CDP_SCRIPT_TEMPLATE = """
+(() => {
+    const table = window.__leaflowElements || (window.__leaflowElements = {
+        doc: Math.random().toString(36).slice(2), nodes: []
+    });
+    const decode = value => {
+        if (Array.isArray(value)) return value.map(decode);
+        if (value && typeof value === 'object') {
+            if ('__leaflowElement' in value) {
+                const el = value.doc === table.doc ? table.nodes[value.__leaflowElement] : null;
+                if (!el || !el.isConnected) throw new Error('leaflow:stale element reference');
+                return el;
+            }
+            return Object.fromEntries(Object.entries(value).map(([k, v]) => [k, decode(v)]));
+        }
+        return value;
+    };
+    const encode = value => {
+        if (value instanceof Element) {
+            let index = table.nodes.indexOf(value);
+            if (index < 0) index = table.nodes.push(value) - 1;
+            return {__leaflowElement: index, doc: table.doc};
+        }
+        if (Array.isArray(value) || value instanceof NodeList || value instanceof HTMLCollection) {
+            return Array.from(value, encode);
+        }
+        if (value && typeof value === 'object') {
+            return Object.fromEntries(Object.entries(value).map(([k, v]) => [k, encode(v)]));
+        }
+        return value === undefined ? null : value;
+    };
+    const args = decode(__ARGS__);
+    const script = function() {
+__SCRIPT__
+    };
+    __CALL__
+})()
+"""
+
+CDP_SYNC_CALL = "return encode(script.apply(window, args));"
+
+CDP_ASYNC_CALL = "return new Promise(resolve => script.apply(window, args.concat([value => resolve(encode(value))])));"
+
+class CdpElement:
+    """CdpDriver 返回的页面元素，实现签到流程用到的 WebElement 接口"""
+    
+    # 滚动到元素中心并返回其视口坐标，元素被其他元素遮挡时返回null
+    CLICK_POINT_SCRIPT = """
+        const el = arguments[0];
+        el.scrollIntoView({block: 'center', inline: 'center'});
+        const rect = el.getBoundingClientRect();
+        const x = rect.left + rect.width / 2, y = rect.top + rect.height / 2;
+        const hit = document.elementFromPoint(x, y);
+        return hit && (hit === el || el.contains(hit)) ? [x, y] : null;
+    """
+    
+    # 通过原型上的setter赋值，受控组件（React等）也能感知到值的变化
+    CLEAR_SCRIPT = """
+        const el = arguments[0];
+        el.focus();
+        const descriptor = Object.getOwnPropertyDescriptor(Object.getPrototypeOf(el), 'value');
+        if (descriptor && descriptor.set) descriptor.set.call(el, ''); else el.value = '';
+        el.dispatchEvent(new Event('input', {bubbles: true}));
+        el.dispatchEvent(new Event('change', {bubbles: true}));
+    """
+    
+    FOCUS_END_SCRIPT = """
+        const el = arguments[0];
+        el.focus();
+        try { el.setSelectionRange(el.value.length, el.value.length); } catch (e) {}
+    """
+    
+    VISIBLE_SCRIPT = """
+        const el = arguments[0], style = getComputedStyle(el);
+        return el.getClientRects().length > 0 && style.visibility !== 'hidden' && style.display !== 'none';
+    """
+    
+    def __init__(self, driver, reference):
+        self.parent = driver
+        self.reference = reference
+    
+    def _run(self, script, *args):
+        return self.parent.execute_script(script, self, *args)
+    
+    @property
+    def text(self):
+        return (self._run("return arguments[0].innerText || '';") or '').strip()
+    
+    def get_attribute(self, name):
+        return self._run("""
+            const [el, name] = arguments;
+            const value = el.getAttribute(name);
+            return value !== null ? value : (typeof el[name] === 'string' ? el[name] : null);
+        """, name)
+    
+    def is_enabled(self):
+        return bool(self._run("return !arguments[0].disabled;"))
+    
+    def is_displayed(self):
+        return bool(self._run(self.VISIBLE_SCRIPT))
+    
+    def clear(self):
+        self._run(self.CLEAR_SCRIPT)
+    
+    def send_keys(self, *value):
+        self._run(self.FOCUS_END_SCRIPT)
+        self.parent.execute('Input.insertText', {'text': ''.join(str(part) for part in value)})
+    
+    def click(self):
+        point = self._run(self.CLICK_POINT_SCRIPT)
+        if not point:
+            raise WebDriverException("element click intercepted: 元素被遮挡或不在视口中")
+        self.parent.click_at(*point)
+
+class CdpSwitchTo:
+    def __init__(self, driver):
+        self.driver = driver
+    
+    def window(self, handle):
+        self.driver.attach(handle)
+
+class CdpDriver:
+    """直接通过DevTools协议控制Chrome，实现签到流程用到的WebDriver接口子集
+    
+    命令经本机WebSocket直达浏览器，没有chromedriver的HTTP往返和命令转换。
+    所有协议命令都经过 execute()，instrument_driver 可以照常统计命令次数和耗时。
+    窗口句柄即DevTools的targetId，与chromedriver一致，共享浏览器的上下文管理无需区分后端。
+    """
+    
+    COMMAND_TIMEOUT = 120
+    # 浏览器级别的命令不发往页面会话
+    BROWSER_DOMAINS = ('Target.', 'Browser.', 'SystemInfo.')
+    # 页面正在跳转、旧文档的执行上下文已销毁；同步脚本稍后在新文档中重试
+    CONTEXT_LOST_ERRORS = ('Execution context was destroyed', 'Cannot find context', 'Cannot find default execution context')
+    # 记录到性能日志中的网络事件，collect_network_stats 按与chromedriver相同的格式读取
+    NETWORK_LOG_EVENTS = (
+        'Network.requestWillBeSent', 'Network.responseReceived', 'Network.loadingFinished', 'Network.loadingFailed'
+    )
+    
+    FIND_SCRIPT = """
+        const [by, value, all] = arguments;
+        let nodes;
+        if (by === 'xpath') {
+            const snapshot = document.evaluate(value, document, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+            nodes = [];
+            for (let k = 0; k < snapshot.snapshotLength; k++) nodes.push(snapshot.snapshotItem(k));
+        } else {
+            const selector = {
+                'css selector': value, 'tag name': value, 'id': '#' + CSS.escape(value),
+                'class name': '.' + CSS.escape(value), 'name': '[name="' + CSS.escape(value) + '"]'
+            }[by];
+            nodes = Array.from(document.querySelectorAll(selector));
+        }
+        return all ? nodes : (nodes[0] || null);
+    """
+    
+    def __init__(self, process, url, network_log=False, page_load_timeout=None):
+        self.process = process
+        # driver_pid / kill_driver 通过 service.process 找到浏览器进程
+        self.service = SimpleNamespace(process=process)
+        self.network_log = network_log
+        self.page_load_timeout = page_load_timeout or float(os.getenv('LEAFLOW_PHASE_TIMEOUT', '60') or 60)
+        self.switch_to = CdpSwitchTo(self)
+        self.socket = DevToolsSocket(url)
+        self._lock = threading.RLock()
+        self._next_id = 0
+        self._sessions = {}
+        self._target = None
+        self._session = None
+        # 已触发load事件的导航（loaderId）
+        self._loaded = deque(maxlen=64)
+        self._network_events = []
+        
+        pages = self.window_handles
+        self.attach(pages[0] if pages else self.execute('Target.createTarget', {'url': 'about:blank'})['targetId'])
+    
+    def _receive(self, deadline, what):
+        """读取一条消息并记录关心的事件"""
+        try:
+            message = json.loads(self.socket.recv(max(0.001, deadline - time.monotonic())))
+        except socket.timeout:
+            raise TimeoutException(f"{what}超时")
+        
+        method = message.get('method')
+        if method == 'Page.lifecycleEvent' and message['params'].get('name') == 'load':
+            self._loaded.append(message['params'].get('loaderId'))
+        elif self.network_log and method in self.NETWORK_LOG_EVENTS:
+            self._network_events.append({'message': json.dumps({'message': {'method': method, 'params': message['params']}})})
+        return message
+    
+    def execute(self, method, params=None):
+        """发送一条DevTools命令并等待结果"""
+        with self._lock:
+            self._next_id += 1
+            message = {'id': self._next_id, 'method': method, 'params': params or {}}
+            if self._session and not method.startswith(self.BROWSER_DOMAINS):
+                message['sessionId'] = self._session
+            self.socket.send(json.dumps(message))
+            
+            deadline = time.monotonic() + self.COMMAND_TIMEOUT
+            reply = self._receive(deadline, method)
+            while reply.get('id') != message['id']:
+                reply = self._receive(deadline, method)
+        
+        if 'error' in reply:
+            raise WebDriverException(f"{method}: {reply['error'].get('message')}")
+        return reply.get('result', {})
+    
+    def execute_cdp_cmd(self, cmd, cmd_args):
+        return self.execute(cmd, cmd_args)
+    
+    def attach(self, handle):
+        """切换到指定页面，首次切换时建立会话并开启所需的事件"""
+        session = self._sessions.get(handle)
+        if not session:
+            try:
+                session = self.execute('Target.attachToTarget', {'targetId': handle, 'flatten': True})['sessionId']
+            except WebDriverException as e:
+                raise NoSuchWindowException(f"no such window: {e}")
+            self._target, self._session = handle, session
+            self._sessions[handle] = session
+            self.execute('Page.enable')
+            self.execute('Page.setLifecycleEventsEnabled', {'enabled': True})
+            # 新页面的脚本环境在第一次使用时才创建，届时会执行已注册的页面脚本；
+            # 先创建出来，避免 apply_stealth 注册的脚本在当前空白页上再执行一次
+            self.execute('Runtime.evaluate', {'expression': '0'})
+            if self.network_log:
+                self.execute('Network.enable')
+        self._target, self._session = handle, session
+    
+    @property
+    def window_handles(self):
+        return [target['targetId'] for target in self.execute('Target.getTargets')['targetInfos'] if target['type'] == 'page']
+    
+    @property
+    def current_window_handle(self):
+        return self._target
+    
+    def _target_info(self):
+        return self.execute('Target.getTargetInfo', {'targetId': self._target})['targetInfo']
+    
+    @property
+    def current_url(self):
+        return self._target_info()['url']
+    
+    @property
+    def title(self):
+        return self._target_info()['title']
+    
+    def get(self, url):
+        """打开页面并等待load事件，与Selenium默认的页面加载策略一致"""
+        result = self.execute('Page.navigate', {'url': url})
+        if result.get('errorText'):
+            raise WebDriverException(f"unknown error: {result['errorText']}")
+        loader = result.get('loaderId')
+        if not loader:
+            # 同一文档内的跳转（如只改变锚点）没有新的页面加载
+            return
+        with self._lock:
+            deadline = time.monotonic() + self.page_load_timeout
+            while loader not in self._loaded:
+                self._receive(deadline, "页面加载")
+    
+    def _evaluate(self, script, args, is_async):
+        parts = {
+            'ARGS': json.dumps(self._encode(list(args))),
+            'SCRIPT': script,
+            'CALL': CDP_ASYNC_CALL if is_async else CDP_SYNC_CALL
+        }
+        # 一次替换全部占位符，参数中即使含有占位符文本也不会被再次替换
+        expression = re.sub(r'__(ARGS|SCRIPT|CALL)__', lambda match: parts[match.group(1)], CDP_SCRIPT_TEMPLATE)
+        params = {'expression': expression, 'returnByValue': True, 'awaitPromise': is_async}
+        deadline = time.monotonic() + self.page_load_timeout
+        while True:
+            try:
+                reply = self.execute('Runtime.evaluate', params)
+                break
+            except WebDriverException as e:
+                # 异步脚本被页面跳转中断时直接报错，与chromedriver一致
+                if is_async or time.monotonic() > deadline or not any(text in str(e) for text in self.CONTEXT_LOST_ERRORS):
+                    raise
+                time.sleep(0.05)
+        
+        details = reply.get('exceptionDetails')
+        if details:
+            description = details.get('exception', {}).get('description') or details.get('text', '')
+            if 'leaflow:stale element reference' in description:
+                raise StaleElementReferenceException("stale element reference: 元素已不在当前页面中")
+            raise WebDriverException(f"javascript error: {description.splitlines()[0] if description else ''}")
+        return self._decode(reply['result'].get('value'))
+    
+    def _encode(self, value):
+        if isinstance(value, CdpElement):
+            return value.reference
+        if isinstance(value, (list, tuple)):
+            return [self._encode(item) for item in value]
+        if isinstance(value, dict):
+            return {key: self._encode(item) for key, item in value.items()}
+        return value
+    
+    def _decode(self, value):
+        if isinstance(value, list):
+            return [self._decode(item) for item in value]
+        if isinstance(value, dict):
+            if '__leaflowElement' in value:
+                return CdpElement(self, value)
+            return {key: self._decode(item) for key, item in value.items()}
+        return value
+    
+    def execute_script(self, script, *args):
+        return self._evaluate(script, args, False)
+    
+    def execute_async_script(self, script, *args):
+        return self._evaluate(script, args, True)
+    
+    def find_element(self, by, value):
+        element = self.execute_script(self.FIND_SCRIPT, by, value, False)
+        if element is None:
+            raise NoSuchElementException(f"no such element: {by}={value}")
+        return element
+    
+    def find_elements(self, by, value):
+        return self.execute_script(self.FIND_SCRIPT, by, value, True)
+    
+    def click_at(self, x, y):
+        """在视口坐标处模拟一次鼠标左键点击"""
+        for event in ('mouseMoved', 'mousePressed', 'mouseReleased'):
+            self.execute('Input.dispatchMouseEvent', {'type': event, 'x': x, 'y': y, 'button': 'left', 'clickCount': 1})
+    
+    def get_log(self, log_type):
+        """返回自上次读取以来的网络事件，格式与chromedriver的性能日志相同"""
+        if log_type != 'performance' or not self.network_log:
+            raise WebDriverException(f"未开启 {log_type} 日志")
+        with self._lock:
+            entries, self._network_events = self._network_events, []
+        return entries
+    
+    def close(self):
+        """关闭当前页面"""
+        target, self._target, self._session = self._target, None, None
+        self._sessions.pop(target, None)
+        self.execute('Target.closeTarget', {'targetId': target})
+    
+    def quit(self):
+        """关闭浏览器并等待进程退出"""
+        try:
+            self.execute('Browser.close')
+        except Exception as e:
+            logger.debug(f"通过DevTools关闭浏览器失败: {e}")
+        finally:
+            self.socket.close()
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+
+def launch_cdp_driver(binary, chrome_options, profile_dir):
+    """不经过chromedriver直接启动Chrome可执行文件 binary，通过DevTools端口返回CdpDriver"""
+    # 端口号由Chrome自行选择并写入配置目录下的 DevToolsActivePort 文件，多个浏览器并行启动也不会冲突
+    process = subprocess.Popen(
+        [binary, *chrome_options.arguments, '--remote-debugging-port=0', f'--user-data-dir={profile_dir}',
+         '--password-store=basic', '--use-mock-keychain', 'about:blank'],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    port_file = os.path.join(profile_dir, 'DevToolsActivePort')
+    deadline = time.monotonic() + 30
+    try:
+        while True:
+            try:
+                with open(port_file, 'r', encoding='utf-8') as f:
+                    port, path = f.read().split('\n')[:2]
+                if port and path:
+                    break
+            except (OSError, ValueError):
+                pass
+            if process.poll() is not None:
+                raise SessionNotCreatedException(f"Chrome启动后立即退出，退出码 {process.returncode}")
+            if time.monotonic() > deadline:
+                raise SessionNotCreatedException("等待Chrome的DevTools端口超时")
+            time.sleep(0.02)
+        network_log = bool(chrome_options.capabilities.get('goog:loggingPrefs'))
+        return CdpDriver(process, f'ws://127.0.0.1:{port}{path}', network_log)
+    except Exception:
+        kill_process_tree(process.pid)
+        process.wait()
+        raise
@@ -0,0 +1,226 @@
+"""
+常驻模式：预热的浏览器池、按计划（加随机抖动）每天签到，以及健康检查/状态接口
+"""
+
+import os
+import re
+import json
+import time
+import random
+import logging
+import threading
+from datetime import datetime, timedelta
+from urllib.parse import urlparse
+
+from .remote import RemoteWebDriverPool
+from .store import CheckinLedger, mask_email
+
+logger = logging.getLogger(__name__)
+
+class CheckinDaemon:
+    """常驻模式：保持预热的浏览器池，每天在设定时间（加随机抖动）为各账号签到，并提供健康检查/状态接口
+    
+    每个账号的签到时间为 LEAFLOW_SCHEDULE（或账号文件中的 schedule）加上 0~LEAFLOW_SCHEDULE_JITTER 秒的随机延迟，
+    到点的账号分批运行，当天所有账号都有结果后发送一次汇总通知。
+    """
+    
+    # 没有到期账号时最长的休眠时间，也是心跳间隔
+    TICK_SECONDS = 30
+    
+    def __init__(self, manager, browser_pool):
+        """browser_pool 为常驻期间在各次运行之间复用的共享浏览器池"""
+        self.manager = manager
+        self.schedule = self.parse_time(os.getenv('LEAFLOW_SCHEDULE', '00:05')) or (0, 5)
+        self.jitter = float(os.getenv('LEAFLOW_SCHEDULE_JITTER', '1800') or 0)
+        self.status_addr = os.getenv('LEAFLOW_STATUS_ADDR', '127.0.0.1:8787').strip()
+        self.started = datetime.now(CheckinLedger.TIMEZONE)
+        self.day = None
+        self.due = {}
+        self.results = {}
+        self.notified = False
+        self.running = set()
+        self.last_run = None
+        self.heartbeat = time.monotonic()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._server = None
+        
+        manager.shared_browser = True
+        manager.browser_pool = browser_pool
+    
+    @staticmethod
+    def parse_time(value):
+        """解析 HH:MM，格式错误时返回None"""
+        match = re.fullmatch(r'\s*(\d{1,2}):(\d{2})\s*', value or '')
+        if not match or int(match.group(1)) > 23 or int(match.group(2)) > 59:
+            return None
+        return int(match.group(1)), int(match.group(2))
+    
+    def plan_day(self, now):
+        """为新的一天安排每个账号的签到时间，账本中今天已完成的账号直接记为完成"""
+        self.day = now.date()
+        self.due = {}
+        self.results = {}
+        self.notified = False
+        
+        completed = {}
+        if self.manager.ledger and not self.manager.force:
+            completed = self.manager.ledger.completed(account['email'] for account in self.manager.accounts)
+        for account in self.manager.accounts:
+            email = account['email']
+            if email in completed:
+                _, message, balance = completed[email]
+                self.results[email] = (email, True, message, balance)
+                continue
+            schedule = self.schedule
+            if account.get('schedule'):
+                schedule = self.parse_time(account['schedule']) or schedule
+            start = now.replace(hour=schedule[0], minute=schedule[1], second=0, microsecond=0)
+            self.due[email] = start + timedelta(seconds=random.uniform(0, self.jitter))
+        
+        if self.due:
+            first = min(self.due.values())
+            logger.info(f"{self.day} 共 {len(self.due)} 个账号待签到，最早 {first.strftime('%H:%M:%S')} 开始")
+    
+    def due_accounts(self, now):
+        return [
+            account for account in self.manager.accounts
+            if account['email'] not in self.results and account['email'] in self.due
+            and self.due[account['email']] <= now
+        ]
+    
+    def run_batch(self, accounts):
+        emails = {account['email'] for account in accounts}
+        with self._lock:
+            self.running = emails
+        start = time.time()
+        try:
+            _, results = self.manager.run_all(accounts, notify=False)
+        except Exception as e:
+            logger.error(f"常驻模式运行出错: {e}")
+            results = [(account['email'], False, f"运行出错: {e}", "未知") for account in accounts]
+        with self._lock:
+            self.running = set()
+            for result in results:
+                self.results[result[0]] = result
+            self.last_run = {
+                'finished': datetime.now(CheckinLedger.TIMEZONE).isoformat(timespec='seconds'),
+                'accounts': len(results),
+                'success': sum(1 for result in results if result[1]),
+                'seconds': round(time.time() - start, 3)
+            }
+    
+    def notify_if_complete(self):
+        """当天所有账号都有结果后发送一次汇总通知"""
+        if self.notified or len(self.results) < len(self.manager.accounts):
+            return
+        self.notified = True
+        ordered = [self.results[account['email']] for account in self.manager.accounts]
+        self.manager.send_notification(ordered)
+    
+    def run(self):
+        """主循环，直到收到停止信号"""
+        logger.info(f"常驻模式启动，每天 {self.schedule[0]:02d}:{self.schedule[1]:02d}（北京时间）起签到，随机延迟最多 {self.jitter:.0f} 秒")
+        self.start_status_server()
+        self.manager.browser_pool.prewarm()
+        try:
+            while not self._stop.is_set():
+                self.heartbeat = time.monotonic()
+                now = datetime.now(CheckinLedger.TIMEZONE)
+                if now.date() != self.day:
+                    self.plan_day(now)
+                
+                accounts = self.due_accounts(now)
+                if accounts:
+                    self.run_batch(accounts)
+                    self.notify_if_complete()
+                    # 运行结束后补足预热的浏览器
+                    self.manager.browser_pool.prewarm()
+                    continue
+                
+                pending = [due for email, due in self.due.items() if email not in self.results]
+                wait = min([(due - now).total_seconds() for due in pending] + [self.TICK_SECONDS])
+                self._stop.wait(max(1, wait))
+        finally:
+            if self._server:
+                self._server.shutdown()
+            self.manager.close()
+            logger.info("常驻模式已停止")
+    
+    def stop(self, *args):
+        self._stop.set()
+    
+    def health(self):
+        """主循环最近仍在运行时为健康（运行账号期间不要求心跳）"""
+        with self._lock:
+            busy = bool(self.running)
+        healthy = busy or time.monotonic() - self.heartbeat < self.TICK_SECONDS * 4
+        return healthy, {'status': 'ok' if healthy else 'stalled', 'running': busy}
+    
+    def status(self):
+        with self._lock:
+            accounts = []
+            for account in self.manager.accounts:
+                email = account['email']
+                result = self.results.get(email)
+                if email in self.running:
+                    state = 'running'
+                elif result:
+                    state = 'success' if result[1] else 'failed'
+                else:
+                    state = 'scheduled'
+                due = self.due.get(email)
+                accounts.append({
+                    'account': mask_email(email),
+                    'status': state,
+                    'scheduled': due.isoformat(timespec='seconds') if due else None,
+                    'result': result[2] if result else None,
+                    'balance': result[3] if result else None
+                })
+            return {
+                'started': self.started.isoformat(timespec='seconds'),
+                'day': str(self.day),
+                'accounts': accounts,
+                'last_run': self.last_run,
+                'pool': self.manager.browser_pool.stats(),
+                'remote_webdrivers': RemoteWebDriverPool.shared().stats() if RemoteWebDriverPool.shared() else None,
+                'rate_limiter': self.manager.limiter.stats() if self.manager.limiter else None
+            }
+    
+    def start_status_server(self):
+        """在 LEAFLOW_STATUS_ADDR 上提供 /health 和 /status，设为 off 时不启动"""
+        if not self.status_addr or self.status_addr.lower() in ('0', 'off', 'false', 'no'):
+            return
+        from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+        
+        daemon = self
+        
+        class StatusHandler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+            
+            def do_GET(self):
+                path = urlparse(self.path).path
+                if path == '/health':
+                    healthy, payload = daemon.health()
+                    status = 200 if healthy else 503
+                elif path == '/status':
+                    status, payload = 200, daemon.status()
+                else:
+                    status, payload = 404, {'error': 'not found'}
+                body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+        
+        host, _, port = self.status_addr.rpartition(':')
+        try:
+            self._server = ThreadingHTTPServer((host or '127.0.0.1', int(port)), StatusHandler)
+        except (OSError, ValueError) as e:
+            logger.warning(f"状态接口启动失败: {e}")
+            return
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name='status-server', daemon=True).start()
+        logger.info(f"状态接口: http://{self.status_addr}/status ，健康检查: /health")
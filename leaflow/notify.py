@@ -0,0 +1,208 @@
+"""
+Telegram通知
+"""
+
+import os
+import re
+import time
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+class TelegramNotifier:
+    """Telegram通知：复用连接、失败重试（遵循 retry_after）、超长消息自动拆分，可选实时进度消息"""
+    
+    MAX_MESSAGE_LENGTH = 4096
+    
+    def __init__(self, token, chat_id, api_url='https://api.telegram.org', live=False,
+                 max_attempts=5, live_interval=3.0):
+        import requests
+        
+        self.chat_id = chat_id
+        self.base_url = f"{api_url.rstrip('/')}/bot{token}"
+        self.live = live
+        self.max_attempts = max_attempts
+        self.live_interval = live_interval
+        self.session = requests.Session()
+        self._live_message_id = None
+        self._live_text = None
+        self._live_sent_text = None
+        self._live_lock = threading.Lock()
+        self._live_changed = threading.Event()
+        self._live_stop = threading.Event()
+        self._live_thread = None
+    
+    @classmethod
+    def from_env(cls):
+        """未配置Bot Token或Chat ID时返回None"""
+        token = os.getenv('TELEGRAM_BOT_TOKEN', '')
+        chat_id = os.getenv('TELEGRAM_CHAT_ID', '')
+        if not token or not chat_id:
+            return None
+        return cls(
+            token, chat_id,
+            api_url=os.getenv('TELEGRAM_API_URL', '') or 'https://api.telegram.org',
+            live=os.getenv('TELEGRAM_LIVE', '').lower() in ('1', 'true', 'yes')
+        )
+    
+    def call(self, method, data):
+        """调用Bot API，限流时按 retry_after 等待，网络错误和5xx按指数退避重试，返回result或None"""
+        import requests
+        
+        delay = 1.0
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                response = self.session.post(f"{self.base_url}/{method}", data=data, timeout=10)
+                payload = response.json() if response.content else {}
+            except (requests.RequestException, ValueError) as e:
+                logger.warning(f"Telegram {method} 请求出错（第 {attempt} 次）: {e}")
+            else:
+                if response.status_code == 200 and payload.get('ok'):
+                    return payload.get('result')
+                description = payload.get('description', response.text)
+                if 'message is not modified' in description:
+                    return payload.get('result')
+                if response.status_code == 429:
+                    retry_after = (payload.get('parameters') or {}).get('retry_after', delay)
+                    logger.warning(f"Telegram限流，{retry_after} 秒后重试")
+                    time.sleep(float(retry_after))
+                    continue
+                if response.status_code < 500:
+                    logger.error(f"Telegram {method} 失败: {description}")
+                    return None
+                logger.warning(f"Telegram {method} 服务端错误（第 {attempt} 次）: {description}")
+            
+            if attempt < self.max_attempts:
+                time.sleep(delay)
+                delay = min(delay * 2, 30)
+        logger.error(f"Telegram {method} 重试 {self.max_attempts} 次后仍失败")
+        return None
+    
+    # HTML消息中的标签、实体和单个字符，拆分只发生在它们之间
+    HTML_TOKEN_PATTERN = re.compile(r'<[^>]*>|&#?\w+;|[\s\S]')
+    
+    @staticmethod
+    def message_length(text):
+        """Telegram按UTF-16码元计算长度，💰🎁等表情各占2个"""
+        return len(text.encode('utf-16-le')) // 2
+    
+    @classmethod
+    def split_line(cls, line, limit):
+        """把超长的一行拆成多段，不拆开HTML实体和标签；被截断的标签在段尾闭合、在下一段开头重新打开"""
+        chunks = []
+        current = ''
+        stack = []
+        for token in cls.HTML_TOKEN_PATTERN.findall(line):
+            after = list(stack)
+            if token.startswith('</'):
+                name = token[2:-1].strip().lower()
+                for index in range(len(after) - 1, -1, -1):
+                    if after[index][0] == name:
+                        del after[index]
+                        break
+            elif token.startswith('<') and not token.endswith('/>'):
+                after.append((token[1:-1].split()[0].lower(), token))
+            closing = ''.join(f'</{name}>' for name, _ in reversed(after))
+            if current and cls.message_length(current + token + closing) > limit:
+                chunks.append(current + ''.join(f'</{name}>' for name, _ in reversed(stack)))
+                current = ''.join(tag for _, tag in stack)
+            current += token
+            stack = after
+        if current:
+            chunks.append(current)
+        return chunks
+    
+    @classmethod
+    def split_message(cls, blocks, limit=None):
+        """把消息块拼接成不超过长度限制的多条消息，尽量不在块中间断开
+        
+        超长的块先按行拆分，单行仍然超长时才在HTML标签和实体之外截断。
+        """
+        limit = limit or cls.MAX_MESSAGE_LENGTH
+        pieces = []
+        for block in blocks:
+            if cls.message_length(block) <= limit:
+                pieces.append(block)
+                continue
+            for line in block.splitlines(keepends=True):
+                if cls.message_length(line) <= limit:
+                    pieces.append(line)
+                else:
+                    pieces.extend(cls.split_line(line, limit))
+        
+        messages = []
+        current = ''
+        for piece in pieces:
+            if current and cls.message_length(current + piece) > limit:
+                messages.append(current)
+                current = ''
+            current += piece
+        if current:
+            messages.append(current)
+        return messages
+    
+    def send(self, blocks):
+        """发送消息块，超长时自动拆分为多条，全部成功返回True"""
+        messages = self.split_message(blocks)
+        sent = 0
+        for index, text in enumerate(messages, 1):
+            if len(messages) > 1:
+                logger.info(f"发送第 {index}/{len(messages)} 条Telegram消息")
+            if self.call('sendMessage', {'chat_id': self.chat_id, 'text': text, 'parse_mode': 'HTML'}) is not None:
+                sent += 1
+        return sent == len(messages)
+    
+    def start_live(self, text):
+        """在后台线程中发送一条进度消息并随后编辑它，发送和重试都不阻塞签到"""
+        if not self.live:
+            return
+        with self._live_lock:
+            self._live_text = text
+        self._live_thread = threading.Thread(target=self._live_loop, name='telegram-live', daemon=True)
+        self._live_thread.start()
+    
+    def update_live(self, text):
+        """记录最新进度，由后台线程合并后编辑消息"""
+        if not self._live_thread:
+            return
+        with self._live_lock:
+            self._live_text = text
+        self._live_changed.set()
+    
+    def _live_loop(self):
+        with self._live_lock:
+            text = self._live_text
+        result = self.call('sendMessage', {'chat_id': self.chat_id, 'text': text, 'parse_mode': 'HTML'})
+        if not result:
+            return
+        self._live_message_id = result.get('message_id')
+        self._live_sent_text = text
+        while not self._live_stop.is_set():
+            self._live_changed.wait()
+            self._live_changed.clear()
+            self._flush_live()
+            # 限制编辑频率，避免触发限流
+            self._live_stop.wait(self.live_interval)
+        self._flush_live()
+    
+    def _flush_live(self):
+        with self._live_lock:
+            text = self._live_text
+        if text and text != self._live_sent_text:
+            self.call('editMessageText', {
+                'chat_id': self.chat_id, 'message_id': self._live_message_id,
+                'text': text, 'parse_mode': 'HTML'
+            })
+            self._live_sent_text = text
+    
+    def finish_live(self, text=None):
+        """写入最终进度并停止后台线程"""
+        if not self._live_thread:
+            return
+        if text:
+            self.update_live(text)
+        self._live_stop.set()
+        self._live_changed.set()
+        self._live_thread.join(timeout=60)
+        self._live_thread = None
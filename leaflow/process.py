@@ -0,0 +1,185 @@
+"""
+浏览器进程管理：进程树、常驻内存和遗留进程的清理（依赖Linux的/proc）
+"""
+
+import os
+import signal
+import logging
+import tempfile
+
+logger = logging.getLogger(__name__)
+
+# 标记浏览器所属脚本进程的命令行开关
+OWNER_SWITCH = '--leaflow-owner'
+
+# chromedriver的命令行无法带上 OWNER_SWITCH，本脚本启动的chromedriver记录在此目录中（文件名为PID）
+PID_DIR = os.path.join(tempfile.gettempdir(), 'leaflow-pids')
+
+def process_tree(pid):
+    """返回进程及其所有子孙进程的PID（依赖Linux的/proc）"""
+    pids = [pid]
+    index = 0
+    while index < len(pids):
+        current = pids[index]
+        index += 1
+        try:
+            for task in os.listdir(f'/proc/{current}/task'):
+                with open(f'/proc/{current}/task/{task}/children') as f:
+                    pids.extend(int(child) for child in f.read().split())
+        except OSError:
+            continue
+    return pids
+
+def process_rss(pid):
+    """读取进程常驻内存（字节），进程不存在时返回0"""
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return 0
+
+def read_proc(pid, name):
+    try:
+        with open(f'/proc/{pid}/{name}', 'rb') as f:
+            return f.read()
+    except OSError:
+        return b''
+
+def stat_fields(pid):
+    """/proc/<pid>/stat 中进程名之后的字段（从状态开始），进程不存在时返回None"""
+    stat = read_proc(pid, 'stat').decode('utf-8', 'replace')
+    if not stat:
+        return None
+    # 进程名可能包含空格和括号，从最后一个右括号之后开始解析
+    return stat[stat.rfind(')') + 2:].split()
+
+def process_stat(pid):
+    """返回进程的 (状态, 父进程PID)，进程不存在时返回None"""
+    fields = stat_fields(pid)
+    return (fields[0], int(fields[1])) if fields else None
+
+def process_start_time(pid):
+    """进程的启动时间（开机后的时钟滴答数），与PID一起唯一标识一个进程"""
+    fields = stat_fields(pid)
+    return fields[19] if fields else None
+
+def process_alive(pid):
+    """进程存在且不是僵尸进程"""
+    stat = process_stat(pid)
+    return stat is not None and stat[0] != 'Z'
+
+def kill_pids(pids):
+    killed = 0
+    for pid in pids:
+        try:
+            os.kill(pid, signal.SIGKILL)
+            killed += 1
+        except (ProcessLookupError, PermissionError):
+            pass
+    return killed
+
+def kill_process_tree(pid):
+    """强制结束进程及其所有子孙进程，返回结束的进程数"""
+    # 先取得整棵进程树再逐个结束，避免父进程结束后子进程被托管到init而漏掉
+    return kill_pids(process_tree(pid))
+
+def record_owned_process(pid):
+    """记录本进程启动的chromedriver（或浏览器），reap_orphans 只清理有记录或带 OWNER_SWITCH 标记的进程"""
+    start_time = process_start_time(pid) if pid else None
+    if not start_time:
+        return
+    try:
+        os.makedirs(PID_DIR, exist_ok=True)
+        with open(os.path.join(PID_DIR, str(pid)), 'w') as f:
+            f.write(f"{os.getpid()} {start_time}")
+    except OSError as e:
+        logger.debug(f"记录浏览器进程失败: {e}")
+
+def forget_owned_process(pid):
+    """进程已正常退出或已被结束，删除其记录"""
+    if not pid:
+        return
+    try:
+        os.remove(os.path.join(PID_DIR, str(pid)))
+    except OSError:
+        pass
+
+def owned_processes():
+    """返回仍在运行的已记录进程 {PID: 所属脚本进程PID}；进程已退出或PID已被其他进程复用的记录会被删除"""
+    owned = {}
+    try:
+        names = os.listdir(PID_DIR)
+    except OSError:
+        return owned
+    for name in names:
+        if not name.isdigit():
+            continue
+        pid = int(name)
+        try:
+            with open(os.path.join(PID_DIR, name), 'r') as f:
+                owner, start_time = f.read().split()
+        except (OSError, ValueError):
+            continue
+        fields = stat_fields(pid)
+        if not fields or fields[0] == 'Z' or fields[19] != start_time:
+            forget_owned_process(pid)
+            continue
+        owned[pid] = int(owner)
+    return owned
+
+def reap_orphans(include_own=False):
+    """结束遗留的浏览器和chromedriver进程
+    
+    只处理本脚本启动的进程：带 OWNER_SWITCH 标记的浏览器，以及记录在 PID_DIR 中的chromedriver。
+    遗留进程指所属脚本进程已经退出的这些进程；include_own 为True时（运行结束时）
+    本进程启动但仍未退出的也会被结束。其他程序的chromedriver和浏览器不受影响。
+    只回收这里结束的本进程子进程，其他子进程的退出状态留给各自的 Popen 对象。
+    """
+    if not os.path.isdir('/proc'):
+        return 0
+    owner_prefix = f'{OWNER_SWITCH}='.encode()
+    own_pid = os.getpid()
+    
+    def orphaned(owner):
+        return (owner == own_pid and include_own) or (owner != own_pid and not process_alive(owner))
+    
+    recorded = owned_processes()
+    roots = {pid for pid, owner in recorded.items() if orphaned(owner)}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        pid = int(entry)
+        stat = process_stat(pid)
+        if not stat or stat[0] == 'Z':
+            continue
+        for argument in read_proc(pid, 'cmdline').split(b'\0'):
+            if not argument.startswith(owner_prefix):
+                continue
+            try:
+                owner = int(argument[len(owner_prefix):])
+            except ValueError:
+                # 标记不完整时无法确定所属进程，不作处理
+                break
+            if owner > 0 and orphaned(owner):
+                # 浏览器由本脚本记录的chromedriver启动时，连同chromedriver一起结束
+                roots.add(stat[1] if stat[1] in recorded else pid)
+            break
+    
+    pids = [pid for root in roots for pid in process_tree(root)]
+    children = [pid for pid in pids if (process_stat(pid) or (None, None))[1] == own_pid]
+    killed = kill_pids(pids)
+    for pid in roots:
+        forget_owned_process(pid)
+    if killed:
+        logger.warning(f"已清理 {killed} 个遗留的浏览器/chromedriver进程")
+    
+    # 回收刚结束的本进程子进程，避免留下僵尸进程
+    for pid in children:
+        try:
+            os.waitpid(pid, 0)
+        except ChildProcessError:
+            pass
+    return killed
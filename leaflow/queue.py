@@ -0,0 +1,394 @@
+"""
+账号队列：本机的重试队列，以及多个进程/主机共享的租约队列和它的HTTP协调器
+"""
+
+import os
+import json
+import time
+import socket
+import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+from .store import CheckinLedger
+
+logger = logging.getLogger(__name__)
+
+class RetryQueue:
+    """待处理账号队列，可重试的失败账号带着退避时间重新排到队尾，等待期间先处理其他账号"""
+    
+    def __init__(self, accounts):
+        # (序号, 账号, 第几次尝试, 最早可开始的时间)
+        self._items = deque((index, account, 1, 0.0) for index, account in enumerate(accounts))
+        self._unfinished = len(self._items)
+        self._cond = threading.Condition()
+    
+    def get(self):
+        """取出下一个可以开始的账号 (序号, 账号, 第几次尝试)，所有账号都完成时返回None"""
+        with self._cond:
+            while self._unfinished:
+                now = time.monotonic()
+                for item in self._items:
+                    if item[3] <= now:
+                        self._items.remove(item)
+                        return item[:3]
+                # 队列中只剩退避中的账号，或其他线程的账号还可能被重新排队
+                wait = min((item[3] for item in self._items), default=now + 1) - now
+                self._cond.wait(timeout=max(0.05, wait))
+            return None
+    
+    def requeue(self, index, account, attempt, delay):
+        with self._cond:
+            self._items.append((index, account, attempt, time.monotonic() + delay))
+            self._cond.notify_all()
+    
+    def done(self, result=None):
+        """一个账号得到最终结果"""
+        with self._cond:
+            self._unfinished -= 1
+            self._cond.notify_all()
+    
+    def has_waiting(self):
+        with self._cond:
+            return bool(self._items)
+    
+    def finished(self):
+        with self._cond:
+            return not self._unfinished
+
+def queue_result(result):
+    """结果元组 (邮箱, 成功, 消息, 余额) 转换为写入共享队列的内容（不含邮箱）"""
+    return {'success': result[1], 'message': result[2], 'balance': result[3]}
+
+class LeaseQueue:
+    """多个进程/主机共享的签到队列（SQLite文件），账号以限时租约的方式被领取
+    
+    所有节点使用同一份账号列表，队列中只保存邮箱的SHA-256、状态和结果，不保存密码。
+    持有租约的节点定期续约；节点崩溃后租约过期，账号会被其他节点重新领取。
+    同一主机的多个进程可以直接共享文件，跨主机时建议用 queue-server 提供的HTTP协调器。
+    """
+    
+    METHODS = ('seed', 'lease', 'renew', 'complete', 'release', 'state', 'results', 'claim_summary')
+    
+    def __init__(self, path):
+        import sqlite3
+        
+        self.path = path
+        self._lock = threading.Lock()
+        # 不使用WAL：共享存储上的多个主机无法共享WAL所需的共享内存
+        self.conn = sqlite3.connect(path, timeout=60, isolation_level=None, check_same_thread=False)
+        self.conn.executescript(
+            "CREATE TABLE IF NOT EXISTS leases ("
+            " run_id TEXT NOT NULL,"
+            " account TEXT NOT NULL,"
+            " position INTEGER NOT NULL,"
+            " status TEXT NOT NULL,"
+            " owner TEXT,"
+            " expires REAL NOT NULL DEFAULT 0,"
+            " result TEXT,"
+            " PRIMARY KEY (run_id, account));"
+            "CREATE INDEX IF NOT EXISTS leases_status ON leases (run_id, status, position);"
+            "CREATE TABLE IF NOT EXISTS queue_runs ("
+            " run_id TEXT PRIMARY KEY,"
+            " summary_owner TEXT NOT NULL,"
+            " claimed_at REAL NOT NULL DEFAULT 0);"
+        )
+    
+    @classmethod
+    def from_env(cls):
+        """根据 LEAFLOW_QUEUE 打开共享队列：SQLite文件路径或 http(s):// 协调器地址，未设置时返回None"""
+        target = os.getenv('LEAFLOW_QUEUE', '').strip()
+        if not target:
+            return None
+        if target.startswith(('http://', 'https://')):
+            return HttpLeaseQueue(target, os.getenv('LEAFLOW_QUEUE_TOKEN', ''))
+        return cls(target)
+    
+    @contextmanager
+    def transaction(self):
+        """BEGIN IMMEDIATE 在读取前就取得写锁，多个节点不会领取到同一个账号"""
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self.conn
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+    
+    def seed(self, run_id, accounts):
+        """把账号按顺序加入队列，已存在的账号保持原状态，因此每个节点都可以重复调用"""
+        with self.transaction() as conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO leases (run_id, account, position, status) VALUES (?, ?, ?, 'pending')",
+                [(run_id, account, position) for position, account in enumerate(accounts)]
+            )
+    
+    def lease(self, run_id, owner, seconds, exclude=()):
+        """领取下一个待处理或租约已过期的账号，返回账号哈希，没有可领取的账号时返回None"""
+        now = time.time()
+        exclude = list(exclude)
+        with self.transaction() as conn:
+            row = conn.execute(
+                "SELECT account FROM leases WHERE run_id = ?"
+                " AND (status = 'pending' OR (status = 'leased' AND expires < ?))"
+                f" AND account NOT IN ({', '.join('?' * len(exclude))})"
+                " ORDER BY position LIMIT 1",
+                (run_id, now, *exclude)
+            ).fetchone()
+            if not row:
+                return None
+            conn.execute(
+                "UPDATE leases SET status = 'leased', owner = ?, expires = ? WHERE run_id = ? AND account = ?",
+                (owner, now + seconds, run_id, row[0])
+            )
+        return row[0]
+    
+    def renew(self, run_id, owner, accounts, seconds):
+        """延长本节点持有的租约"""
+        with self.transaction() as conn:
+            conn.executemany(
+                "UPDATE leases SET expires = ? WHERE run_id = ? AND account = ? AND owner = ? AND status = 'leased'",
+                [(time.time() + seconds, run_id, account, owner) for account in accounts]
+            )
+    
+    def complete(self, run_id, owner, account, result):
+        """写入账号的最终结果；已由其他节点完成的账号保持不变，本节点完成的账号可以更新结果"""
+        with self.transaction() as conn:
+            conn.execute(
+                "UPDATE leases SET status = 'done', owner = ?, result = ? WHERE run_id = ? AND account = ?"
+                " AND (status != 'done' OR owner = ?)",
+                (owner, json.dumps(result, ensure_ascii=False), run_id, account, owner)
+            )
+    
+    def release(self, run_id, owner, account):
+        """放弃本节点持有的租约，账号立即可以被其他节点领取"""
+        with self.transaction() as conn:
+            conn.execute(
+                "UPDATE leases SET status = 'pending', owner = NULL, expires = 0"
+                " WHERE run_id = ? AND account = ? AND owner = ? AND status = 'leased'",
+                (run_id, account, owner)
+            )
+    
+    def state(self, run_id):
+        """队列状态: {'pending': 数量, 'leased': 数量, 'done': 数量, 'next_expiry': 最早过期的租约剩余秒数}"""
+        with self._lock:
+            counts = dict(self.conn.execute(
+                "SELECT status, COUNT(*) FROM leases WHERE run_id = ? GROUP BY status", (run_id,)
+            ).fetchall())
+            expires = self.conn.execute(
+                "SELECT MIN(expires) FROM leases WHERE run_id = ? AND status = 'leased'", (run_id,)
+            ).fetchone()[0]
+        state = {status: counts.get(status, 0) for status in ('pending', 'leased', 'done')}
+        state['next_expiry'] = None if expires is None else max(0.0, expires - time.time())
+        return state
+    
+    def results(self, run_id):
+        """所有已完成账号的结果: {账号哈希: 结果}"""
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT account, result FROM leases WHERE run_id = ? AND status = 'done'", (run_id,)
+            ).fetchall()
+        return {account: json.loads(result) for account, result in rows}
+    
+    def claim_summary(self, run_id, owner, started=0):
+        """第一个调用的节点负责发送汇总通知，返回本节点是否取得了该职责
+        
+        started 为节点开始运行的时间。同一天重新运行时 run_id 不变，在上次认领之后才开始的节点属于新一轮运行，
+        可以接手汇总通知；与认领者同时运行的节点仍然不会重复发送。
+        """
+        with self.transaction() as conn:
+            row = conn.execute("SELECT summary_owner, claimed_at FROM queue_runs WHERE run_id = ?", (run_id,)).fetchone()
+            if row is None or (row[0] != owner and started > row[1]):
+                conn.execute("INSERT OR REPLACE INTO queue_runs VALUES (?, ?, ?)", (run_id, owner, time.time()))
+                return True
+        return row[0] == owner
+    
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+class HttpLeaseQueue:
+    """通过 queue-server 协调器访问共享队列，接口与 LeaseQueue 相同"""
+    
+    def __init__(self, url, token=''):
+        import requests
+        
+        self.url = url.rstrip('/')
+        self.session = requests.Session()
+        if token:
+            self.session.headers['Authorization'] = f'Bearer {token}'
+    
+    def call(self, method, **params):
+        import requests
+        
+        # 协调器短暂不可用（连接失败或5xx）时重试几次，租约过期前恢复即可；4xx 说明请求本身有误，不重试
+        for attempt in range(5):
+            try:
+                response = self.session.post(f"{self.url}/{method}", json=params, timeout=30)
+                error = None if response.status_code < 500 else f"HTTP {response.status_code}"
+            except requests.RequestException as e:
+                if attempt == 4:
+                    raise
+                error = e
+            if error and attempt < 4:
+                logger.warning(f"访问队列协调器失败，稍后重试: {error}")
+                time.sleep(2 ** attempt)
+                continue
+            response.raise_for_status()
+            return response.json()['result']
+    
+    def seed(self, run_id, accounts):
+        return self.call('seed', run_id=run_id, accounts=list(accounts))
+    
+    def lease(self, run_id, owner, seconds, exclude=()):
+        return self.call('lease', run_id=run_id, owner=owner, seconds=seconds, exclude=list(exclude))
+    
+    def renew(self, run_id, owner, accounts, seconds):
+        return self.call('renew', run_id=run_id, owner=owner, accounts=list(accounts), seconds=seconds)
+    
+    def complete(self, run_id, owner, account, result):
+        return self.call('complete', run_id=run_id, owner=owner, account=account, result=result)
+    
+    def release(self, run_id, owner, account):
+        return self.call('release', run_id=run_id, owner=owner, account=account)
+    
+    def state(self, run_id):
+        return self.call('state', run_id=run_id)
+    
+    def results(self, run_id):
+        return self.call('results', run_id=run_id)
+    
+    def claim_summary(self, run_id, owner, started=0):
+        return self.call('claim_summary', run_id=run_id, owner=owner, started=started)
+    
+    def close(self):
+        self.session.close()
+
+class LeasedRetryQueue(RetryQueue):
+    """从共享队列按需领取账号的 RetryQueue，失败重试仍在本节点排队，期间后台线程持续续约"""
+    
+    # 没有可领取的账号、但其他节点仍持有租约时的轮询间隔
+    POLL_SECONDS = 5
+    
+    def __init__(self, accounts, queue, run_id, lease_seconds):
+        super().__init__([])
+        self.queue = queue
+        self.run_id = run_id
+        self.lease_seconds = lease_seconds
+        self.owner = f"{socket.gethostname()}-{os.getpid()}"
+        self.started = time.time()
+        self._accounts = {CheckinLedger.account_key(account['email']): (index, account) for index, account in enumerate(accounts)}
+        self._held = set()
+        # 本节点账号列表中没有的账号（节点配置不一致），不再领取
+        self._foreign = set()
+        self._drained = False
+        self._stop = threading.Event()
+        threading.Thread(target=self._renew, name='lease-renew', daemon=True).start()
+    
+    def _renew(self):
+        while not self._stop.wait(self.lease_seconds / 3):
+            with self._cond:
+                held = list(self._held)
+            if held:
+                try:
+                    self.queue.renew(self.run_id, self.owner, held, self.lease_seconds)
+                except Exception as e:
+                    logger.warning(f"续约失败: {e}")
+    
+    def _ready_item(self):
+        now = time.monotonic()
+        for item in self._items:
+            if item[3] <= now:
+                self._items.remove(item)
+                return item[:3]
+        return None
+    
+    def get(self):
+        """优先返回本节点到期的重试，否则从共享队列领取；队列中所有账号都完成后返回None"""
+        while True:
+            with self._cond:
+                item = self._ready_item()
+                if item or self._drained:
+                    return item
+            
+            key = self.queue.lease(self.run_id, self.owner, self.lease_seconds, self._foreign)
+            if key and key not in self._accounts:
+                logger.warning("领取到本节点账号列表中没有的账号，已放回队列，请确认各节点使用相同的账号配置")
+                self._foreign.add(key)
+                self.queue.release(self.run_id, self.owner, key)
+                continue
+            if key:
+                index, account = self._accounts[key]
+                with self._cond:
+                    self._held.add(key)
+                    self._unfinished += 1
+                return index, account, 1
+            
+            # 没有可领取的账号：本节点还有未完成的账号，或其他节点的租约尚未结束（可能过期后由本节点接手）
+            state = self.queue.state(self.run_id)
+            with self._cond:
+                if not self._unfinished and not self._items and not state['pending'] and not state['leased']:
+                    self._drained = True
+                    self._stop.set()
+                    self._cond.notify_all()
+                    return None
+                wait = min(self.POLL_SECONDS, state['next_expiry'] + 0.1) if state['next_expiry'] is not None else self.POLL_SECONDS
+                if self._items:
+                    wait = min(wait, max(0.05, min(item[3] for item in self._items) - time.monotonic()))
+                self._cond.wait(timeout=wait)
+    
+    def done(self, result=None):
+        if result:
+            key = CheckinLedger.account_key(result[0])
+            self.queue.complete(self.run_id, self.owner, key, queue_result(result))
+            with self._cond:
+                self._held.discard(key)
+        super().done()
+    
+    def has_waiting(self):
+        with self._cond:
+            return bool(self._items) or not self._drained
+    
+    def finished(self):
+        with self._cond:
+            return self._drained and not self._unfinished
+
+def make_queue_server(queue, address, token=''):
+    """创建共享队列的HTTP协调器（尚未开始服务），所有请求都是 POST /<方法>，参数和结果为JSON
+    
+    设置了 token 时要求请求带有 Authorization: Bearer <token>。
+    """
+    from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+    
+    class QueueHandler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+        
+        def reply(self, status, payload):
+            body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        
+        def do_POST(self):
+            if token and self.headers.get('Authorization') != f'Bearer {token}':
+                return self.reply(401, {'error': 'unauthorized'})
+            method = urlparse(self.path).path.strip('/')
+            if method not in LeaseQueue.METHODS:
+                return self.reply(404, {'error': 'not found'})
+            try:
+                length = int(self.headers.get('Content-Length') or 0)
+                params = json.loads(self.rfile.read(length) or b'{}')
+                self.reply(200, {'result': getattr(queue, method)(**params)})
+            except (TypeError, ValueError) as e:
+                self.reply(400, {'error': str(e)})
+    
+    host, _, port = address.rpartition(':')
+    server = ThreadingHTTPServer((host or '127.0.0.1', int(port)), QueueHandler)
+    server.daemon_threads = True
+    return server
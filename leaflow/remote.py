@@ -0,0 +1,238 @@
+"""
+远程WebDriver端点池：把浏览器会话分派到多个chromedriver或Selenium Grid端点
+"""
+
+import os
+import time
+import logging
+import threading
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+class RemoteWebDriverPool:
+    """远程WebDriver端点池（LEAFLOW_REMOTE_WEBDRIVERS），为每个新浏览器挑选端点
+    
+    端点可以是chromedriver或Selenium Grid/standalone，每个端点同时运行的会话数不超过其槽位数。
+    挑选时只考虑健康且有空闲槽位的端点，按负载比例乘以观测到的延迟（健康检查往返加会话创建耗时）取最小者；
+    所有槽位都在使用时等待其他浏览器退出。连续失败的端点暂停使用，冷却后经健康检查恢复。
+    """
+    
+    HEALTH_INTERVAL = 30
+    HEALTH_TIMEOUT = 5
+    MAX_FAILURES = 2
+    COOLDOWN = 60
+    # 延迟的指数移动平均中新观测值的权重
+    LATENCY_WEIGHT = 0.3
+    
+    _shared = None
+    _shared_lock = threading.Lock()
+    
+    def __init__(self, endpoints, wait_timeout=300):
+        self.wait_timeout = wait_timeout
+        self.endpoints = []
+        for url, slots in endpoints:
+            parsed = urlparse(url)
+            self.endpoints.append({
+                'url': url,
+                # 日志和状态接口中显示的名称，不含地址中的认证信息
+                'name': f"{parsed.hostname}:{parsed.port or 80}{parsed.path}",
+                'slots': slots, 'in_use': 0, 'healthy': False, 'checking': False, 'checked_at': 0.0,
+                'failures': 0, 'down_until': 0.0, 'latency': None, 'startup': None, 'sessions': 0, 'errors': 0
+            })
+        self._cond = threading.Condition()
+    
+    @staticmethod
+    def parse(value):
+        """解析逗号分隔的 “地址[*槽位数]” 列表，槽位数默认为1"""
+        endpoints = []
+        for item in value.split(','):
+            item = item.strip()
+            if not item:
+                continue
+            url, _, slots = item.partition('*')
+            url = url.strip().rstrip('/')
+            parsed = urlparse(url)
+            if parsed.scheme not in ('http', 'https') or not parsed.hostname:
+                raise ValueError(f"远程WebDriver地址无效: {item}")
+            try:
+                slots = int(slots) if slots.strip() else 1
+            except ValueError:
+                raise ValueError(f"远程WebDriver槽位数无效: {item}")
+            if slots < 1:
+                raise ValueError(f"远程WebDriver槽位数无效: {item}")
+            endpoints.append((url, slots))
+        return endpoints
+    
+    @classmethod
+    def shared(cls):
+        """进程内共享的端点池，未配置 LEAFLOW_REMOTE_WEBDRIVERS 时返回None"""
+        with cls._shared_lock:
+            if cls._shared is None:
+                value = os.getenv('LEAFLOW_REMOTE_WEBDRIVERS', '').strip()
+                wait_timeout = float(os.getenv('LEAFLOW_REMOTE_WAIT', '300') or 300)
+                cls._shared = cls(cls.parse(value), wait_timeout) if value else False
+            return cls._shared or None
+    
+    @property
+    def capacity(self):
+        return sum(endpoint['slots'] for endpoint in self.endpoints)
+    
+    def _observe(self, endpoint, key, seconds):
+        previous = endpoint[key]
+        endpoint[key] = seconds if previous is None else previous + self.LATENCY_WEIGHT * (seconds - previous)
+    
+    def _fail(self, endpoint, reason):
+        endpoint['failures'] += 1
+        endpoint['errors'] += 1
+        if endpoint['failures'] >= self.MAX_FAILURES and endpoint['healthy']:
+            endpoint['healthy'] = False
+            endpoint['down_until'] = time.monotonic() + self.COOLDOWN
+            logger.warning(
+                f"远程WebDriver {endpoint['name']} 连续失败 {endpoint['failures']} 次（{reason}），"
+                f"暂停使用 {self.COOLDOWN} 秒"
+            )
+    
+    def check(self, endpoint):
+        """请求端点的 /status，更新健康状态和延迟"""
+        import requests
+        
+        start = time.perf_counter()
+        try:
+            response = requests.get(f"{endpoint['url']}/status", timeout=self.HEALTH_TIMEOUT)
+            ready = response.ok and response.json().get('value', {}).get('ready', True)
+            reason = f"状态 {response.status_code}" if not response.ok else "端点未就绪"
+        except (requests.RequestException, ValueError, AttributeError) as e:
+            ready, reason = False, str(e)
+        
+        with self._cond:
+            endpoint['checking'] = False
+            endpoint['checked_at'] = time.monotonic()
+            if ready:
+                if not endpoint['healthy'] and endpoint['errors']:
+                    logger.info(f"远程WebDriver {endpoint['name']} 已恢复")
+                endpoint['healthy'] = True
+                endpoint['failures'] = 0
+                endpoint['down_until'] = 0.0
+                self._observe(endpoint, 'latency', time.perf_counter() - start)
+            else:
+                # 健康检查失败立即移出轮换
+                endpoint['failures'] = max(endpoint['failures'], self.MAX_FAILURES - 1)
+                self._fail(endpoint, f"健康检查失败: {reason}")
+                if not endpoint['down_until']:
+                    endpoint['down_until'] = time.monotonic() + self.COOLDOWN
+            self._cond.notify_all()
+    
+    def _refresh(self, now):
+        """在后台检查到期的端点：健康端点定期复查，暂停的端点冷却结束后复查，调用时需持有锁"""
+        for endpoint in self.endpoints:
+            if endpoint['checking']:
+                continue
+            if endpoint['healthy']:
+                due = now - endpoint['checked_at'] >= self.HEALTH_INTERVAL
+            else:
+                due = now >= endpoint['down_until']
+            if due:
+                endpoint['checking'] = True
+                threading.Thread(target=self.check, args=(endpoint,), name='remote-health', daemon=True).start()
+    
+    def _score(self, endpoint):
+        latency = (endpoint['latency'] or 0) + (endpoint['startup'] or 0)
+        return latency * (endpoint['in_use'] + 1) / endpoint['slots']
+    
+    def acquire(self, exclude=()):
+        """选出一个端点并占用其一个槽位，没有空闲槽位时等待，超过 LEAFLOW_REMOTE_WAIT 秒仍无可用端点时抛出异常"""
+        deadline = time.monotonic() + self.wait_timeout
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                self._refresh(now)
+                candidates = [
+                    endpoint for endpoint in self.endpoints
+                    if endpoint['healthy'] and endpoint['in_use'] < endpoint['slots'] and endpoint['url'] not in exclude
+                ]
+                if candidates:
+                    endpoint = min(candidates, key=self._score)
+                    endpoint['in_use'] += 1
+                    return endpoint
+                if now >= deadline:
+                    from selenium.common.exceptions import SessionNotCreatedException
+                    
+                    raise SessionNotCreatedException(f"{self.wait_timeout:.0f} 秒内没有可用的远程WebDriver端点")
+                self._cond.wait(min(1.0, deadline - now))
+    
+    def record(self, endpoint, seconds=None, error=None):
+        """记录一次会话创建的耗时或失败"""
+        with self._cond:
+            if error is not None:
+                self._fail(endpoint, f"创建会话失败: {error}")
+            else:
+                endpoint['failures'] = 0
+                endpoint['sessions'] += 1
+                self._observe(endpoint, 'startup', seconds)
+    
+    def release(self, endpoint):
+        """浏览器会话结束后归还槽位"""
+        with self._cond:
+            endpoint['in_use'] -= 1
+            self._cond.notify_all()
+    
+    def stats(self):
+        with self._cond:
+            return [{
+                'endpoint': endpoint['name'],
+                'slots': endpoint['slots'],
+                'in_use': endpoint['in_use'],
+                'healthy': endpoint['healthy'],
+                'latency_ms': None if endpoint['latency'] is None else round(endpoint['latency'] * 1000, 1),
+                'startup_seconds': None if endpoint['startup'] is None else round(endpoint['startup'], 2),
+                'sessions': endpoint['sessions'],
+                'errors': endpoint['errors']
+            } for endpoint in self.endpoints]
+
+_remote_driver_class = None
+
+def remote_driver_class():
+    """支持 execute_cdp_cmd 的远程Chrome驱动类，chromedriver 和 Selenium Grid 都会转发DevTools命令"""
+    global _remote_driver_class
+    if _remote_driver_class is None:
+        from selenium import webdriver
+        
+        class RemoteChromeDriver(webdriver.Remote):
+            def execute_cdp_cmd(self, cmd, cmd_args):
+                return self.execute('executeCdpCommand', {'cmd': cmd, 'params': cmd_args})['value']
+        
+        _remote_driver_class = RemoteChromeDriver
+    return _remote_driver_class
+
+def launch_remote_driver(pool, options):
+    """用给定的Chrome选项在端点池挑选的远程WebDriver上创建会话，创建失败时换一个端点重试"""
+    from selenium.webdriver.chromium.remote_connection import ChromiumRemoteConnection
+    
+    tried = []
+    while True:
+        endpoint = pool.acquire(exclude=tried)
+        start = time.perf_counter()
+        try:
+            connection = ChromiumRemoteConnection(endpoint['url'], 'goog', 'chrome')
+            driver = remote_driver_class()(command_executor=connection, options=options)
+        except Exception as e:
+            pool.record(endpoint, error=e)
+            pool.release(endpoint)
+            tried.append(endpoint['url'])
+            if len(tried) >= len(pool.endpoints):
+                raise
+            logger.warning(f"远程WebDriver {endpoint['name']} 创建会话失败，换一个端点: {e}")
+            continue
+        pool.record(endpoint, seconds=time.perf_counter() - start)
+        driver._leaflow_remote = (pool, endpoint)
+        logger.info(f"使用远程WebDriver {endpoint['name']}")
+        return driver
+
+def release_remote_endpoint(driver):
+    """远程会话结束后归还端点槽位"""
+    remote = getattr(driver, '_leaflow_remote', None)
+    if remote:
+        driver._leaflow_remote = None
+        pool, endpoint = remote
+        pool.release(endpoint)
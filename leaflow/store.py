@@ -0,0 +1,319 @@
+"""
+签到账本和历史记录（SQLite），账号只以邮箱哈希和脱敏后的名称保存
+"""
+
+import os
+import time
+import hashlib
+import logging
+import threading
+from datetime import datetime, timedelta, timezone
+
+logger = logging.getLogger(__name__)
+
+def mask_email(email):
+    """隐藏邮箱部分字符以保护隐私"""
+    return email[:3] + "***" + email[email.find("@"):]
+
+def percentile(values, fraction):
+    """已排序列表的近似分位数，空列表返回None"""
+    if not values:
+        return None
+    index = min(len(values) - 1, max(0, round(fraction * (len(values) - 1))))
+    return values[index]
+
+class CheckinLedger:
+    """按天记录每个账号的签到结果（SQLite），重新运行时跳过今天已经完成的账号
+    
+    账号开始处理和结束时都会立即写入，进程中途被终止后再次运行只会处理未完成的账号。
+    账号以邮箱哈希记录，不保存明文邮箱。
+    """
+    
+    DONE_STATUSES = ('success', 'already_checked_in')
+    # Leaflow 按北京时间零点重置签到
+    TIMEZONE = timezone(timedelta(hours=8))
+    
+    def __init__(self, path):
+        import sqlite3
+        
+        self.path = path
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS checkins ("
+            " day TEXT NOT NULL,"
+            " account TEXT NOT NULL,"
+            " status TEXT NOT NULL,"
+            " message TEXT,"
+            " failure_class TEXT,"
+            " balance TEXT,"
+            " updated_at REAL NOT NULL,"
+            " PRIMARY KEY (day, account))"
+        )
+    
+    @classmethod
+    def from_env(cls):
+        """根据 LEAFLOW_LEDGER_DB 打开账本，设置为 off 时不启用"""
+        path = os.getenv('LEAFLOW_LEDGER_DB', '.leaflow_ledger.db').strip()
+        if not path or path.lower() in ('0', 'off', 'false', 'no'):
+            return None
+        try:
+            return cls(path)
+        except Exception as e:
+            logger.warning(f"无法打开签到账本 {path}，本次不跳过已完成账号: {e}")
+            return None
+    
+    @classmethod
+    def today(cls):
+        return datetime.now(cls.TIMEZONE).strftime('%Y-%m-%d')
+    
+    @staticmethod
+    def account_key(email):
+        return hashlib.sha256(email.strip().lower().encode('utf-8')).hexdigest()
+    
+    def completed(self, emails):
+        """返回今天已完成的账号: {邮箱: (状态, 结果消息, 余额)}"""
+        keys = {self.account_key(email): email for email in emails}
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT account, status, message, balance FROM checkins WHERE day = ? AND status IN (?, ?)",
+                (self.today(), *self.DONE_STATUSES)
+            ).fetchall()
+        return {keys[account]: (status, message, balance) for account, status, message, balance in rows if account in keys}
+    
+    def day_results(self):
+        """返回今天所有账号的最新状态: {账号哈希: (状态, 结果消息, 失败类型, 余额, 更新时间)}"""
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT account, status, message, failure_class, balance, updated_at FROM checkins WHERE day = ?",
+                (self.today(),)
+            ).fetchall()
+        return {row[0]: row[1:] for row in rows}
+    
+    def record(self, email, status, message=None, failure_class=None, balance=None):
+        """写入账号今天的最新状态，running 表示正在处理"""
+        try:
+            with self._lock:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO checkins VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (self.today(), self.account_key(email), status, message, failure_class, balance, time.time())
+                )
+        except Exception as e:
+            logger.warning(f"写入签到账本失败: {e}")
+    
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+class HistoryStore:
+    """历史签到结果（SQLite），每次运行为每个账号追加一行，用于趋势和报表查询
+    
+    账号只保存邮箱的SHA-256和脱敏后的显示名，余额以数字保存，耗时以整数毫秒按阶段分列保存。
+    结果表按 (账号, 日期) 聚簇，报表只需顺序扫描一遍。
+    """
+    
+    # 单独成列保存的账号级阶段（见 LeaflowAutoCheckin.run），其他阶段只计入总耗时
+    PHASES = ('driver_startup', 'session_check', 'login', 'http_checkin', 'checkin_page_load',
+              'button_click', 'result_extraction', 'balance')
+    
+    def __init__(self, path):
+        import sqlite3
+        
+        self.path = path
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        phase_columns = ''.join(f" {name}_ms INTEGER," for name in self.PHASES)
+        self.conn.executescript(
+            "CREATE TABLE IF NOT EXISTS accounts ("
+            " id INTEGER PRIMARY KEY,"
+            " key TEXT NOT NULL UNIQUE,"
+            " label TEXT NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS results ("
+            " account_id INTEGER NOT NULL,"
+            " day TEXT NOT NULL,"
+            " run_id TEXT NOT NULL,"
+            " success INTEGER NOT NULL,"
+            " failure_class TEXT,"
+            " balance REAL,"
+            " attempts INTEGER NOT NULL,"
+            " total_ms INTEGER,"
+            f"{phase_columns}"
+            " PRIMARY KEY (account_id, day, run_id)) WITHOUT ROWID;"
+        )
+    
+    @classmethod
+    def from_env(cls):
+        """根据 LEAFLOW_HISTORY_DB 打开历史库，设置为 off 时不启用"""
+        path = os.getenv('LEAFLOW_HISTORY_DB', '.leaflow_history.db').strip()
+        if not path or path.lower() in ('0', 'off', 'false', 'no'):
+            return None
+        try:
+            return cls(path)
+        except Exception as e:
+            logger.warning(f"无法打开历史记录库 {path}，本次结果不写入历史: {e}")
+            return None
+    
+    def account_ids(self, emails):
+        """返回 {邮箱: 账号id}，不存在的账号先写入"""
+        keys = {CheckinLedger.account_key(email): email for email in emails}
+        self.conn.executemany(
+            "INSERT OR IGNORE INTO accounts (key, label) VALUES (?, ?)",
+            [(key, mask_email(email)) for key, email in keys.items()]
+        )
+        return {keys[key]: account_id for key, account_id in self.conn.execute("SELECT key, id FROM accounts") if key in keys}
+    
+    def append(self, run_id, rows):
+        """在一个事务中追加一次运行的结果，rows 为 (邮箱, 成功, 失败类型, 余额数字, 尝试次数, 指标记录)"""
+        if not rows:
+            return
+        
+        def ms(seconds):
+            return None if seconds is None else round(seconds * 1000)
+        
+        day = CheckinLedger.today()
+        placeholders = ', '.join('?' * (8 + len(self.PHASES)))
+        try:
+            with self._lock:
+                self.conn.execute("BEGIN")
+                try:
+                    ids = self.account_ids(row[0] for row in rows)
+                    self.conn.executemany(
+                        f"INSERT OR REPLACE INTO results VALUES ({placeholders})",
+                        [
+                            (ids[email], day, run_id, int(success), failure_class, balance, attempts,
+                             ms(record['total_seconds']) if record else None,
+                             *(ms(record['phases'].get(name, {}).get('seconds')) if record else None for name in self.PHASES))
+                            for email, success, failure_class, balance, attempts, record in rows
+                        ]
+                    )
+                    self.conn.execute("COMMIT")
+                except Exception:
+                    self.conn.execute("ROLLBACK")
+                    raise
+        except Exception as e:
+            logger.warning(f"写入历史记录失败: {e}")
+    
+    def report(self, days=30, top=20):
+        """汇总最近 days 天的历史：成功率、失败类型、耗时分位数、连续成功天数和余额变化
+        
+        计数、连续天数和余额都在SQLite中聚合，Python只负责计算分位数和拼装结果。
+        """
+        since = (datetime.now(CheckinLedger.TIMEZONE) - timedelta(days=days - 1)).strftime('%Y-%m-%d')
+        timing_columns = ', '.join(['total_ms'] + [f"{name}_ms" for name in self.PHASES])
+        # 只有一个 MIN/MAX 聚合时，SQLite 的裸列取自该最小/最大行
+        balance_query = (
+            "SELECT account_id, balance, {}(day || run_id) FROM results"
+            " WHERE day >= ? AND balance IS NOT NULL GROUP BY account_id"
+        )
+        with self._lock:
+            labels = dict(self.conn.execute("SELECT id, label FROM accounts"))
+            runs, run_count, first_day, last_day = self.conn.execute(
+                "SELECT COUNT(*), COUNT(DISTINCT run_id), MIN(day), MAX(day) FROM results WHERE day >= ?", (since,)
+            ).fetchone()
+            failure_classes = self.conn.execute(
+                "SELECT COALESCE(failure_class, 'error'), COUNT(*) FROM results WHERE day >= ? AND NOT success"
+                " GROUP BY 1 ORDER BY 2 DESC", (since,)
+            ).fetchall()
+            per_account = self.conn.execute(
+                "SELECT account_id, COUNT(*), SUM(1 - success), SUM(attempts - 1) FROM results WHERE day >= ?"
+                " GROUP BY account_id", (since,)
+            ).fetchall()
+            # 连续成功天数：截至账号最近一次有记录的日期，逐日相连的成功日（当天任一次运行成功）数；
+            # 失败日（当天所有运行都失败）和没有运行的日期都会中断连续。成功日按日期减去序号分组，同组即日期相连
+            streaks = dict(self.conn.execute(
+                "WITH days AS ("
+                " SELECT account_id, day, MAX(success) AS ok FROM results WHERE day >= ? GROUP BY account_id, day),"
+                " last AS (SELECT account_id, MAX(day) AS day FROM days GROUP BY account_id),"
+                " runs AS ("
+                " SELECT account_id, day, julianday(day) - ROW_NUMBER() OVER (PARTITION BY account_id ORDER BY day) AS run"
+                " FROM days WHERE ok)"
+                " SELECT r.account_id, COUNT(*) FROM runs r"
+                " JOIN runs e ON e.account_id = r.account_id AND e.run = r.run"
+                " JOIN last l ON l.account_id = e.account_id AND l.day = e.day"
+                " GROUP BY r.account_id", (since,)
+            ))
+            first_balances = {row[0]: row[1] for row in self.conn.execute(balance_query.format('MIN'), (since,))}
+            last_balances = {row[0]: row[1] for row in self.conn.execute(balance_query.format('MAX'), (since,))}
+            timings = self.conn.execute(f"SELECT {timing_columns} FROM results WHERE day >= ?", (since,)).fetchall()
+        
+        def seconds(values, fraction):
+            value = percentile(values, fraction)
+            return None if value is None else round(value / 1000, 3)
+        
+        columns = {}
+        for name, values in zip(['total'] + list(self.PHASES), zip(*timings)):
+            columns[name] = sorted(value for value in values if value is not None)
+        
+        details = []
+        for account_id, count, failures, retries in per_account:
+            last = last_balances.get(account_id)
+            details.append({
+                'account': labels.get(account_id, str(account_id)),
+                'runs': count,
+                'failures': failures,
+                'failure_rate': round(failures / count, 4),
+                'retries': retries,
+                'streak_days': streaks.get(account_id, 0),
+                'balance': last,
+                'balance_delta': None if last is None else round(last - first_balances[account_id], 2)
+            })
+        details.sort(key=lambda item: (-item['failure_rate'], -item['failures'], item['account']))
+        
+        failures = sum(count for _, count in failure_classes)
+        return {
+            'since': since,
+            'first_day': first_day,
+            'last_day': last_day,
+            'runs': run_count,
+            'accounts': len(details),
+            'results': runs,
+            'success_rate': round(1 - failures / runs, 4) if runs else None,
+            'failure_classes': dict(failure_classes),
+            'seconds_p50': seconds(columns.get('total'), 0.5),
+            'seconds_p95': seconds(columns.get('total'), 0.95),
+            'phases': {
+                name: {'p50': seconds(values, 0.5), 'p95': seconds(values, 0.95)}
+                for name, values in columns.items() if name != 'total' and values
+            },
+            'balance_delta': round(sum(item['balance_delta'] or 0 for item in details), 2),
+            'top_failing': [item for item in details if item['failures']][:top],
+            'account_details': details
+        }
+    
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+def format_report(report, top=20):
+    """把 HistoryStore.report 的结果格式化为文本"""
+    if not report['results']:
+        return f"{report['since']} 以来没有历史记录"
+    
+    def seconds(value):
+        return '-' if value is None else f"{value:.1f}s"
+    
+    lines = [
+        f"📊 {report['first_day']} ~ {report['last_day']}：{report['runs']} 次运行，{report['accounts']} 个账号，"
+        f"{report['results']} 条结果",
+        f"成功率: {report['success_rate'] * 100:.1f}%",
+        f"单账号耗时: p50 {seconds(report['seconds_p50'])}，p95 {seconds(report['seconds_p95'])}",
+        f"余额合计变化: {report['balance_delta']:+.2f}元"
+    ]
+    if report['phases']:
+        lines.append("各阶段耗时:")
+        lines += [
+            f"  {name}: p50 {seconds(values['p50'])}，p95 {seconds(values['p95'])}"
+            for name, values in sorted(report['phases'].items())
+        ]
+    if report['failure_classes']:
+        lines.append("失败类型: " + '，'.join(f"{name} {count}" for name, count in report['failure_classes'].items()))
+    if report['top_failing']:
+        lines.append(f"失败最多的账号（前 {top} 个）:")
+        lines += [
+            f"  {item['account']}: 失败 {item['failures']}/{item['runs']}（{item['failure_rate'] * 100:.0f}%），"
+            f"重试 {item['retries']} 次，连续成功 {item['streak_days']} 天"
+            for item in report['top_failing']
+        ]
+    return '\n'.join(lines)
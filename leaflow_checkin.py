@@ -5,72 +5,1885 @@ Leaflow 多账号自动签到脚本
 变量值：邮箱1:密码1,邮箱2:密码2,邮箱3:密码3
 """
 
+import io
 import os
+import re
+import csv
+import sys
+import json
 import time
+import base64
+import shutil
+import signal
+import hashlib
 import logging
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.common.action_chains import ActionChains
-import requests
+import argparse
+import tempfile
+import threading
+from contextlib import contextmanager
 from datetime import datetime
+from html import escape
+from html.parser import HTMLParser
+from urllib.parse import urljoin, urlparse
+
+from leaflow.daemon import CheckinDaemon
+from leaflow.notify import TelegramNotifier
+from leaflow.process import (
+    OWNER_SWITCH, process_tree, process_rss, process_alive, kill_pids, kill_process_tree, reap_orphans,
+    record_owned_process, forget_owned_process
+)
+from leaflow.queue import RetryQueue, LeasedRetryQueue, LeaseQueue, queue_result, make_queue_server
+from leaflow.remote import RemoteWebDriverPool, launch_remote_driver, release_remote_endpoint
+from leaflow.store import CheckinLedger, HistoryStore, format_report, mask_email
 
 # 配置日志
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(threadName)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# 站点地址，可通过环境变量指向本地模拟站点用于测试和基准测试
+LEAFLOW_URL = os.getenv('LEAFLOW_BASE_URL', 'https://leaflow.net').rstrip('/')
+CHECKIN_URL = os.getenv('LEAFLOW_CHECKIN_URL', 'https://checkin.leaflow.net')
+
+# 共享磁盘缓存最多划分的槽位数，即最多同时使用缓存的浏览器数
+CACHE_MAX_SLOTS = 64
+
+# Selenium 和 requests 各需约0.1秒导入，第一次用到时才由 load_selenium() / load_requests() 导入到模块命名空间，
+# 不运行签到的命令和纯HTTP签到因此不必承担Selenium的导入开销
+webdriver = By = WebDriverWait = EC = Options = Service = ActionChains = None
+TimeoutException = StaleElementReferenceException = SessionNotCreatedException = None
+WebDriverException = InvalidSessionIdException = NoSuchElementException = NoSuchWindowException = None
+requests = urllib3 = None
+
+def load_selenium():
+    """导入Selenium，启动浏览器前调用"""
+    global webdriver, By, WebDriverWait, EC, Options, Service, ActionChains, urllib3
+    global TimeoutException, StaleElementReferenceException, SessionNotCreatedException
+    global WebDriverException, InvalidSessionIdException, NoSuchElementException, NoSuchWindowException
+    if webdriver is not None:
+        return
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support.ui import WebDriverWait
+    from selenium.webdriver.support import expected_conditions as EC
+    from selenium.webdriver.chrome.options import Options
+    from selenium.webdriver.chrome.service import Service
+    from selenium.webdriver.common.action_chains import ActionChains
+    from selenium.common.exceptions import (
+        TimeoutException, StaleElementReferenceException, SessionNotCreatedException,
+        WebDriverException, InvalidSessionIdException, NoSuchElementException, NoSuchWindowException
+    )
+    import urllib3
+    # 最后赋值 webdriver，其他线程看到它不为None时其余名称都已就绪
+    from selenium import webdriver
+
+def load_requests():
+    """导入requests，发起HTTP请求前调用"""
+    global requests, urllib3
+    if requests is not None:
+        return
+    import urllib3
+    import requests
+
+def is_site_cookie(domain):
+    """判断Cookie是否属于Leaflow站点（包括签到子域名）"""
+    domain = (domain or '').lstrip('.').lower()
+    for url in (LEAFLOW_URL, CHECKIN_URL):
+        host = (urlparse(url).hostname or '').lower()
+        if host == domain or host.endswith('.' + domain):
+            return True
+    return False
+
+# 隐藏自动化特征的脚本
+STEALTH_SCRIPT = "Object.defineProperty(navigator, 'webdriver', {get: () => undefined})"
+
+def build_chrome_options(cache_dir=None):
+    """构建Chrome启动参数，cache_dir 为分配给该浏览器的共享磁盘缓存目录"""
+    load_selenium()
+    chrome_options = Options()
+    
+    # GitHub Actions环境或显式要求时使用无头模式
+    if os.getenv('GITHUB_ACTIONS') or os.getenv('LEAFLOW_HEADLESS'):
+        chrome_options.add_argument('--headless')
+        chrome_options.add_argument('--no-sandbox')
+        chrome_options.add_argument('--disable-dev-shm-usage')
+        chrome_options.add_argument('--disable-gpu')
+        chrome_options.add_argument('--window-size=1920,1080')
+    
+    # 通用配置
+    chrome_options.add_argument('--disable-blink-features=AutomationControlled')
+    # 关闭首次运行向导和后台服务，加快启动
+    for argument in ('--no-first-run', '--no-default-browser-check', '--disable-extensions',
+                     '--disable-background-networking', '--disable-component-update',
+                     '--disable-default-apps', '--disable-sync'):
+        chrome_options.add_argument(argument)
+    chrome_options.add_experimental_option("excludeSwitches", ["enable-automation"])
+    chrome_options.add_experimental_option('useAutomationExtension', False)
+    # Chrome会忽略未知的开关，用它标记浏览器所属的脚本进程，便于之后清理遗留的浏览器
+    chrome_options.add_argument(f'{OWNER_SWITCH}={os.getpid()}')
+    
+    if lean_mode() and lean_allowlist():
+        # 配置了白名单时，除站点本身和白名单外的域名一律解析失败；未配置时只按URL拦截已知的重资源
+        rules = ', '.join(['MAP * ~NOTFOUND'] + [f'EXCLUDE {host}' for host in lean_allowed_hosts()])
+        chrome_options.add_argument(f'--host-resolver-rules={rules}')
+    if cache_dir:
+        chrome_options.add_argument(f'--disk-cache-dir={cache_dir}')
+    if lean_mode() or cache_dir_root() or os.getenv('LEAFLOW_NETWORK_STATS', '').lower() in ('1', 'true', 'yes'):
+        # 通过性能日志统计传输字节数、被拦截的请求和缓存命中
+        chrome_options.set_capability('goog:loggingPrefs', {'performance': 'ALL'})
+    return chrome_options
+
+def cache_dir_root():
+    """共享磁盘缓存根目录（LEAFLOW_CACHE_DIR），未设置时不启用"""
+    return os.getenv('LEAFLOW_CACHE_DIR', '').strip()
+
+def acquire_cache_dir():
+    """为新浏览器分配共享磁盘缓存目录，返回 (目录, 锁文件)，未启用时返回 (None, None)
+    
+    Chrome的磁盘缓存同一时间只能由一个浏览器进程使用，因此按槽位划分：同时运行的每个浏览器各锁定一个槽位，
+    浏览器退出后槽位连同已缓存的静态资源留给下一个浏览器，顺序处理时所有账号和之后的运行都复用同一份缓存。
+    文件锁同时覆盖本进程内的并发线程和同一台机器上的其他脚本进程。
+    """
+    root = cache_dir_root()
+    if not root:
+        return None, None
+    try:
+        import fcntl
+    except ImportError:
+        logger.warning("当前系统不支持文件锁，不使用共享磁盘缓存")
+        return None, None
+    
+    os.makedirs(root, exist_ok=True)
+    for slot in range(CACHE_MAX_SLOTS):
+        lock = open(os.path.join(root, f'slot-{slot}.lock'), 'w')
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock.close()
+            continue
+        return os.path.join(root, f'slot-{slot}'), lock
+    logger.warning(f"共享磁盘缓存的 {CACHE_MAX_SLOTS} 个槽位都在使用中，本浏览器不使用缓存")
+    return None, None
+
+def release_cache_dir(driver):
+    """浏览器进程退出后释放其缓存槽位"""
+    lock = getattr(driver, '_leaflow_cache_lock', None)
+    if lock:
+        driver._leaflow_cache_lock = None
+        lock.close()
+
+# chromedriver路径在进程内只解析一次，并缓存到磁盘供之后的运行复用
+_driver_paths = {}
+_driver_paths_lock = threading.Lock()
+
+def driver_cache_file():
+    return os.getenv('LEAFLOW_DRIVER_CACHE', os.path.join(tempfile.gettempdir(), 'leaflow_chromedriver.json'))
+
+def resolve_chromedriver(chrome_options, refresh=False):
+    """返回chromedriver路径，优先使用 CHROMEDRIVER_PATH、进程内缓存和磁盘缓存，最后才调用Selenium Manager"""
+    if os.getenv('CHROMEDRIVER_PATH'):
+        return os.getenv('CHROMEDRIVER_PATH')
+    
+    with _driver_paths_lock:
+        cached = None if refresh else _driver_paths.get('chrome')
+        if not cached and not refresh:
+            try:
+                with open(driver_cache_file(), 'r', encoding='utf-8') as f:
+                    cached = json.load(f)
+            except (OSError, ValueError):
+                cached = None
+        
+        if not cached or not os.path.exists(cached.get('driver_path', '')):
+            from selenium.webdriver.common.selenium_manager import SeleniumManager
+            
+            start = time.perf_counter()
+            driver_path = SeleniumManager().driver_location(chrome_options)
+            cached = {'driver_path': driver_path, 'browser_path': chrome_options.binary_location or ''}
+            logger.info(f"Selenium Manager 解析chromedriver耗时 {time.perf_counter() - start:.1f} 秒")
+            try:
+                with open(driver_cache_file(), 'w', encoding='utf-8') as f:
+                    json.dump(cached, f)
+            except OSError as e:
+                logger.debug(f"写入chromedriver路径缓存失败: {e}")
+        
+        _driver_paths['chrome'] = cached
+        if cached.get('browser_path') and not chrome_options.binary_location:
+            chrome_options.binary_location = cached['browser_path']
+        return cached['driver_path']
+
+# 不复制到预热配置目录中的内容：登录状态、浏览记录和各类缓存
+PROFILE_EXCLUDES = shutil.ignore_patterns(
+    'Cookies*', 'Local Storage', 'Session Storage', 'IndexedDB', 'Sessions', 'History*',
+    'Login Data*', 'Web Data*', 'Cache', 'Code Cache', 'GPUCache', 'Service Worker',
+    'Singleton*', 'DevToolsActivePort', 'lockfile', 'Crashpad'
+)
+
+def prepare_profile_dir():
+    """为新浏览器准备配置目录：有预热模板（LEAFLOW_PROFILE_DIR）时复制一份，否则返回None"""
+    template = os.getenv('LEAFLOW_PROFILE_DIR', '')
+    if not template:
+        return None
+    profile_dir = tempfile.mkdtemp(prefix='leaflow-profile-')
+    if os.path.isdir(template):
+        shutil.copytree(template, profile_dir, ignore=PROFILE_EXCLUDES, dirs_exist_ok=True)
+    return profile_dir
+
+def save_profile_template(profile_dir):
+    """模板不存在时，把首个浏览器完成初始化的配置目录保存为模板（不含Cookie和缓存）"""
+    template = os.getenv('LEAFLOW_PROFILE_DIR', '')
+    if not template or not profile_dir or os.path.isdir(template):
+        return
+    try:
+        tmp_template = f"{template}.tmp-{os.getpid()}"
+        shutil.copytree(profile_dir, tmp_template, ignore=PROFILE_EXCLUDES)
+        os.replace(tmp_template, template)
+        logger.info(f"已保存预热的浏览器配置模板: {template}")
+    except OSError as e:
+        logger.debug(f"保存浏览器配置模板失败: {e}")
+
+def launch_selenium_driver(profile_dir, cache_dir):
+    """通过chromedriver启动Chrome"""
+    chrome_options = build_chrome_options(cache_dir)
+    if profile_dir:
+        chrome_options.add_argument(f'--user-data-dir={profile_dir}')
+    
+    try:
+        return webdriver.Chrome(options=chrome_options, service=Service(resolve_chromedriver(chrome_options)))
+    except SessionNotCreatedException:
+        # 缓存的chromedriver可能与升级后的Chrome版本不匹配，重新解析后再试一次
+        logger.warning("chromedriver与浏览器版本不匹配，重新解析驱动路径")
+        chrome_options = build_chrome_options(cache_dir)
+        if profile_dir:
+            chrome_options.add_argument(f'--user-data-dir={profile_dir}')
+        return webdriver.Chrome(options=chrome_options, service=Service(resolve_chromedriver(chrome_options, refresh=True)))
+
+def create_chrome_driver():
+    """在远程WebDriver上或按 LEAFLOW_BACKEND 在本机启动Chrome并返回driver，记录启动耗时"""
+    start = time.perf_counter()
+    remote = RemoteWebDriverPool.shared()
+    if remote:
+        # 远程浏览器的配置目录和磁盘缓存都在远程机器上，不使用本机的预热模板和缓存目录
+        driver = launch_remote_driver(remote, build_chrome_options())
+        driver._leaflow_profile_dir = driver._leaflow_cache_lock = None
+        driver._leaflow_startup_seconds = time.perf_counter() - start
+        logger.info(f"远程浏览器会话创建耗时 {driver._leaflow_startup_seconds:.1f} 秒")
+        return driver
+    
+    profile_dir = prepare_profile_dir()
+    cache_dir, cache_lock = acquire_cache_dir()
+    try:
+        if browser_backend() == 'cdp':
+            # DevTools端口信息写在配置目录中，没有预热模板时也使用独立的临时目录
+            from leaflow.cdp import launch_cdp_driver
+            profile_dir = profile_dir or tempfile.mkdtemp(prefix='leaflow-profile-')
+            chrome_options = build_chrome_options(cache_dir)
+            driver = launch_cdp_driver(find_chrome_binary(chrome_options), chrome_options, profile_dir)
+        else:
+            driver = launch_selenium_driver(profile_dir, cache_dir)
+    except Exception:
+        if cache_lock:
+            cache_lock.close()
+        if profile_dir:
+            shutil.rmtree(profile_dir, ignore_errors=True)
+        raise
+    
+    record_owned_process(driver_pid(driver))
+    driver._leaflow_profile_dir = profile_dir
+    driver._leaflow_cache_lock = cache_lock
+    driver._leaflow_startup_seconds = time.perf_counter() - start
+    logger.info(f"浏览器启动耗时 {driver._leaflow_startup_seconds:.1f} 秒")
+    return driver
+
+def driver_pid(driver):
+    """chromedriver进程的PID，浏览器进程都是它的子孙进程"""
+    process = getattr(getattr(driver, 'service', None), 'process', None)
+    return process.pid if process else None
+
+def quit_driver(driver):
+    """退出浏览器并清理临时配置目录，正常退出后仍残留的进程会被强制结束"""
+    pid = driver_pid(driver)
+    pids = process_tree(pid) if pid else []
+    try:
+        driver.quit()
+    finally:
+        leaked = [p for p in pids if process_alive(p)]
+        if leaked:
+            logger.warning(f"浏览器退出后仍有 {len(leaked)} 个进程残留，强制结束")
+            kill_pids(leaked)
+        forget_owned_process(pid)
+        release_cache_dir(driver)
+        release_remote_endpoint(driver)
+        profile_dir = getattr(driver, '_leaflow_profile_dir', None)
+        if profile_dir:
+            save_profile_template(profile_dir)
+            shutil.rmtree(profile_dir, ignore_errors=True)
+
+def kill_driver(driver):
+    """不经过WebDriver直接结束chromedriver和浏览器的整个进程树，用于驱动卡死时
+    
+    远程浏览器没有本机进程，改为在后台删除其会话，卡住的命令会随之出错返回。
+    """
+    if getattr(driver, '_leaflow_remote', None):
+        def delete_session():
+            try:
+                driver.quit()
+            except Exception as e:
+                logger.debug(f"删除远程浏览器会话失败: {e}")
+            release_remote_endpoint(driver)
+        
+        threading.Thread(target=delete_session, name='remote-quit', daemon=True).start()
+        logger.warning("已在后台删除远程浏览器会话")
+        return
+    
+    pid = driver_pid(driver)
+    if pid:
+        killed = kill_process_tree(pid)
+        logger.warning(f"已强制结束浏览器进程树（{killed} 个进程）")
+        try:
+            driver.service.process.wait(timeout=5)
+        except Exception:
+            pass
+        forget_owned_process(pid)
+    release_cache_dir(driver)
+    profile_dir = getattr(driver, '_leaflow_profile_dir', None)
+    if profile_dir:
+        shutil.rmtree(profile_dir, ignore_errors=True)
+
+# 浏览器驱动后端：selenium 经 chromedriver 转发命令；cdp 直接通过 DevTools 协议控制 Chrome，省去每条命令的HTTP中转
+BROWSER_BACKENDS = ('selenium', 'cdp')
+
+def browser_backend():
+    """当前使用的浏览器驱动后端（LEAFLOW_BACKEND），默认 selenium"""
+    backend = os.getenv('LEAFLOW_BACKEND', 'selenium').strip().lower() or 'selenium'
+    return backend if backend in BROWSER_BACKENDS else 'selenium'
+
+def find_chrome_binary(chrome_options):
+    """Chrome可执行文件：CHROME_PATH、PATH中的常见名称，都没有时借助Selenium Manager（结果同样会缓存）"""
+    for candidate in (os.getenv('CHROME_PATH'), chrome_options.binary_location):
+        if candidate and os.path.exists(candidate):
+            return candidate
+    for name in ('google-chrome', 'google-chrome-stable', 'chromium', 'chromium-browser', 'chrome'):
+        path = shutil.which(name)
+        if path:
+            return path
+    resolve_chromedriver(chrome_options)
+    if chrome_options.binary_location:
+        return chrome_options.binary_location
+    raise SessionNotCreatedException("找不到Chrome可执行文件，请设置 CHROME_PATH")
+
+class BrowserLauncher:
+    """为单个工作线程启动浏览器，可在当前账号收尾时提前启动下一个账号的浏览器"""
+    
+    def __init__(self, has_pending=None):
+        self.has_pending = has_pending or (lambda: False)
+        self.enabled = os.getenv('LEAFLOW_PRELAUNCH', '').lower() in ('1', 'true', 'yes')
+        self._thread = None
+        self._driver = None
+        self._error = None
+    
+    def _launch(self):
+        try:
+            self._driver = create_chrome_driver()
+        except Exception as e:
+            self._error = e
+    
+    def prelaunch(self):
+        """还有待处理的账号时，在后台启动下一个浏览器"""
+        if not self.enabled or self._thread or not self.has_pending():
+            return
+        logger.info("后台预启动下一个浏览器...")
+        self._thread = threading.Thread(target=self._launch, name=f"{threading.current_thread().name}-prelaunch", daemon=True)
+        self._thread.start()
+    
+    def acquire(self):
+        """取得一个浏览器：优先使用预启动的实例，失败时重新启动"""
+        thread, self._thread = self._thread, None
+        if thread:
+            thread.join()
+            driver, error = self._driver, self._error
+            self._driver = self._error = None
+            if driver:
+                logger.info("使用预启动的浏览器")
+                return driver
+            logger.warning(f"预启动浏览器失败，重新启动: {error}")
+        return create_chrome_driver()
+    
+    def close(self):
+        """关闭未被使用的预启动浏览器"""
+        thread, self._thread = self._thread, None
+        if thread:
+            thread.join()
+            if self._driver:
+                quit_driver(self._driver)
+            self._driver = self._error = None
+
+# 精简模式下按URL拦截的资源：图片、字体、音视频，以及已知的统计和广告脚本，签到流程只需要页面DOM
+LEAN_BLOCKED_PATTERNS = [
+    '*.png', '*.jpg', '*.jpeg', '*.gif', '*.webp', '*.svg', '*.ico', '*.bmp', '*.avif',
+    '*.woff', '*.woff2', '*.ttf', '*.otf', '*.eot',
+    '*.mp4', '*.webm', '*.mp3', '*.ogg',
+    '*google-analytics.com/*', '*googletagmanager.com/*', '*doubleclick.net/*', '*googlesyndication.com/*',
+    '*googleadservices.com/*', '*connect.facebook.net/*', '*hotjar.com/*', '*clarity.ms/*',
+    '*hm.baidu.com/*', '*cnzz.com/*'
+]
+
+# 设置 LEAFLOW_LEAN_ALLOW_HOSTS 后按域名白名单拦截时默认放行的第三方域名（人机验证等签到流程可能依赖的服务）
+LEAN_DEFAULT_ALLOWED_HOSTS = [
+    'challenges.cloudflare.com',
+    '*.recaptcha.net', 'www.google.com', 'www.gstatic.com',
+    '*.hcaptcha.com', 'hcaptcha.com'
+]
+
+def lean_mode():
+    """是否启用精简模式（LEAFLOW_LEAN）"""
+    return os.getenv('LEAFLOW_LEAN', '').lower() in ('1', 'true', 'yes')
+
+def lean_allowlist():
+    """LEAFLOW_LEAN_ALLOW_HOSTS 中的域名，设置后精简模式只放行站点自身和这些域名"""
+    return [h.strip() for h in os.getenv('LEAFLOW_LEAN_ALLOW_HOSTS', '').split(',') if h.strip()]
+
+def lean_allowed_hosts():
+    """域名白名单模式下允许访问的域名：站点自身、本地地址、默认白名单及 LEAFLOW_LEAN_ALLOW_HOSTS"""
+    hosts = ['localhost']
+    for url in (LEAFLOW_URL, CHECKIN_URL):
+        host = urlparse(url).hostname
+        if host and host.replace('.', '').isdigit():
+            hosts.append(host)
+        elif host:
+            parts = host.split('.')
+            # 同时放行主域名下的所有子域名（如静态资源CDN子域名）
+            root = '.'.join(parts[-2:]) if len(parts) > 2 else host
+            hosts += [host, root, f'*.{root}']
+    hosts += LEAN_DEFAULT_ALLOWED_HOSTS
+    hosts += lean_allowlist()
+    return list(dict.fromkeys(hosts))
+
+def apply_resource_blocking(driver):
+    """精简模式下拦截当前页面目标中不需要的资源和已知的统计、广告脚本"""
+    if not lean_mode():
+        return
+    try:
+        driver.execute_cdp_cmd("Network.enable", {})
+        driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": LEAN_BLOCKED_PATTERNS})
+    except Exception as e:
+        logger.warning(f"设置资源拦截失败: {e}")
+
+# 统计缓存命中率的静态资源类型
+STATIC_RESOURCE_TYPES = ('Script', 'Stylesheet', 'Image', 'Font', 'Media')
+
+def collect_network_stats(driver):
+    """从性能日志中汇总自上次读取以来的传输字节数、被拦截的请求数和静态资源的磁盘缓存命中，未开启性能日志时返回None
+    
+    缓存节省的字节数按命中响应的 Content-Length 估算，即不使用缓存时需要传输的大小。
+    """
+    try:
+        entries = driver.get_log('performance')
+    except Exception:
+        return None
+    
+    stats = {'requests': 0, 'transferred_bytes': 0, 'blocked_requests': 0,
+             'static_requests': 0, 'cache_hits': 0, 'cache_saved_bytes': 0}
+    for entry in entries:
+        try:
+            message = json.loads(entry['message'])['message']
+        except (KeyError, ValueError):
+            continue
+        method = message.get('method')
+        params = message.get('params', {})
+        if method == 'Network.requestWillBeSent':
+            stats['requests'] += 1
+        elif method == 'Network.responseReceived' and params.get('type') in STATIC_RESOURCE_TYPES:
+            stats['static_requests'] += 1
+            response = params.get('response', {})
+            if response.get('fromDiskCache'):
+                stats['cache_hits'] += 1
+                headers = {name.lower(): value for name, value in (response.get('headers') or {}).items()}
+                try:
+                    stats['cache_saved_bytes'] += int(headers.get('content-length') or 0)
+                except ValueError:
+                    pass
+        elif method == 'Network.loadingFinished':
+            stats['transferred_bytes'] += int(params.get('encodedDataLength') or 0)
+        elif method == 'Network.loadingFailed':
+            if params.get('blockedReason') or 'ERR_NAME_NOT_RESOLVED' in params.get('errorText', ''):
+                stats['blocked_requests'] += 1
+    return stats
+
+# 统计未完成的 fetch/XHR 请求，用于判断页面网络是否空闲
+NETWORK_TRACKER_SCRIPT = """
+(() => {
+    if (window.__leaflowPending !== undefined) return;
+    window.__leaflowPending = 0;
+    window.__leaflowLastActivity = Date.now();
+    const start = () => { window.__leaflowPending++; window.__leaflowLastActivity = Date.now(); };
+    const done = () => { window.__leaflowPending--; window.__leaflowLastActivity = Date.now(); };
+    if (window.fetch) {
+        const originalFetch = window.fetch;
+        window.fetch = function() {
+            start();
+            return originalFetch.apply(this, arguments).finally(done);
+        };
+    }
+    const originalSend = XMLHttpRequest.prototype.send;
+    XMLHttpRequest.prototype.send = function() {
+        start();
+        this.addEventListener('loadend', done, {once: true});
+        return originalSend.apply(this, arguments);
+    };
+})();
+"""
+
+def apply_stealth(driver):
+    """对当前页面及之后加载的文档注入反自动化检测脚本和网络请求统计脚本"""
+    for script in (STEALTH_SCRIPT, NETWORK_TRACKER_SCRIPT):
+        try:
+            driver.execute_cdp_cmd("Page.addScriptToEvaluateOnNewDocument", {"source": script})
+        except Exception as e:
+            logger.debug(f"注册页面脚本失败: {e}")
+    driver.execute_script(STEALTH_SCRIPT)
+
+class Deadline:
+    """阶段截止时间，同一阶段内的所有等待共享一个时间预算"""
+    
+    def __init__(self, seconds):
+        self.expires_at = time.monotonic() + seconds
+    
+    def remaining(self, cap=None):
+        left = max(0.0, self.expires_at - time.monotonic())
+        return left if cap is None else min(left, cap)
+    
+    def expired(self):
+        return self.remaining() <= 0
+
+class SelectorStats:
+    """记录各角色选择器最近的命中情况，让常命中的选择器排在前面
+    
+    分数按次衰减，最近几次运行的结果权重更高；数据保存在 LEAFLOW_SELECTOR_STATS 指定的文件中。
+    """
+    
+    DECAY = 0.8
+    _shared = None
+    _shared_lock = threading.Lock()
+    
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.scores = {}
+        self.dirty = False
+        if path and os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    self.scores = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning(f"选择器统计文件无法读取，已忽略: {e}")
+    
+    @classmethod
+    def shared(cls):
+        """进程内共享的统计实例"""
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls(os.getenv('LEAFLOW_SELECTOR_STATS', '.leaflow_selector_stats.json'))
+            return cls._shared
+    
+    def order(self, role, selectors):
+        """按历史分数从高到低排列候选选择器，分数相同保持原顺序"""
+        with self.lock:
+            scores = self.scores.get(role, {})
+            return sorted(selectors, key=lambda selector: -scores.get(selector, 0))
+    
+    def record(self, role, selector):
+        """记录本次命中的选择器"""
+        with self.lock:
+            scores = self.scores.setdefault(role, {})
+            for key in scores:
+                scores[key] *= self.DECAY
+            scores[selector] = scores.get(selector, 0) + 1
+            self.dirty = True
+    
+    def save(self):
+        """把统计写回文件"""
+        with self.lock:
+            if not self.dirty or not self.path:
+                return
+            data = json.dumps(self.scores, ensure_ascii=False, indent=2)
+            self.dirty = False
+        try:
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(data)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning(f"保存选择器统计失败: {e}")
+
+class PageWaiter:
+    """基于页面状态的等待：条件一满足立即返回，只有慢页面才会等到截止时间"""
+    
+    POLL_INTERVAL = 0.1
+    
+    # 判断网络空闲：页面加载完成、没有进行中的请求，且最近一段时间没有新的资源加载
+    NETWORK_IDLE_SCRIPT = """
+        if (document.readyState !== 'complete' || (window.__leaflowPending || 0) > 0) return false;
+        const resources = performance.getEntriesByType('resource');
+        const lastResource = resources.length ? performance.timeOrigin + resources[resources.length - 1].responseEnd : 0;
+        return Date.now() - Math.max(window.__leaflowLastActivity || 0, lastResource) >= arguments[0];
+    """
+    
+    def __init__(self, driver):
+        self.driver = driver
+    
+    def until(self, condition, deadline, cap=None, message=""):
+        """轮询条件直到返回真值，超过截止时间抛出TimeoutException"""
+        return WebDriverWait(
+            self.driver, deadline.remaining(cap),
+            poll_frequency=self.POLL_INTERVAL,
+            ignored_exceptions=(StaleElementReferenceException,)
+        ).until(condition, message)
+    
+    def dom_ready(self, deadline, cap=None):
+        return self.until(
+            lambda d: d.execute_script("return document.readyState") == "complete",
+            deadline, cap, "页面DOM未加载完成"
+        )
+    
+    def is_network_idle(self, idle_ms=500):
+        try:
+            return bool(self.driver.execute_script(self.NETWORK_IDLE_SCRIPT, idle_ms))
+        except Exception:
+            return False
+    
+    def network_idle(self, deadline, idle_ms=500, cap=None):
+        return self.until(lambda d: self.is_network_idle(idle_ms), deadline, cap, "页面网络请求未结束")
+    
+    # 在页面内一次性评估所有候选选择器（CSS或以 // 开头的XPath），返回第一个可见的匹配及其序号
+    RESOLVE_SCRIPT = """
+        const [selectors, clickable, withText, pattern] = arguments;
+        const regex = pattern ? new RegExp(pattern) : null;
+        const isVisible = el => {
+            const style = getComputedStyle(el);
+            return el.getClientRects().length > 0 && style.visibility !== 'hidden' && style.display !== 'none';
+        };
+        for (let i = 0; i < selectors.length; i++) {
+            let nodes = [];
+            try {
+                if (selectors[i].startsWith('//')) {
+                    const snapshot = document.evaluate(selectors[i], document, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+                    for (let k = 0; k < snapshot.snapshotLength; k++) nodes.push(snapshot.snapshotItem(k));
+                } else {
+                    nodes = document.querySelectorAll(selectors[i]);
+                }
+            } catch (e) {
+                continue;
+            }
+            for (const el of nodes) {
+                if (!(el instanceof Element) || !isVisible(el)) continue;
+                if (clickable && el.disabled) continue;
+                const text = (el.innerText || el.value || '').trim();
+                if (withText && !text) continue;
+                if (regex && !regex.test(text)) continue;
+                return [el, i];
+            }
+        }
+        return null;
+    """
+    
+    def find_visible(self, selectors, clickable=False, with_text=False, role=None, pattern=None):
+        """一次往返找出第一个可见的元素，没有则返回None
+        
+        指定role时按历史命中情况调整候选顺序，并记录本次命中的选择器。
+        pattern为JavaScript正则表达式，元素文本需与之匹配。
+        """
+        stats = SelectorStats.shared() if role else None
+        if stats:
+            selectors = stats.order(role, selectors)
+        
+        match = self.driver.execute_script(self.RESOLVE_SCRIPT, selectors, clickable, with_text, pattern)
+        if not match:
+            return None
+        
+        element, index = match
+        if stats:
+            stats.record(role, selectors[index])
+        return element
+    
+    def visible(self, selectors, deadline, cap=None, clickable=False, role=None):
+        """等待任一选择器对应的元素可见"""
+        return self.until(
+            lambda d: self.find_visible(selectors, clickable, role=role),
+            deadline, cap, f"未找到元素: {selectors[0]}"
+        )
+    
+    def gone(self, selectors, deadline, cap=None):
+        """等待所有选择器对应的元素消失"""
+        return self.until(
+            lambda d: self.find_visible(selectors) is None,
+            deadline, cap, f"元素未消失: {selectors[0]}"
+        )
+
+class SharedBrowser:
+    """长期运行的Chrome实例，每个账号在独立的浏览器上下文中运行
+    
+    每个上下文拥有独立的Cookie和存储，账号之间互不影响。
+    同一实例同一时间只能服务一个账号，并发时每个工作线程各持有一个实例。
+    
+    独立上下文的HTTP缓存只在内存中，启用共享磁盘缓存（LEAFLOW_CACHE_DIR）时改为在默认上下文中为每个账号打开新页面，
+    账号结束后清除所有Cookie和站点存储来隔离账号，磁盘缓存中的静态资源则保留给之后的账号。
+    """
+    
+    # 账号之间清除的站点数据，不包括HTTP缓存
+    SITE_STORAGE_TYPES = 'cookies,local_storage,indexeddb,websql,service_workers,cache_storage,file_systems'
+    
+    def __init__(self):
+        self.driver = None
+        self.base_handle = None
+        self.context_id = None
+        self.page_handle = None
+        self.shared_cache = bool(cache_dir_root())
+        # 最近一次 open_context 时是否重新启动了浏览器及其耗时
+        self.startup_seconds = None
+        # 服务过一定数量的账号或内存超过阈值后重启浏览器，避免长时间运行时内存持续增长
+        self.max_accounts = int(os.getenv('LEAFLOW_BROWSER_MAX_ACCOUNTS', '50') or 0)
+        self.max_rss = float(os.getenv('LEAFLOW_BROWSER_MAX_RSS_MB', '1500') or 0) * 1024 * 1024
+        self.accounts_served = 0
+    
+    def start(self):
+        """启动浏览器"""
+        logger.info("启动共享浏览器...")
+        self.driver = create_chrome_driver()
+        self.base_handle = self.driver.current_window_handle
+        self.accounts_served = 0
+    
+    def rss(self):
+        """浏览器整个进程树的常驻内存（字节）"""
+        pid = driver_pid(self.driver) if self.driver else None
+        return sum(process_rss(p) for p in process_tree(pid)) if pid else 0
+    
+    def recycle_reason(self):
+        """需要重启浏览器时返回原因，否则返回None"""
+        if self.max_accounts and self.accounts_served >= self.max_accounts:
+            return f"已服务 {self.accounts_served} 个账号"
+        if self.max_rss:
+            rss = self.rss()
+            if rss > self.max_rss:
+                return f"内存占用 {rss / 1024 / 1024:.0f} MB"
+        return None
+    
+    def is_alive(self):
+        """检查浏览器是否仍可用"""
+        if not self.driver:
+            return False
+        try:
+            self.driver.window_handles
+            return True
+        except Exception:
+            return False
+    
+    def open_context(self):
+        """创建新的隔离上下文并切换过去，返回可直接使用的driver"""
+        self.startup_seconds = None
+        if not self.is_alive():
+            self.quit()
+            self.start()
+            self.startup_seconds = self.driver._leaflow_startup_seconds
+        
+        params = {"url": "about:blank"}
+        if not self.shared_cache:
+            context = self.driver.execute_cdp_cmd("Target.createBrowserContext", {})
+            self.context_id = params["browserContextId"] = context["browserContextId"]
+        self.page_handle = self.driver.execute_cdp_cmd("Target.createTarget", params)["targetId"]
+        self.driver.switch_to.window(self.page_handle)
+        apply_stealth(self.driver)
+        apply_resource_blocking(self.driver)
+        return self.driver
+    
+    def close_context(self):
+        """关闭当前上下文，保留浏览器进程供下一个账号使用"""
+        if not self.driver or not self.page_handle:
+            return
+        try:
+            self.driver.close()
+            self.driver.switch_to.window(self.base_handle)
+            if self.context_id:
+                self.driver.execute_cdp_cmd("Target.disposeBrowserContext", {"browserContextId": self.context_id})
+            else:
+                self.clear_site_data()
+        except Exception as e:
+            logger.warning(f"关闭浏览器上下文失败，将重启共享浏览器: {e}")
+            self.quit()
+            return
+        finally:
+            self.context_id = self.page_handle = None
+        
+        self.accounts_served += 1
+        reason = self.recycle_reason()
+        if reason:
+            logger.info(f"共享浏览器{reason}，重启以释放资源")
+            self.quit()
+    
+    def clear_site_data(self):
+        """默认上下文中清除上一个账号留下的Cookie和站点存储"""
+        self.driver.execute_cdp_cmd("Network.clearBrowserCookies", {})
+        for url in (LEAFLOW_URL, CHECKIN_URL):
+            parsed = urlparse(url)
+            self.driver.execute_cdp_cmd("Storage.clearDataForOrigin", {
+                "origin": f"{parsed.scheme}://{parsed.netloc}",
+                "storageTypes": self.SITE_STORAGE_TYPES
+            })
+    
+    def quit(self):
+        """关闭浏览器进程"""
+        driver, self.driver = self.driver, None
+        self.context_id = self.page_handle = None
+        if driver:
+            try:
+                quit_driver(driver)
+            except Exception as e:
+                logger.warning(f"关闭共享浏览器时出错: {e}")
+    
+    def kill(self):
+        """强制结束浏览器进程树，下一个账号会自动重启浏览器"""
+        driver, self.driver = self.driver, None
+        self.context_id = self.page_handle = None
+        if driver:
+            kill_driver(driver)
+
+class BrowserPool:
+    """常驻模式下保持若干个已启动的共享浏览器，在多次运行之间复用，省去每次运行的浏览器启动"""
+    
+    def __init__(self, size):
+        self.size = size
+        self._idle = []
+        self._warming = 0
+        self._lock = threading.Lock()
+    
+    def prewarm(self):
+        """在后台启动空闲浏览器直到池满"""
+        with self._lock:
+            missing = self.size - len(self._idle) - self._warming
+            self._warming += max(0, missing)
+        for _ in range(missing):
+            threading.Thread(target=self._warm_one, name='pool-prewarm', daemon=True).start()
+    
+    def _warm_one(self):
+        browser = SharedBrowser()
+        try:
+            browser.start()
+        except Exception as e:
+            logger.warning(f"预热浏览器失败: {e}")
+        finally:
+            with self._lock:
+                self._warming -= 1
+        self.release(browser)
+    
+    def acquire(self):
+        """取出一个空闲浏览器，没有时返回一个新的（首次使用时才启动）"""
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        return SharedBrowser()
+    
+    def release(self, browser):
+        """归还浏览器，池已满或浏览器不可用时关闭它"""
+        alive = browser.is_alive()
+        with self._lock:
+            if alive and len(self._idle) < self.size:
+                self._idle.append(browser)
+                return
+        browser.quit()
+    
+    def stats(self):
+        with self._lock:
+            return {'size': self.size, 'idle': len(self._idle), 'warming': self._warming}
+    
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for browser in idle:
+            browser.quit()
+
+# Fernet.generate_key() 生成的密钥：32字节的 urlsafe base64
+FERNET_KEY_PATTERN = re.compile(r'[A-Za-z0-9_-]{43}=')
+# PBKDF2-HMAC-SHA256 的迭代次数（OWASP 建议值）
+KDF_ITERATIONS = 600000
+SALT_BYTES = 16
+
+def fernet_from_key(key, salt=None):
+    """把口令转换为Fernet
+    
+    口令本身就是Fernet密钥时原样使用；其他口令用 PBKDF2 和随机盐派生密钥，盐需要与密文保存在一起。
+    """
+    from cryptography.fernet import Fernet
+    
+    if FERNET_KEY_PATTERN.fullmatch(key):
+        return Fernet(key.encode('ascii'))
+    if not salt:
+        raise ValueError("口令派生密钥需要盐")
+    from cryptography.hazmat.primitives import hashes
+    from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+    
+    kdf = PBKDF2HMAC(algorithm=hashes.SHA256(), length=32, salt=salt, iterations=KDF_ITERATIONS)
+    return Fernet(base64.urlsafe_b64encode(kdf.derive(key.encode('utf-8'))))
+
+def legacy_fernet_from_key(key):
+    """旧版本直接用口令的SHA-256作为密钥，仅用于读取旧的加密账号文件"""
+    from cryptography.fernet import Fernet
+    
+    return Fernet(base64.urlsafe_b64encode(hashlib.sha256(key.encode('utf-8')).digest()))
+
+def load_salt(path):
+    """读取盐文件，不存在时生成随机盐；多个进程同时创建时以先写入的为准"""
+    if not os.path.exists(path):
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(os.urandom(SALT_BYTES))
+        try:
+            # 硬链接在目标已存在时失败，不会覆盖其他进程刚写入的盐
+            os.link(tmp_path, path)
+        except FileExistsError:
+            pass
+        finally:
+            os.remove(tmp_path)
+    with open(path, 'rb') as f:
+        salt = f.read()
+    if len(salt) != SALT_BYTES:
+        raise ValueError(f"盐文件 {path} 已损坏")
+    return salt
+
+class SessionStore:
+    """按账号邮箱保存加密的登录Cookie，下次运行时直接复用会话
+    
+    需要设置 LEAFLOW_SESSION_KEY 作为加密口令，未设置时不启用。密钥派生用的随机盐保存在缓存目录的 salt 文件中，
+    与会话文件一起缓存；盐丢失后旧的会话无法解密，会被丢弃并重新登录。
+    """
+    
+    # Network.setCookies 接受的Cookie字段
+    COOKIE_FIELDS = ('name', 'value', 'domain', 'path', 'secure', 'httpOnly', 'sameSite', 'expires')
+    
+    def __init__(self, directory, key, max_age_days=30):
+        self.directory = directory
+        self.max_age = max_age_days * 86400
+        os.makedirs(self.directory, exist_ok=True)
+        self.fernet = fernet_from_key(key, load_salt(os.path.join(self.directory, 'salt')))
+    
+    @classmethod
+    def from_env(cls):
+        """根据环境变量创建会话存储，未配置或缺少依赖时返回None"""
+        key = os.getenv('LEAFLOW_SESSION_KEY', '')
+        if not key:
+            return None
+        try:
+            return cls(
+                os.getenv('LEAFLOW_SESSION_DIR', '.leaflow_sessions'),
+                key,
+                float(os.getenv('LEAFLOW_SESSION_MAX_AGE_DAYS', '30') or 30)
+            )
+        except ImportError:
+            logger.warning("未安装 cryptography，会话缓存功能不可用")
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"会话缓存不可用: {e}")
+            return None
+    
+    def _path(self, email):
+        name = hashlib.sha256(email.strip().lower().encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, f"{name}.session")
+    
+    def load(self, email):
+        """读取账号的Cookie，不存在、过期或无法解密时返回None"""
+        path = self._path(email)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'rb') as f:
+                data = json.loads(self.fernet.decrypt(f.read()))
+        except Exception as e:
+            logger.warning(f"会话缓存无法读取，已忽略: {e}")
+            self.delete(email)
+            return None
+        
+        if time.time() - data.get('saved_at', 0) > self.max_age:
+            self.delete(email)
+            return None
+        return data.get('cookies') or None
+    
+    def save(self, email, cookies):
+        """加密保存账号的Cookie"""
+        cookies = [
+            {k: v for k, v in cookie.items() if k in self.COOKIE_FIELDS}
+            for cookie in cookies
+            if is_site_cookie(cookie.get('domain'))
+        ]
+        if not cookies:
+            return
+        token = self.fernet.encrypt(json.dumps({'saved_at': time.time(), 'cookies': cookies}).encode('utf-8'))
+        tmp_path = self._path(email) + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(token)
+        os.replace(tmp_path, self._path(email))
+    
+    def delete(self, email):
+        """删除账号的会话缓存"""
+        try:
+            os.remove(self._path(email))
+        except FileNotFoundError:
+            pass
+
+def cookies_to_session(cookies):
+    """用保存的Cookie构建requests会话"""
+    load_requests()
+    session = requests.Session()
+    session.headers['User-Agent'] = (
+        'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) '
+        'Chrome/120.0.0.0 Safari/537.36'
+    )
+    for cookie in cookies:
+        session.cookies.set(
+            cookie['name'], cookie['value'],
+            domain=cookie.get('domain', ''), path=cookie.get('path', '/')
+        )
+    return session
+
+def is_session_valid(cookies):
+    """通过一次不跟随跳转的HTTP请求判断Cookie是否仍处于登录状态"""
+    try:
+        response = cookies_to_session(cookies).get(
+            f"{LEAFLOW_URL}/dashboard", allow_redirects=False, timeout=10
+        )
+    except requests.RequestException as e:
+        logger.warning(f"校验会话时网络出错: {e}")
+        return False
+    return response.status_code == 200 and "login" not in response.url
+
+class AccountMetrics:
+    """单个账号各阶段的耗时及WebDriver命令次数和耗时"""
+    
+    def __init__(self, email):
+        self.email = email
+        self.started = time.time()
+        self.phases = {}
+        self.webdriver_commands = 0
+        self.webdriver_seconds = 0.0
+        self.network = None
+        # 浏览器进程实际启动耗时（预启动或共享浏览器时可能不计入 driver_startup 阶段）
+        self.driver_launch_seconds = None
+        # 第几次尝试（失败重试时递增）
+        self.attempt = 1
+        self._stack = []
+    
+    def _phase_entry(self, name):
+        return self.phases.setdefault(name, {'seconds': 0.0, 'webdriver_commands': 0, 'webdriver_seconds': 0.0})
+    
+    @contextmanager
+    def phase(self, name):
+        """统计一个阶段的耗时，期间的WebDriver命令计入该阶段"""
+        entry = self._phase_entry(name)
+        self._stack.append(entry)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            entry['seconds'] += time.perf_counter() - start
+            self._stack.pop()
+    
+    def add_network(self, stats):
+        """累加性能日志中的网络统计"""
+        if not stats:
+            return
+        if self.network is None:
+            self.network = dict.fromkeys(stats, 0)
+        for key, value in stats.items():
+            self.network[key] = self.network.get(key, 0) + value
+    
+    def add_command(self, seconds):
+        self.webdriver_commands += 1
+        self.webdriver_seconds += seconds
+        if self._stack:
+            self._stack[-1]['webdriver_commands'] += 1
+            self._stack[-1]['webdriver_seconds'] += seconds
+    
+    def to_dict(self, success=None, failure=None, failure_class=None):
+        return {
+            'type': 'account',
+            'ts': datetime.fromtimestamp(self.started).isoformat(timespec='seconds'),
+            'account': mask_email(self.email),
+            'attempt': self.attempt,
+            'success': success,
+            'failure': failure,
+            'failure_class': failure_class,
+            'total_seconds': round(time.time() - self.started, 3),
+            'webdriver_commands': self.webdriver_commands,
+            'webdriver_seconds': round(self.webdriver_seconds, 3),
+            'network': self.network,
+            'driver_launch_seconds': None if self.driver_launch_seconds is None else round(self.driver_launch_seconds, 3),
+            'phases': {
+                name: {key: round(value, 3) if isinstance(value, float) else value for key, value in entry.items()}
+                for name, entry in self.phases.items()
+            }
+        }
+
+def instrument_driver(driver, metrics):
+    """统计driver发出的每个WebDriver命令，共享浏览器换账号时只需切换统计对象"""
+    driver._leaflow_metrics = metrics
+    if getattr(driver, '_leaflow_instrumented', False):
+        return driver
+    
+    original_execute = driver.execute
+    
+    def execute(driver_command, params=None):
+        start = time.perf_counter()
+        try:
+            return original_execute(driver_command, params)
+        finally:
+            current = getattr(driver, '_leaflow_metrics', None)
+            if current:
+                current.add_command(time.perf_counter() - start)
+    
+    # WebElement 的命令也通过 parent.execute 发出，替换实例方法即可全部覆盖
+    driver.execute = execute
+    driver._leaflow_instrumented = True
+    return driver
+
+class RunMetrics:
+    """汇总一次运行的指标，导出为JSON Lines（LEAFLOW_METRICS_FILE）和Prometheus文本文件（LEAFLOW_PROM_FILE）"""
+    
+    def __init__(self, jsonl_path='', prom_path=''):
+        self.jsonl_path = jsonl_path
+        self.prom_path = prom_path
+        self.run_id = datetime.now().strftime('%Y%m%dT%H%M%S')
+        self.started = time.time()
+        self.records = []
+        self.phases = {}
+        # 限速器的最终速率和等待统计
+        self.limiter = None
+        # 签到账本中今天已完成、本次未处理的账号数
+        self.already_done = 0
+        self.lock = threading.Lock()
+    
+    @classmethod
+    def from_env(cls):
+        return cls(os.getenv('LEAFLOW_METRICS_FILE', ''), os.getenv('LEAFLOW_PROM_FILE', ''))
+    
+    def record_account(self, account_metrics, success, failure=None, failure_class=None, retried=False):
+        """记录一次尝试的指标，retried 表示该次失败后账号被重新排队"""
+        record = account_metrics.to_dict(success, failure, failure_class)
+        record['run_id'] = self.run_id
+        record['retried'] = retried
+        phases = ', '.join(f"{name}={entry['seconds']:.1f}s" for name, entry in record['phases'].items())
+        if record['driver_launch_seconds'] is not None:
+            phases += f", 浏览器启动={record['driver_launch_seconds']:.1f}s"
+        logger.info(
+            f"账号耗时 {record['total_seconds']:.1f}s，WebDriver命令 {record['webdriver_commands']} 次"
+            f"（{record['webdriver_seconds']:.1f}s）{'，' + phases if phases else ''}"
+        )
+        with self.lock:
+            self.records.append(record)
+    
+    @contextmanager
+    def phase(self, name):
+        """统计运行级阶段（如通知）的耗时"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - start
+    
+    def network_totals(self):
+        """汇总所有账号的网络统计，没有任何统计时返回None"""
+        totals = None
+        for record in self.records:
+            if record.get('network'):
+                totals = totals or {}
+                for key, value in record['network'].items():
+                    totals[key] = totals.get(key, 0) + value
+        return totals
+    
+    def summary(self):
+        with self.lock:
+            return {
+                'type': 'run',
+                'run_id': self.run_id,
+                'ts': datetime.fromtimestamp(self.started).isoformat(timespec='seconds'),
+                'total_seconds': round(time.time() - self.started, 3),
+                'accounts': sum(1 for record in self.records if not record['retried']),
+                'success': sum(1 for record in self.records if record['success']),
+                'retries': sum(1 for record in self.records if record['retried']),
+                'already_done': self.already_done,
+                'phases': {name: round(seconds, 3) for name, seconds in self.phases.items()},
+                'network': self.network_totals(),
+                'rate_limiter': self.limiter
+            }
+    
+    def export(self):
+        """写出指标文件，未配置路径时跳过"""
+        summary = self.summary()
+        try:
+            if self.jsonl_path:
+                with open(self.jsonl_path, 'a', encoding='utf-8') as f:
+                    for record in self.records + [summary]:
+                        f.write(json.dumps(record, ensure_ascii=False) + '\n')
+                logger.info(f"运行指标已写入 {self.jsonl_path}")
+            if self.prom_path:
+                tmp_path = self.prom_path + '.tmp'
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    f.write(self.to_prometheus(summary))
+                os.replace(tmp_path, self.prom_path)
+                logger.info(f"Prometheus指标已写入 {self.prom_path}")
+        except OSError as e:
+            logger.warning(f"写入运行指标失败: {e}")
+    
+    def to_prometheus(self, summary):
+        lines = [
+            '# HELP leaflow_run_duration_seconds Wall-clock duration of the last run.',
+            '# TYPE leaflow_run_duration_seconds gauge',
+            f"leaflow_run_duration_seconds {summary['total_seconds']}",
+            '# HELP leaflow_run_accounts Accounts processed in the last run.',
+            '# TYPE leaflow_run_accounts gauge',
+            f"leaflow_run_accounts {summary['accounts']}",
+            '# HELP leaflow_run_success_accounts Accounts that succeeded in the last run.',
+            '# TYPE leaflow_run_success_accounts gauge',
+            f"leaflow_run_success_accounts {summary['success']}",
+            '# HELP leaflow_run_retries Failed attempts that were requeued in the last run.',
+            '# TYPE leaflow_run_retries gauge',
+            f"leaflow_run_retries {summary['retries']}",
+            '# HELP leaflow_run_already_done_accounts Accounts skipped because the ledger shows them done today.',
+            '# TYPE leaflow_run_already_done_accounts gauge',
+            f"leaflow_run_already_done_accounts {summary['already_done']}",
+            '# HELP leaflow_run_phase_seconds Duration of run-level phases such as notification.',
+            '# TYPE leaflow_run_phase_seconds gauge',
+        ]
+        lines += [f'leaflow_run_phase_seconds{{phase="{name}"}} {seconds}' for name, seconds in summary['phases'].items()]
+        if summary['network']:
+            lines += [
+                '# HELP leaflow_run_network Network totals of the last run (requests, transferred_bytes, blocked_requests, '
+                'static_requests, cache_hits, cache_saved_bytes).',
+                '# TYPE leaflow_run_network gauge',
+            ]
+            lines += [f'leaflow_run_network{{kind="{key}"}} {value}' for key, value in summary['network'].items()]
+        
+        if summary['rate_limiter']:
+            lines += [
+                '# HELP leaflow_rate_limiter Adaptive rate limiter state at the end of the last run (rate, waits, wait_seconds, decreases).',
+                '# TYPE leaflow_rate_limiter gauge',
+            ]
+            lines += [f'leaflow_rate_limiter{{kind="{key}"}} {value}' for key, value in summary['rate_limiter'].items()]
+        
+        families = [
+            ('leaflow_account_phase_seconds', 'seconds', 'Time spent per account and phase.'),
+            ('leaflow_account_phase_webdriver_commands', 'webdriver_commands', 'WebDriver commands per account and phase.'),
+            ('leaflow_account_phase_webdriver_seconds', 'webdriver_seconds', 'WebDriver command latency per account and phase.'),
+        ]
+        for metric, key, help_text in families:
+            lines += [f'# HELP {metric} {help_text}', f'# TYPE {metric} gauge']
+            for record in self.records:
+                # 每个账号只导出最终那次尝试，避免重复的时间序列
+                if record['retried']:
+                    continue
+                account = record['account'].replace('\\', '\\\\').replace('"', '\\"')
+                for name, entry in record['phases'].items():
+                    lines.append(f'{metric}{{account="{account}",phase="{name}"}} {entry[key]}')
+        return '\n'.join(lines) + '\n'
+
+def session_to_cookies(session):
+    """把requests会话中的Cookie导出为可保存的格式"""
+    return [
+        {
+            'name': cookie.name,
+            'value': cookie.value,
+            'domain': cookie.domain,
+            'path': cookie.path,
+            'secure': cookie.secure
+        }
+        for cookie in session.cookies
+    ]
+
+def extract_balance(text):
+    """从页面文本中提取余额数字，找不到时返回None"""
+    match = re.search(r'[¥￥]\s*(\d+(?:\.\d+)?)', text) or re.search(r'(\d+(?:\.\d+)?)\s*元', text)
+    return match.group(1) if match else None
+
+def balance_value(balance):
+    """把结果中的余额文本（如 12.3元）转换为数字，未知或占位文本返回None"""
+    match = re.search(r'\d+(?:\.\d+)?', balance or '')
+    return float(match.group(0)) if match else None
+
+# 未获取余额时在结果中显示的占位文本
+BALANCE_SKIPPED = "未获取"
+BALANCE_DEFERRED = "待获取"
+
+class CheckinProtocolError(Exception):
+    """HTTP签到得到的页面与预期结构不符，需要回退到浏览器签到"""
+
+class CheckinError(Exception):
+    """签到流程中的失败，kind 表示失败类型，决定是否值得重试"""
+    
+    kind = 'error'
+    
+    def __init__(self, message, kind=None):
+        super().__init__(message)
+        if kind:
+            self.kind = kind
+
+class InvalidCredentialsError(CheckinError):
+    """邮箱或密码错误，重试也不会成功"""
+    kind = 'bad_credentials'
+
+class SelectorNotFoundError(CheckinError):
+    """页面已加载但找不到需要的元素"""
+    kind = 'selector_not_found'
+
+class PageTimeoutError(CheckinError):
+    """页面在等待预算内没有就绪"""
+    kind = 'page_timeout'
+
+# 不重试的失败类型：账号密码错误重试也不会成功
+PERMANENT_FAILURES = {'bad_credentials'}
+
+# chromedriver 或浏览器进程已经不可用时的错误信息
+DRIVER_CRASH_MARKERS = (
+    'invalid session id', 'chrome not reachable', 'disconnected', 'session deleted',
+    'no such window', 'target window already closed', 'crashed',
+    # DevTools后端的对应错误
+    'session with given id not found', 'no target with given id'
+)
+
+def classify_failure(error):
+    """把异常归类为 bad_credentials / selector_not_found / page_timeout / driver_crash / network / error"""
+    if isinstance(error, CheckinError):
+        return error.kind
+    # 尚未导入的库不可能抛出异常，对应的判断直接跳过
+    if webdriver is not None and isinstance(error, TimeoutException):
+        return 'page_timeout'
+    if requests is not None and isinstance(error, requests.RequestException):
+        return 'network'
+    # 与 chromedriver 或 DevTools 的本地连接断开说明驱动或浏览器进程已退出
+    if isinstance(error, ConnectionError) or (urllib3 is not None and isinstance(error, urllib3.exceptions.HTTPError)):
+        return 'driver_crash'
+    if webdriver is None:
+        return 'error'
+    if isinstance(error, (SessionNotCreatedException, InvalidSessionIdException)):
+        return 'driver_crash'
+    if isinstance(error, WebDriverException):
+        message = str(error).lower()
+        if 'net::err_' in message:
+            return 'network'
+        if any(marker in message for marker in DRIVER_CRASH_MARKERS):
+            return 'driver_crash'
+        if isinstance(error, NoSuchElementException):
+            return 'selector_not_found'
+    return 'error'
+
+class _PageParser(HTMLParser):
+    """提取签到所需的表单、按钮、提示消息、内联脚本和正文文本"""
+    
+    VOID_TAGS = {'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta', 'source', 'track', 'wbr'}
+    SKIP_TAGS = {'script', 'style', 'template', 'noscript'}
+    MESSAGE_CLASS = re.compile(r'alert|success|message|toast|notification|modal-content')
+    
+    def __init__(self):
+        super().__init__()
+        self.forms = []
+        self.buttons = []
+        self.messages = []
+        self.lines = []
+        self.scripts = []
+        self.csrf_token = None
+        self._stack = []
+        self._form = None
+    
+    def handle_starttag(self, tag, attrs):
+        attrs = {k: v or '' for k, v in attrs}
+        if tag == 'form':
+            self._form = {'action': attrs.get('action', ''), 'method': attrs.get('method', 'get').lower(), 'fields': {}}
+            self.forms.append(self._form)
+        elif tag == 'meta' and attrs.get('name') == 'csrf-token':
+            self.csrf_token = attrs.get('content')
+        elif tag == 'input' and self._form is not None and attrs.get('name'):
+            if attrs.get('type', 'text').lower() not in ('submit', 'button', 'image'):
+                self._form['fields'][attrs['name']] = attrs.get('value', '')
+        if tag in self.VOID_TAGS:
+            return
+        self._stack.append({'tag': tag, 'attrs': attrs, 'text': [], 'form': self._form})
+    
+    def handle_endtag(self, tag):
+        if not any(node['tag'] == tag for node in self._stack):
+            return
+        while self._stack:
+            node = self._stack.pop()
+            text = ' '.join(''.join(node['text']).split())
+            if self._stack and node['tag'] not in self.SKIP_TAGS:
+                self._stack[-1]['text'].append(' ' + ''.join(node['text']) + ' ')
+            self._close(node, text)
+            if node['tag'] == tag:
+                break
+        if tag == 'form':
+            self._form = None
+    
+    def _close(self, node, text):
+        attrs = node['attrs']
+        if node['tag'] == 'button' or (node['tag'] == 'input' and attrs.get('type') == 'submit'):
+            self.buttons.append({
+                'text': text or attrs.get('value', ''),
+                'class': attrs.get('class', ''),
+                'name': attrs.get('name', ''),
+                'value': attrs.get('value', ''),
+                'disabled': 'disabled' in attrs,
+                'form': node['form']
+            })
+        elif node['tag'] == 'script' and text:
+            self.scripts.append(text)
+        elif text and self.MESSAGE_CLASS.search(attrs.get('class', '')):
+            self.messages.append(text)
+        if node['tag'] in ('p', 'div', 'li', 'span', 'h1', 'h2', 'h3', 'h4', 'td', 'a', 'button') and text:
+            self.lines.append(text)
+    
+    def handle_data(self, data):
+        # 脚本等标签的内容只留在自身节点中，不并入外层元素的文本
+        if self._stack:
+            self._stack[-1]['text'].append(data)
+
+def parse_page(html):
+    parser = _PageParser()
+    parser.feed(html)
+    parser.close()
+    return parser
+
+class HttpCheckin:
+    """基于requests的签到引擎，使用已登录的会话直接提交签到表单或调用签到接口，无需启动浏览器"""
+    
+    RESULT_KEYWORDS = ["成功", "获得", "恭喜", "已签到", "连续签到", "完成"]
+    # 页面脚本中以POST请求的签到接口地址，如 fetch('/api/checkin', {method: 'POST'})、axios.post('/user/check-in')；
+    # 同一脚本中查询签到状态等GET请求的地址不会被选中
+    CHECKIN_API_PATTERN = re.compile(
+        r"""(?P<post>\.post\(\s*)?['"`](?P<url>(?:https?://[^'"`\s]+)?/[\w/.-]*check-?in[\w/.-]*)['"`](?P<options>[^;)]*)""",
+        re.IGNORECASE
+    )
+    POST_OPTION_PATTERN = re.compile(r"""\b(?:method|type)\s*:\s*['"`]post['"`]""", re.IGNORECASE)
+    
+    def __init__(self, session, leaflow_url=None, checkin_url=None, timeout=15, limiter=None):
+        self.session = session
+        self.leaflow_url = (leaflow_url or LEAFLOW_URL).rstrip('/')
+        self.checkin_url = checkin_url or CHECKIN_URL
+        self.timeout = timeout
+        self.limiter = limiter
+    
+    def _request(self, method, url, throttle=True, **kwargs):
+        """发送请求，签到请求先经过全局限速，所有响应都反馈给限速器"""
+        if not self.limiter:
+            return self.session.request(method, url, timeout=self.timeout, **kwargs)
+        if throttle:
+            self.limiter.acquire('HTTP签到')
+        start = time.perf_counter()
+        try:
+            response = self.session.request(method, url, timeout=self.timeout, **kwargs)
+        except requests.RequestException:
+            self.limiter.report(ok=False, reason="网络错误")
+            raise
+        status = response.status_code
+        self.limiter.report(
+            ok=status != 429 and status < 500,
+            seconds=time.perf_counter() - start,
+            retry_after=retry_after_seconds(response) if status in (429, 503) else None,
+            reason=f"状态码 {status}"
+        )
+        return response
+    
+    def _get(self, url, throttle=True):
+        response = self._request('GET', url, throttle)
+        if response.status_code >= 400:
+            raise CheckinProtocolError(f"请求 {url} 返回状态码 {response.status_code}")
+        if "/login" in response.url:
+            raise CheckinProtocolError("会话已失效，被重定向到登录页")
+        return response
+    
+    @staticmethod
+    def find_checkin_button(page):
+        for button in page.buttons:
+            if 'checkin-btn' in button['class'] or '签到' in button['text']:
+                return button
+        return None
+    
+    def find_checkin_api(self, page_url, page):
+        """签到按钮由脚本提交时，从页面的内联脚本中找出签到接口地址"""
+        for script in page.scripts:
+            for match in self.CHECKIN_API_PATTERN.finditer(script):
+                # $.ajax({type: 'POST', url: '/api/checkin'}) 的请求方法写在地址之前
+                before = script[:match.start()]
+                options = before[before.rfind('{') + 1:] if before.rfind('{') > before.rfind(';') else ''
+                if match.group('post') or self.POST_OPTION_PATTERN.search(options + match.group('options')):
+                    return urljoin(page_url, match.group('url'))
+        raise CheckinProtocolError("签到按钮不在表单中，页面脚本中也没有找到签到接口")
+    
+    def checkin(self):
+        """执行签到，返回签到结果消息"""
+        logger.info("使用HTTP方式签到...")
+        response = self._get(self.checkin_url)
+        page = parse_page(response.text)
+        
+        button = self.find_checkin_button(page)
+        if not button:
+            raise CheckinProtocolError("签到页面中没有找到签到按钮")
+        if "已签到" in button['text'] or button['disabled']:
+            logger.info("伙计，今日你已经签到过了！")
+            return "今日已签到"
+        
+        form = button['form']
+        if form is None:
+            api = self.find_checkin_api(response.url, page)
+            headers = {'Referer': response.url, 'Accept': 'application/json', 'X-Requested-With': 'XMLHttpRequest'}
+            if page.csrf_token:
+                headers['X-CSRF-TOKEN'] = page.csrf_token
+            logger.info("调用签到接口")
+            result = self._request('POST', api, headers=headers)
+        else:
+            data = dict(form['fields'])
+            if button['name']:
+                data[button['name']] = button['value']
+            action = urljoin(response.url, form['action'] or response.url)
+            
+            logger.info("提交签到表单")
+            if form['method'] == 'post':
+                result = self._request('POST', action, data=data, headers={'Referer': response.url})
+            else:
+                result = self._request('GET', action, params=data, headers={'Referer': response.url})
+        if result.status_code >= 400:
+            raise CheckinProtocolError(f"提交签到返回状态码 {result.status_code}")
+        
+        message = self.extract_result(result)
+        if message:
+            return message
+        
+        # 响应中没有结果信息时，重新读取签到页确认按钮状态
+        button = self.find_checkin_button(parse_page(self._get(self.checkin_url, throttle=False).text))
+        if button and ("已签到" in button['text'] or button['disabled']):
+            return "今日已签到完成"
+        raise CheckinProtocolError("提交签到后无法确认签到结果")
+    
+    def extract_result(self, response):
+        """从签到响应中提取结果消息"""
+        if 'json' in response.headers.get('Content-Type', ''):
+            try:
+                data = response.json()
+            except ValueError:
+                return None
+            message = str(data.get('message') or data.get('msg') or '') or None
+            if data.get('success') is False:
+                if message and "已签到" in message:
+                    return "今日已签到"
+                raise CheckinError(f"签到接口返回失败: {message or '没有说明原因'}")
+            return message
+        
+        page = parse_page(response.text)
+        for message in page.messages:
+            if len(message) < 100:
+                return message
+        for keyword in self.RESULT_KEYWORDS:
+            for line in page.lines:
+                if keyword in line and len(line) < 100:
+                    return line
+        return None
+    
+    def read_balance(self):
+        """读取仪表板中的余额，失败时抛出异常说明原因"""
+        page = parse_page(self._get(f"{self.leaflow_url}/dashboard", throttle=False).text)
+        for line in page.lines:
+            balance = extract_balance(line)
+            if balance:
+                return f"{balance}元"
+        raise CheckinProtocolError("仪表板中未找到余额信息")
+    
+    def get_balance(self):
+        """读取仪表板中的余额，失败时返回"未知"而不抛出异常"""
+        try:
+            balance = self.read_balance()
+        except (CheckinProtocolError, requests.RequestException) as e:
+            logger.warning(f"HTTP获取余额失败: {e}")
+            return "未知"
+        logger.info(f"找到余额: {balance}")
+        return balance
+
 class LeaflowAutoCheckin:
-    def __init__(self, email, password):
+    def __init__(self, email, password, browser=None, session_store=None, launcher=None,
+                 http_checkin=None, phase_timeout=None, result_timeout=None, limiter=None):
+        # 会话校验、HTTP签到和余额读取都需要requests，Selenium则等到真正启动浏览器时才导入
+        load_requests()
         self.email = email
         self.password = password
+        self.session_store = session_store
         self.telegram_bot_token = os.getenv('TELEGRAM_BOT_TOKEN', '')
         self.telegram_chat_id = os.getenv('TELEGRAM_CHAT_ID', '')
         
         if not self.email or not self.password:
             raise ValueError("邮箱和密码不能为空")
         
+        self.browser = browser
+        self.launcher = launcher
+        self.limiter = limiter
         self.driver = None
-        self.setup_driver()
+        # 有有效会话时优先使用HTTP签到，浏览器只在需要时才启动；账号文件中的设置优先于环境变量
+        if http_checkin is None:
+            http_checkin = os.getenv('LEAFLOW_HTTP_CHECKIN', 'true').lower() not in ('0', 'false', 'no')
+        self.http_checkin = http_checkin
+        # 每个阶段（登录、签到页）的总等待预算，以及签到结果的等待预算
+        self.phase_timeout = phase_timeout or float(os.getenv('LEAFLOW_PHASE_TIMEOUT', '60') or 60)
+        self.result_timeout = result_timeout or float(os.getenv('LEAFLOW_RESULT_TIMEOUT', '10') or 10)
+        self.metrics = AccountMetrics(email)
+        self.failure_class = None
+        # 被看门狗因超时强制中断
+        self.aborted = False
+        # 余额获取方式：auto / http / browser / skip / defer
+        self.balance_mode = os.getenv('LEAFLOW_BALANCE', 'auto').strip().lower() or 'auto'
+        if self.balance_mode not in self.BALANCE_MODES:
+            logger.warning(f"未知的 LEAFLOW_BALANCE={self.balance_mode}，使用 auto")
+            self.balance_mode = 'auto'
+        # defer 模式下留给管理器稍后读取余额的会话Cookie
+        self.session_cookies = None
+    
+    def ensure_driver(self):
+        """按需启动浏览器"""
+        if self.driver:
+            return
+        with self.metrics.phase('driver_startup'):
+            if self.browser:
+                self.driver = self.browser.open_context()
+            else:
+                self.setup_driver()
+        if self.browser:
+            self.metrics.driver_launch_seconds = self.browser.startup_seconds
+        else:
+            self.metrics.driver_launch_seconds = getattr(self.driver, '_leaflow_startup_seconds', None)
+        instrument_driver(self.driver, self.metrics)
     
     def setup_driver(self):
         """设置Chrome驱动选项"""
-        chrome_options = Options()
-        
-        # GitHub Actions环境配置
-        if os.getenv('GITHUB_ACTIONS'):
-            chrome_options.add_argument('--headless')
-            chrome_options.add_argument('--no-sandbox')
-            chrome_options.add_argument('--disable-dev-shm-usage')
-            chrome_options.add_argument('--disable-gpu')
-            chrome_options.add_argument('--window-size=1920,1080')
-        
-        # 通用配置
-        chrome_options.add_argument('--disable-blink-features=AutomationControlled')
-        chrome_options.add_experimental_option("excludeSwitches", ["enable-automation"])
-        chrome_options.add_experimental_option('useAutomationExtension', False)
-        
-        self.driver = webdriver.Chrome(options=chrome_options)
-        self.driver.execute_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
+        self.driver = self.launcher.acquire() if self.launcher else create_chrome_driver()
+        apply_stealth(self.driver)
+        apply_resource_blocking(self.driver)
+    
+    def release_driver(self):
+        """释放浏览器：共享模式下只关闭上下文，否则退出浏览器"""
+        driver, self.driver = self.driver, None
+        if not driver:
+            return
+        if self.browser:
+            self.browser.close_context()
+        else:
+            quit_driver(driver)
         
-    def close_popup(self):
+    # 各角色元素的候选选择器，按优先级排列
+    POPUP_SELECTORS = [
+        "[role='dialog']",
+        ".modal.show",
+        ".el-overlay",
+        ".ant-modal-wrap",
+        "[class*='overlay']",
+        "[class*='popup']"
+    ]
+    
+    EMAIL_SELECTORS = [
+        "input[type='text']",
+        "input[type='email']",
+        "input[placeholder*='邮箱']",
+        "input[placeholder*='邮件']",
+        "input[placeholder*='email']",
+        "input[name='email']",
+        "input[name='username']"
+    ]
+    
+    LOGIN_BUTTON_SELECTORS = [
+        "//button[contains(text(), '登录')]",
+        "//button[contains(text(), 'Login')]",
+        "//button[@type='submit']",
+        "//input[@type='submit']",
+        "button[type='submit']"
+    ]
+    
+    BALANCE_SELECTORS = [
+        "//*[contains(text(), '¥') or contains(text(), '￥') or contains(text(), '元')]",
+        "//*[contains(@class, 'balance')]",
+        "//*[contains(@class, 'money')]",
+        "//*[contains(@class, 'amount')]",
+        "//button[contains(@class, 'dollar')]",
+        "//span[contains(@class, 'font-medium')]"
+    ]
+    
+    # 余额文本需同时包含数字和货币符号
+    BALANCE_PATTERN = r"([¥￥]\s*\d)|(\d\s*元)"
+    
+    BALANCE_MODES = ('auto', 'http', 'browser', 'skip', 'defer')
+    
+    # 在页面内等待余额渲染并直接返回文本，整个过程只需一次WebDriver往返
+    BALANCE_SCRIPT = """
+        const [selectors, pattern, timeoutMs, done] = arguments;
+        const regex = new RegExp(pattern);
+        const find = () => {
+            for (const selector of selectors) {
+                let nodes = [];
+                try {
+                    if (selector.startsWith('//')) {
+                        const snapshot = document.evaluate(selector, document, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+                        for (let k = 0; k < snapshot.snapshotLength; k++) nodes.push(snapshot.snapshotItem(k));
+                    } else {
+                        nodes = document.querySelectorAll(selector);
+                    }
+                } catch (e) {
+                    continue;
+                }
+                for (const el of nodes) {
+                    const text = (el.innerText || '').trim();
+                    if (text && text.length < 100 && regex.test(text)) return text;
+                }
+            }
+            return null;
+        };
+        const started = Date.now();
+        (function poll() {
+            const text = find();
+            if (text || Date.now() - started > timeoutMs) return done(text);
+            setTimeout(poll, 100);
+        })();
+    """
+    
+    LOGIN_ERROR_SELECTORS = [".error", ".alert-danger", "[class*='error']", "[class*='danger']"]
+    
+    CHECKIN_INDICATORS = [
+        "button.checkin-btn",  # 优先使用这个选择器
+        "//button[contains(text(), '立即签到')]",
+        "//button[contains(text(), '已签到')]",
+        "//*[contains(text(), '每日签到')]",
+        "//*[contains(text(), '签到')]"
+    ]
+    
+    CHECKIN_BUTTON_SELECTORS = [
+        "button.checkin-btn",
+        "//button[contains(text(), '立即签到')]",
+        "//button[contains(@class, 'checkin')]",
+        "button[type='submit']",
+        "button[name='checkin']"
+    ]
+    
+    RESULT_SELECTORS = [
+        ".alert-success",
+        ".success",
+        ".message",
+        "[class*='success']",
+        "[class*='message']",
+        ".modal-content",  # 弹窗内容
+        ".ant-message",    # Ant Design 消息
+        ".el-message",     # Element UI 消息
+        ".toast",          # Toast消息
+        ".notification"    # 通知
+    ]
+    
+    # 结果消息中表示签到结果的关键字，有多条消息时优先返回包含这些关键字的
+    RESULT_KEYWORDS = ["成功", "获得", "恭喜", "已签到", "连续签到", "完成", "失败"]
+    
+    # 点击签到前安装：记录之后出现或变化的提示消息（含一闪而过的toast）以及签到按钮状态的变化
+    RESULT_OBSERVER_SCRIPT = """
+        const selectors = arguments[0].join(',');
+        const state = {messages: [], buttonDoneAt: null};
+        const record = el => {
+            const text = (el.innerText || el.textContent || '').trim();
+            if (text && text.length < 100 && !state.messages.includes(text)) state.messages.push(text);
+        };
+        const scan = node => {
+            if (!(node instanceof Element)) return;
+            if (node.matches(selectors)) record(node);
+            node.querySelectorAll(selectors).forEach(record);
+            const owner = node.closest(selectors);
+            if (owner && owner !== node) record(owner);
+        };
+        const checkButton = () => {
+            const btn = document.querySelector('button.checkin-btn');
+            if (!state.buttonDoneAt && btn &&
+                    (btn.disabled || btn.textContent.includes('已签到') || btn.className.includes('disabled'))) {
+                state.buttonDoneAt = Date.now();
+            }
+        };
+        new MutationObserver(mutations => {
+            for (const m of mutations) {
+                if (m.type === 'childList') m.addedNodes.forEach(scan);
+                else scan(m.type === 'characterData' ? m.target.parentElement : m.target);
+            }
+            checkButton();
+        }).observe(document.documentElement, {
+            childList: true, subtree: true, characterData: true,
+            attributes: true, attributeFilter: ['class', 'style', 'disabled']
+        });
+        window.__leaflowResult = state;
+    """
+    
+    # 等待观察到的结果：有消息立即返回，只有按钮状态变化时再等一小段时间看是否有消息；页面已跳转时返回navigated
+    RESULT_WAIT_SCRIPT = """
+        const [timeoutMs, settleMs, done] = arguments;
+        const started = Date.now();
+        (function poll() {
+            const state = window.__leaflowResult;
+            if (!state) return done({navigated: true});
+            if (state.messages.length) return done({messages: state.messages});
+            if (state.buttonDoneAt && Date.now() - state.buttonDoneAt >= settleMs) return done({buttonDone: true});
+            if (Date.now() - started > timeoutMs) return done({});
+            setTimeout(poll, 50);
+        })();
+    """
+    
+    # 站点限流或出错时错误页标题中的关键字
+    ERROR_PAGE_MARKERS = (
+        '429', 'too many requests', '502', 'bad gateway', '503', 'service unavailable',
+        '504', 'gateway timeout', '请求过于频繁'
+    )
+    
+    @property
+    def waiter(self):
+        return PageWaiter(self.driver)
+    
+    def open_page(self, url, action):
+        """经过全局限速后打开登录页或签到页，并把页面耗时和是否为错误页反馈给限速器"""
+        if not self.limiter:
+            self.driver.get(url)
+            return
+        self.limiter.acquire(action)
+        start = time.perf_counter()
+        try:
+            self.driver.get(url)
+        except TimeoutException:
+            self.limiter.report(ok=False, reason="页面加载超时")
+            raise
+        title = self.driver.title or ''
+        error_page = any(marker in title.lower() for marker in self.ERROR_PAGE_MARKERS)
+        self.limiter.report(ok=not error_page, seconds=time.perf_counter() - start, reason=f"错误页: {title[:50]}")
+    
+    def close_popup(self, deadline):
         """关闭初始弹窗"""
         try:
             logger.info("尝试关闭初始弹窗...")
-            time.sleep(3)  # 等待弹窗加载
+            
+            # 弹窗出现或页面网络空闲即可继续，无需固定等待
+            try:
+                self.waiter.until(
+                    lambda d: self.waiter.find_visible(self.POPUP_SELECTORS) or self.waiter.is_network_idle(),
+                    deadline, cap=3
+                )
+            except TimeoutException:
+                pass
+            popup = self.waiter.find_visible(self.POPUP_SELECTORS)
             
             # 尝试关闭弹窗
             try:
-                actions = ActionChains(self.driver)
-                actions.move_by_offset(10, 10).click().perform()
-                logger.info("已成功关闭弹窗")
-                time.sleep(2)
-                return True
+                if hasattr(self.driver, 'click_at'):
+                    self.driver.click_at(10, 10)
+                else:
+                    actions = ActionChains(self.driver)
+                    actions.move_by_offset(10, 10).click().perform()
             except:
-                pass
-            return False
+                return False
             
+            if popup:
+                try:
+                    self.waiter.gone(self.POPUP_SELECTORS, deadline, cap=2)
+                except TimeoutException:
+                    logger.warning("弹窗未能关闭，继续登录")
+                    return False
+            logger.info("已成功关闭弹窗")
+            return True
+        
         except Exception as e:
             logger.warning(f"关闭弹窗时出错: {e}")
             return False
@@ -90,336 +1903,291 @@ class LeaflowAutoCheckin:
     def login(self):
         """执行登录流程"""
         logger.info(f"开始登录流程")
+        deadline = Deadline(self.phase_timeout)
         
         # 访问登录页面
-        self.driver.get("https://leaflow.net/login")
-        time.sleep(5)
+        self.open_page(f"{LEAFLOW_URL}/login", '登录')
+        self.waiter.dom_ready(deadline)
         
         # 关闭弹窗
-        self.close_popup()
+        self.close_popup(deadline)
         
         # 输入邮箱
         try:
             logger.info("查找邮箱输入框...")
             
-            # 等待页面稳定
-            time.sleep(2)
-            
-            # 尝试多种选择器找到邮箱输入框
-            email_selectors = [
-                "input[type='text']",
-                "input[type='email']", 
-                "input[placeholder*='邮箱']",
-                "input[placeholder*='邮件']",
-                "input[placeholder*='email']",
-                "input[name='email']",
-                "input[name='username']"
-            ]
-            
-            email_input = None
-            for selector in email_selectors:
-                try:
-                    email_input = self.wait_for_element_clickable(By.CSS_SELECTOR, selector, 5)
-                    logger.info(f"找到邮箱输入框")
-                    break
-                except:
-                    continue
-            
-            if not email_input:
-                raise Exception("找不到邮箱输入框")
+            try:
+                email_input = self.waiter.visible(self.EMAIL_SELECTORS, deadline, clickable=True, role='email_input')
+            except TimeoutException:
+                raise SelectorNotFoundError("找不到邮箱输入框")
+            logger.info(f"找到邮箱输入框")
             
             # 清除并输入邮箱
             email_input.clear()
             email_input.send_keys(self.email)
             logger.info("邮箱输入完成")
-            time.sleep(2)
-            
+        
         except Exception as e:
             logger.error(f"输入邮箱时出错: {e}")
             # 尝试使用JavaScript直接设置值
             try:
-                self.driver.execute_script(f"document.querySelector('input[type=\"text\"], input[type=\"email\"]').value = '{self.email}';")
+                self.driver.execute_script(
+                    "document.querySelector('input[type=\"text\"], input[type=\"email\"]').value = arguments[0];",
+                    self.email
+                )
                 logger.info("通过JavaScript设置邮箱")
-                time.sleep(2)
             except:
-                raise Exception(f"无法输入邮箱: {e}")
+                raise CheckinError(f"无法输入邮箱: {e}", classify_failure(e))
         
         # 等待密码输入框出现并输入密码
         try:
             logger.info("查找密码输入框...")
             
             # 等待密码框出现
-            password_input = self.wait_for_element_clickable(
-                By.CSS_SELECTOR, "input[type='password']", 10
-            )
+            password_input = self.waiter.visible(["input[type='password']"], deadline, clickable=True)
             
             password_input.clear()
             password_input.send_keys(self.password)
             logger.info("密码输入完成")
-            time.sleep(1)
-            
+        
         except TimeoutException:
-            raise Exception("找不到密码输入框")
+            raise SelectorNotFoundError("找不到密码输入框")
         
         # 点击登录按钮
         try:
             logger.info("查找登录按钮...")
-            login_btn_selectors = [
-                "//button[contains(text(), '登录')]",
-                "//button[contains(text(), 'Login')]",
-                "//button[@type='submit']",
-                "//input[@type='submit']",
-                "button[type='submit']"
-            ]
-            
-            login_btn = None
-            for selector in login_btn_selectors:
-                try:
-                    if selector.startswith("//"):
-                        login_btn = self.wait_for_element_clickable(By.XPATH, selector, 5)
-                    else:
-                        login_btn = self.wait_for_element_clickable(By.CSS_SELECTOR, selector, 5)
-                    logger.info(f"找到登录按钮")
-                    break
-                except:
-                    continue
-            
-            if not login_btn:
-                raise Exception("找不到登录按钮")
+            try:
+                login_btn = self.waiter.visible(self.LOGIN_BUTTON_SELECTORS, deadline, clickable=True, role='login_button')
+            except TimeoutException:
+                raise SelectorNotFoundError("找不到登录按钮")
+            logger.info(f"找到登录按钮")
             
             login_btn.click()
             logger.info("已点击登录按钮")
-            
+        
         except Exception as e:
-            raise Exception(f"点击登录按钮失败: {e}")
+            raise CheckinError(f"点击登录按钮失败: {e}", classify_failure(e))
         
         # 等待登录完成
         try:
-            WebDriverWait(self.driver, 20).until(
-                lambda driver: "dashboard" in driver.current_url or "workspaces" in driver.current_url or "login" not in driver.current_url
+            self.waiter.until(
+                lambda driver: "dashboard" in driver.current_url or "workspaces" in driver.current_url or "login" not in driver.current_url,
+                deadline
             )
             
-            # 检查当前URL确认登录成功
             current_url = self.driver.current_url
-            if "dashboard" in current_url or "workspaces" in current_url or "login" not in current_url:
-                logger.info(f"登录成功，当前URL: {current_url}")
-                return True
-            else:
-                raise Exception("登录后未跳转到正确页面")
-                
+            logger.info(f"登录成功，当前URL: {current_url}")
+            return True
+        
         except TimeoutException:
             # 检查是否登录失败
-            try:
-                error_selectors = [".error", ".alert-danger", "[class*='error']", "[class*='danger']"]
-                for selector in error_selectors:
-                    try:
-                        error_msg = self.driver.find_element(By.CSS_SELECTOR, selector)
-                        if error_msg.is_displayed():
-                            raise Exception(f"登录失败: {error_msg.text}")
-                    except:
-                        continue
-                raise Exception("登录超时，无法确认登录状态")
-            except Exception as e:
-                raise e
+            error_msg = self.waiter.find_visible(self.LOGIN_ERROR_SELECTORS, with_text=True)
+            if error_msg:
+                raise InvalidCredentialsError(f"登录失败: {error_msg.text}")
+            raise PageTimeoutError("登录超时，无法确认登录状态")
     
     def get_balance(self):
-        """获取当前账号的总余额"""
+        """在浏览器中打开仪表板，页面内等待余额出现后一次取回"""
         try:
             logger.info("获取账号余额...")
             
             # 跳转到仪表板页面
-            self.driver.get("https://leaflow.net/dashboard")
-            time.sleep(3)
+            self.driver.get(f"{LEAFLOW_URL}/dashboard")
             
-            # 等待页面加载
-            WebDriverWait(self.driver, 10).until(
-                EC.presence_of_element_located((By.TAG_NAME, "body"))
+            text = self.driver.execute_async_script(
+                self.BALANCE_SCRIPT, self.BALANCE_SELECTORS, self.BALANCE_PATTERN, 10000
             )
-            
-            # 尝试多种选择器查找余额元素
-            balance_selectors = [
-                "//*[contains(text(), '¥') or contains(text(), '￥') or contains(text(), '元')]",
-                "//*[contains(@class, 'balance')]",
-                "//*[contains(@class, 'money')]",
-                "//*[contains(@class, 'amount')]",
-                "//button[contains(@class, 'dollar')]",
-                "//span[contains(@class, 'font-medium')]"
-            ]
-            
-            for selector in balance_selectors:
-                try:
-                    elements = self.driver.find_elements(By.XPATH, selector)
-                    for element in elements:
-                        text = element.text.strip()
-                        # 查找包含数字和货币符号的文本
-                        if any(char.isdigit() for char in text) and ('¥' in text or '￥' in text or '元' in text):
-                            # 提取数字部分
-                            import re
-                            numbers = re.findall(r'\d+\.?\d*', text)
-                            if numbers:
-                                balance = numbers[0]
-                                logger.info(f"找到余额: {balance}元")
-                                return f"{balance}元"
-                except:
-                    continue
+            balance = extract_balance(text or '')
+            if balance:
+                logger.info(f"找到余额: {balance}元")
+                return f"{balance}元"
             
             logger.warning("未找到余额信息")
             return "未知"
-            
+        
         except Exception as e:
             logger.warning(f"获取余额时出错: {e}")
             return "未知"
     
-    def wait_for_checkin_page_loaded(self, max_retries=3, wait_time=20):
-        """等待签到页面完全加载，支持重试"""
-        for attempt in range(max_retries):
-            logger.info(f"等待签到页面加载，尝试 {attempt + 1}/{max_retries}，等待 {wait_time} 秒...")
-            time.sleep(wait_time)
-            
-            try:
-                # 检查页面是否包含签到相关元素
-                checkin_indicators = [
-                    "button.checkin-btn",  # 优先使用这个选择器
-                    "//button[contains(text(), '立即签到')]",
-                    "//button[contains(text(), '已签到')]",
-                    "//*[contains(text(), '每日签到')]",
-                    "//*[contains(text(), '签到')]"
-                ]
-                
-                for indicator in checkin_indicators:
-                    try:
-                        if indicator.startswith("//"):
-                            element = WebDriverWait(self.driver, 10).until(
-                                EC.presence_of_element_located((By.XPATH, indicator))
-                            )
-                        else:
-                            element = WebDriverWait(self.driver, 10).until(
-                                EC.presence_of_element_located((By.CSS_SELECTOR, indicator))
-                            )
-                        
-                        if element.is_displayed():
-                            logger.info(f"找到签到页面元素")
-                            return True
-                    except:
-                        continue
-                
-                logger.warning(f"第 {attempt + 1} 次尝试未找到签到按钮，继续等待...")
-                
-            except Exception as e:
-                logger.warning(f"第 {attempt + 1} 次检查签到页面时出错: {e}")
+    def collect_balance(self, cookies=None, engine=None):
+        """按 LEAFLOW_BALANCE 获取余额
         
-        return False
+        auto 先用登录会话直接请求仪表板，解析不到时再用浏览器；http/browser 只用其中一种；
+        skip 不获取；defer 记下会话，留到所有账号签到完成后由管理器统一获取。
+        """
+        mode = self.balance_mode
+        if mode == 'skip':
+            return BALANCE_SKIPPED
+        if mode == 'defer':
+            self.session_cookies = session_to_cookies(engine.session) if engine else cookies
+            return BALANCE_DEFERRED
+        
+        if mode in ('auto', 'http') and (engine or cookies):
+            engine = engine or HttpCheckin(cookies_to_session(cookies))
+            balance = engine.get_balance()
+            if balance != "未知" or mode == 'http' or not self.driver:
+                return balance
+            logger.info("HTTP未解析到余额，改用浏览器获取")
+        if self.driver:
+            return self.get_balance()
+        return "未知"
+    
+    def wait_for_checkin_page_loaded(self, deadline=None):
+        """等待签到页面出现签到相关元素，页面就绪后立即返回"""
+        deadline = deadline or Deadline(self.phase_timeout)
+        logger.info(f"等待签到页面加载，最多 {deadline.remaining():.0f} 秒...")
+        
+        try:
+            self.waiter.visible(self.CHECKIN_INDICATORS, deadline, role='checkin_page')
+            logger.info(f"找到签到页面元素")
+            return True
+        except TimeoutException:
+            logger.warning("等待超时，签到页面中未找到签到相关元素")
+            return False
     
-    def find_and_click_checkin_button(self):
+    def find_and_click_checkin_button(self, deadline=None):
         """查找并点击签到按钮 - 处理已签到状态"""
         logger.info("查找签到按钮...")
+        deadline = deadline or Deadline(self.phase_timeout)
         
-        try:
-            # 先等待页面可能的重载
-            time.sleep(5)
-            
-            # 使用和单账号成功时相同的选择器
-            checkin_selectors = [
-                "button.checkin-btn",
-                "//button[contains(text(), '立即签到')]",
-                "//button[contains(@class, 'checkin')]",
-                "button[type='submit']",
-                "button[name='checkin']"
-            ]
-            
-            for selector in checkin_selectors:
-                try:
-                    if selector.startswith("//"):
-                        checkin_btn = WebDriverWait(self.driver, 15).until(
-                            EC.presence_of_element_located((By.XPATH, selector))
-                        )
-                    else:
-                        checkin_btn = WebDriverWait(self.driver, 15).until(
-                            EC.presence_of_element_located((By.CSS_SELECTOR, selector))
-                        )
-                    
-                    if checkin_btn.is_displayed():
-                        # 检查按钮文本，如果包含"已签到"则说明今天已经签到过了
-                        btn_text = checkin_btn.text.strip()
-                        if "已签到" in btn_text:
-                            logger.info("伙计，今日你已经签到过了！")
-                            return "already_checked_in"
-                        
-                        # 检查按钮是否可用
-                        if checkin_btn.is_enabled():
-                            logger.info(f"找到并点击立即签到按钮")
-                            checkin_btn.click()
-                            return True
-                        else:
-                            logger.info("签到按钮不可用，可能已经签到过了")
-                            return "already_checked_in"
-                        
-                except Exception as e:
-                    logger.debug(f"选择器未找到按钮: {e}")
-                    continue
+        while True:
+            try:
+                checkin_btn = self.waiter.visible(self.CHECKIN_BUTTON_SELECTORS, deadline, role='checkin_button')
+                
+                # 检查按钮文本，如果包含"已签到"则说明今天已经签到过了
+                btn_text = checkin_btn.text.strip()
+                if "已签到" in btn_text:
+                    logger.info("伙计，今日你已经签到过了！")
+                    return "already_checked_in"
+                
+                # 检查按钮是否可用
+                if checkin_btn.is_enabled():
+                    logger.info(f"找到并点击立即签到按钮")
+                    self.install_result_observer()
+                    checkin_btn.click()
+                    return True
+                else:
+                    logger.info("签到按钮不可用，可能已经签到过了")
+                    return "already_checked_in"
             
-            logger.error("找不到签到按钮")
-            return False
-                    
-        except Exception as e:
-            logger.error(f"查找签到按钮时出错: {e}")
-            return False
+            except StaleElementReferenceException:
+                # 页面在查找过程中重新渲染，重新查找按钮
+                if deadline.expired():
+                    logger.error("签到按钮不断刷新，无法点击")
+                    return False
+                continue
+            except TimeoutException:
+                logger.error("找不到签到按钮")
+                return False
+            except Exception as e:
+                logger.error(f"查找签到按钮时出错: {e}")
+                return False
     
     def checkin(self):
         """执行签到流程"""
         logger.info("跳转到签到页面...")
+        deadline = Deadline(self.phase_timeout)
         
-        # 跳转到签到页面
-        self.driver.get("https://checkin.leaflow.net")
-        
-        # 等待签到页面加载（最多重试3次，每次等待20秒）
-        if not self.wait_for_checkin_page_loaded(max_retries=3, wait_time=20):
-            raise Exception("签到页面加载失败，无法找到签到相关元素")
+        with self.metrics.phase('checkin_page_load'):
+            # 跳转到签到页面
+            self.open_page(CHECKIN_URL, '签到')
+            
+            # 等待签到页面加载，元素出现后立即继续
+            if not self.wait_for_checkin_page_loaded(deadline):
+                raise PageTimeoutError("签到页面加载失败，无法找到签到相关元素")
         
         # 查找并点击立即签到按钮
-        checkin_result = self.find_and_click_checkin_button()
+        with self.metrics.phase('button_click'):
+            checkin_result = self.find_and_click_checkin_button(deadline)
         
         if checkin_result == "already_checked_in":
             return "今日已签到"
         elif checkin_result is True:
             logger.info("已点击立即签到按钮")
-            time.sleep(5)  # 等待签到结果
             
             # 获取签到结果
-            result_message = self.get_checkin_result()
+            with self.metrics.phase('result_extraction'):
+                result_message = self.get_checkin_result()
             return result_message
         else:
-            raise Exception("找不到立即签到按钮或按钮不可点击")
+            raise SelectorNotFoundError("找不到立即签到按钮或按钮不可点击")
+    
+    def is_checkin_button_done(self):
+        """检查签到按钮是否已变为已签到状态"""
+        try:
+            checkin_btn = self.driver.find_element(By.CSS_SELECTOR, "button.checkin-btn")
+            return (not checkin_btn.is_enabled() or "已签到" in checkin_btn.text
+                    or "disabled" in (checkin_btn.get_attribute("class") or ""))
+        except Exception:
+            return False
+    
+    def install_result_observer(self):
+        """在点击签到前安装页面观察器，之后出现的结果消息即使很快消失也能被记录"""
+        try:
+            self.driver.execute_script(self.RESULT_OBSERVER_SCRIPT, [
+                selector for selector in self.RESULT_SELECTORS if not selector.startswith('//')
+            ])
+        except Exception as e:
+            logger.debug(f"安装结果观察器失败: {e}")
+    
+    def pick_result_message(self, messages):
+        """从观察到的消息中选出签到结果，优先包含结果关键字的消息"""
+        for keyword in self.RESULT_KEYWORDS:
+            for message in messages:
+                if keyword in message:
+                    return message
+        return messages[0]
+    
+    def wait_for_observed_result(self, deadline):
+        """等待观察器记录的结果，返回消息、"今日已签到完成"，页面已跳转时返回None"""
+        try:
+            observed = self.driver.execute_async_script(
+                self.RESULT_WAIT_SCRIPT, int(deadline.remaining() * 1000), 1000
+            ) or {}
+        except Exception:
+            # 等待期间页面跳转（如表单提交）会中断脚本
+            return None
+        if observed.get('messages'):
+            return self.pick_result_message(observed['messages'])
+        if observed.get('buttonDone'):
+            return "今日已签到完成"
+        if observed.get('navigated'):
+            return None
+        raise TimeoutException("未观察到签到结果")
     
     def get_checkin_result(self):
         """获取签到结果消息"""
         try:
-            # 给页面一些时间显示结果
-            time.sleep(3)
-            
-            # 尝试查找各种可能的成功消息元素
-            success_selectors = [
-                ".alert-success",
-                ".success",
-                ".message",
-                "[class*='success']",
-                "[class*='message']",
-                ".modal-content",  # 弹窗内容
-                ".ant-message",    # Ant Design 消息
-                ".el-message",     # Element UI 消息
-                ".toast",          # Toast消息
-                ".notification"    # 通知
-            ]
+            deadline = Deadline(self.result_timeout)
+            
+            # 页面内的观察器在结果出现时立即返回，只需一次往返
+            try:
+                result = self.wait_for_observed_result(deadline)
+                if result:
+                    return result
+            except TimeoutException:
+                deadline = Deadline(0)
+            
+            # 点击后页面发生了跳转，在新页面中查找结果
+            button_done_at = []
             
-            for selector in success_selectors:
+            def probe(driver):
+                element = self.waiter.find_visible(self.RESULT_SELECTORS, with_text=True, role='checkin_result')
+                if element:
+                    return element.text.strip()
+                # 按钮状态先变化时，再给提示消息一点时间出现
+                if self.is_checkin_button_done():
+                    if not button_done_at:
+                        button_done_at.append(time.monotonic())
+                    if time.monotonic() - button_done_at[0] >= 1:
+                        return "今日已签到完成"
+                return False
+            
+            if not deadline.expired():
                 try:
-                    element = self.driver.find_element(By.CSS_SELECTOR, selector)
-                    if element.is_displayed():
-                        text = element.text.strip()
-                        if text:
-                            return text
-                except:
-                    continue
+                    return self.waiter.until(probe, deadline)
+                except TimeoutException:
+                    pass
             
             # 如果没有找到特定元素，检查页面文本
             page_text = self.driver.find_element(By.TAG_NAME, "body").text
@@ -433,60 +2201,437 @@ class LeaflowAutoCheckin:
                         if keyword in line and len(line.strip()) < 100:  # 避免提取过长的文本
                             return line.strip()
             
-            # 检查签到按钮状态变化
-            try:
-                checkin_btn = self.driver.find_element(By.CSS_SELECTOR, "button.checkin-btn")
-                if not checkin_btn.is_enabled() or "已签到" in checkin_btn.text or "disabled" in checkin_btn.get_attribute("class"):
-                    return "今日已签到完成"
-            except:
-                pass
-            
             return "签到完成，但未找到具体结果消息"
-            
+        
         except Exception as e:
             return f"获取签到结果时出错: {str(e)}"
     
+    def abort(self):
+        """强制结束浏览器进程树，用于中断卡住的账号
+        
+        不经过WebDriver，因此不会被卡住的调用阻塞；进程结束后卡住的调用会立即出错返回。
+        """
+        self.aborted = True
+        driver, self.driver = self.driver, None
+        if self.browser:
+            # 共享浏览器被整体结束，下一个账号会自动重启它
+            self.browser.kill()
+        elif driver:
+            try:
+                kill_driver(driver)
+            except Exception as e:
+                logger.warning(f"强制结束浏览器时出错: {e}")
+    
+    def load_session_cookies(self):
+        """读取并校验缓存的会话Cookie，无效时返回None"""
+        if not self.session_store:
+            return None
+        
+        cookies = self.session_store.load(self.email)
+        if not cookies:
+            return None
+        
+        if not is_session_valid(cookies):
+            logger.info("缓存的会话已过期，需要重新登录")
+            self.session_store.delete(self.email)
+            return None
+        return cookies
+    
+    def restore_session(self, cookies):
+        """把缓存的Cookie写入浏览器，成功返回True"""
+        try:
+            self.driver.execute_cdp_cmd("Network.setCookies", {"cookies": cookies})
+        except Exception as e:
+            logger.warning(f"恢复会话Cookie失败: {e}")
+            return False
+        
+        logger.info("已使用缓存的会话，跳过登录")
+        return True
+    
+    def run_http(self, cookies):
+        """使用HTTP引擎完成签到，页面结构变化或请求失败时返回None以回退到浏览器"""
+        engine = HttpCheckin(cookies_to_session(cookies), limiter=self.limiter)
+        try:
+            with self.metrics.phase('http_checkin'):
+                result = engine.checkin()
+        except (CheckinProtocolError, requests.RequestException) as e:
+            logger.warning(f"HTTP签到失败，回退到浏览器签到: {e}")
+            return None
+        
+        with self.metrics.phase('balance'):
+            balance = self.collect_balance(engine=engine)
+        self.session_store.save(self.email, session_to_cookies(engine.session))
+        logger.info(f"签到结果: {result}, 余额: {balance}")
+        return True, result, balance
+    
+    def browser_cookies(self):
+        """读取当前浏览器的全部Cookie，失败时返回None"""
+        try:
+            return self.driver.execute_cdp_cmd("Network.getAllCookies", {})["cookies"]
+        except Exception as e:
+            logger.warning(f"读取浏览器Cookie失败: {e}")
+            return None
+    
+    def save_session(self, cookies=None):
+        """保存当前浏览器的登录Cookie"""
+        if not self.session_store or not self.driver:
+            return
+        cookies = cookies or self.browser_cookies()
+        if cookies:
+            self.session_store.save(self.email, cookies)
+    
     def run(self):
         """单个账号执行流程"""
         try:
             logger.info(f"开始处理账号")
             
-            # 登录
-            if self.login():
+            with self.metrics.phase('session_check'):
+                cookies = self.load_session_cookies()
+            if cookies and self.http_checkin:
+                outcome = self.run_http(cookies)
+                if outcome:
+                    return outcome
+            
+            self.ensure_driver()
+            
+            # 优先复用缓存的会话，失效时才执行完整登录
+            logged_in = cookies is not None and self.restore_session(cookies)
+            if not logged_in:
+                with self.metrics.phase('login'):
+                    logged_in = self.login()
+                if logged_in:
+                    self.save_session()
+            
+            if logged_in:
                 # 签到
                 result = self.checkin()
+                # 签到后会话可能被刷新，重新保存，同一份Cookie也用于HTTP读取余额
+                cookies = self.browser_cookies() if self.session_store or self.balance_mode != 'browser' else None
+                self.save_session(cookies)
                 
-                # 获取余额
-                balance = self.get_balance()
+                # 获取余额的同时在后台预启动下一个账号的浏览器
+                if self.launcher:
+                    self.launcher.prelaunch()
+                with self.metrics.phase('balance'):
+                    balance = self.collect_balance(cookies)
                 
                 logger.info(f"签到结果: {result}, 余额: {balance}")
                 return True, result, balance
             else:
-                raise Exception("登录失败")
+                raise CheckinError("登录失败")
                 
         except Exception as e:
+            self.failure_class = classify_failure(e)
             error_msg = f"自动签到失败: {str(e)}"
-            logger.error(error_msg)
+            logger.error(f"{error_msg}（{self.failure_class}）")
             return False, error_msg, "未知"
         
         finally:
             if self.driver:
-                self.driver.quit()
+                self.metrics.add_network(collect_network_stats(self.driver))
+            self.release_driver()
+
+def parse_bool(value):
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in ('1', 'true', 'yes', 'on')
+
+# 账号文件中可单独设置的参数，未设置时使用环境变量中的全局值
+ACCOUNT_OVERRIDES = {
+    'account_timeout': float,
+    'phase_timeout': float,
+    'result_timeout': float,
+    'http_checkin': parse_bool,
+    # 常驻模式下该账号每天的签到时间（HH:MM，北京时间）
+    'schedule': str
+}
+
+def shard_of(email, shard_count):
+    """按邮箱哈希把账号分配到分片，结果只取决于邮箱本身，与账号顺序和总数无关"""
+    digest = hashlib.sha256(email.strip().lower().encode('utf-8')).hexdigest()
+    return int(digest[:8], 16) % shard_count
+
+def read_account_file(path, key=None):
+    """逐条读取账号文件，支持 JSON Lines（.jsonl）和 CSV（.csv，首行为表头）
+    
+    以 .enc 结尾的文件（如 accounts.jsonl.enc）是用 LEAFLOW_ACCOUNTS_KEY 加密的，整体解密后再逐条解析；
+    未加密的文件按行流式读取，不会一次性载入内存。
+    """
+    encrypted = path.endswith('.enc')
+    name = path[:-len('.enc')] if encrypted else path
+    
+    if encrypted:
+        if not key:
+            raise ValueError(f"账号文件 {path} 已加密，请设置 LEAFLOW_ACCOUNTS_KEY")
+        with open(path, 'rb') as f:
+            stream = io.StringIO(decrypt_account_data(f.read(), key, path).decode('utf-8'))
+    else:
+        stream = open(path, encoding='utf-8', newline='')
+    
+    with stream:
+        if name.endswith('.csv'):
+            for line_no, row in enumerate(csv.DictReader(stream), 2):
+                # 只去掉表头和邮箱两侧的空白，密码中的首尾空格也是密码的一部分，必须原样保留
+                record = {k.strip(): v for k, v in row.items() if k and v}
+                if 'email' in record:
+                    record['email'] = record['email'].strip()
+                yield line_no, record
+        elif name.endswith('.jsonl'):
+            for line_no, line in enumerate(stream, 1):
+                line = line.strip()
+                if not line or line.startswith('#'):
+                    continue
+                try:
+                    yield line_no, json.loads(line)
+                except ValueError as e:
+                    logger.warning(f"账号文件第 {line_no} 行不是有效的JSON，已跳过: {e}")
+        else:
+            raise ValueError(f"不支持的账号文件格式: {path}（仅支持 .jsonl 和 .csv）")
+
+def parse_account_record(record, line_no):
+    """校验账号文件中的一条记录并转换单账号参数，无效时返回None"""
+    email = str(record.get('email', '')).strip()
+    password = str(record.get('password', ''))
+    if not email or not password:
+        logger.warning(f"账号文件第 {line_no} 行缺少邮箱或密码，已跳过")
+        return None
+    
+    account = {'email': email, 'password': password}
+    for name, convert in ACCOUNT_OVERRIDES.items():
+        if record.get(name) in (None, ''):
+            continue
+        try:
+            account[name] = convert(record[name])
+        except (TypeError, ValueError):
+            logger.warning(f"账号文件第 {line_no} 行的 {name} 无效，使用全局设置")
+    return account
+
+# 加密账号文件的首行保存密钥派生用的盐，之后是Fernet密文
+ACCOUNT_FILE_SALT_HEADER = b'leaflow-salt:'
+
+def encrypt_account_file(path, key):
+    """加密账号文件，生成可提交到仓库的 <path>.enc"""
+    salt = os.urandom(SALT_BYTES)
+    with open(path, 'rb') as f:
+        token = fernet_from_key(key, salt).encrypt(f.read())
+    with open(f"{path}.enc", 'wb') as f:
+        f.write(ACCOUNT_FILE_SALT_HEADER + base64.urlsafe_b64encode(salt) + b'\n' + token)
+    return f"{path}.enc"
+
+def decrypt_account_data(data, key, path):
+    """解密账号文件内容，兼容不带盐的旧格式"""
+    if not data.startswith(ACCOUNT_FILE_SALT_HEADER):
+        logger.warning(f"账号文件 {path} 使用旧的加密格式，请用 encrypt-accounts 重新加密")
+        return legacy_fernet_from_key(key).decrypt(data)
+    header, token = data.split(b'\n', 1)
+    salt = base64.urlsafe_b64decode(header[len(ACCOUNT_FILE_SALT_HEADER):])
+    return fernet_from_key(key, salt).decrypt(token)
+
+class RateLimiter:
+    """所有工作线程共享的令牌桶，限制登录和签到请求的速率
+    
+    站点返回 429/5xx、错误页或响应过慢时成倍降速，恢复正常后逐步提速（AIMD）。
+    """
+    
+    # 多个线程几乎同时遇到同一次故障时只降速一次
+    DECREASE_COOLDOWN = 2.0
+    
+    def __init__(self, rate=1.0, burst=2, min_rate=0.05, max_rate=5.0, slow_seconds=8.0):
+        self.rate = rate
+        self.burst = burst
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.slow_seconds = slow_seconds
+        self.step = rate * 0.25
+        self.waits = 0
+        self.wait_seconds = 0.0
+        self.decreases = 0
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._last_decrease = 0.0
+        self._lock = threading.Lock()
+    
+    @classmethod
+    def from_env(cls):
+        """LEAFLOW_RATE_LIMIT 为初始速率（次/秒），设为 0 或 off 时不限速"""
+        value = os.getenv('LEAFLOW_RATE_LIMIT', '1').strip().lower()
+        if value in ('', '0', 'off', 'false', 'no'):
+            return None
+        rate = float(value)
+        return cls(
+            rate=rate,
+            burst=max(1, int(os.getenv('LEAFLOW_RATE_BURST', '2') or 2)),
+            min_rate=min(rate, float(os.getenv('LEAFLOW_RATE_MIN', '0.05') or 0.05)),
+            max_rate=max(rate, float(os.getenv('LEAFLOW_RATE_MAX', '5') or 5)),
+            slow_seconds=float(os.getenv('LEAFLOW_SLOW_RESPONSE', '8') or 8)
+        )
+    
+    def acquire(self, action):
+        """取得一个令牌，必要时等待，返回等待的秒数"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            # 先预留令牌再等待，并发线程按到达顺序依次排开
+            self._tokens -= 1
+            wait = max(-self._tokens / self.rate if self._tokens < 0 else 0.0, self._paused_until - now)
+            if wait > 0:
+                self.waits += 1
+                self.wait_seconds += wait
+            rate = self.rate
+        
+        if wait >= 1:
+            logger.info(f"限速等待 {wait:.1f} 秒（{action}，当前速率 {rate:.2f} 次/秒）")
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+    
+    def report(self, ok=True, seconds=None, retry_after=None, reason=None):
+        """反馈一次请求的结果，据此调整速率
+        
+        reason 描述失败的原因（状态码、错误页等），请求成功但过慢时日志给出实际耗时。
+        """
+        slow = seconds is not None and seconds > self.slow_seconds
+        with self._lock:
+            old_rate = self.rate
+            now = time.monotonic()
+            if retry_after:
+                self._paused_until = max(self._paused_until, now + retry_after)
+            if ok and not slow:
+                self.rate = min(self.max_rate, self.rate + self.step)
+                return
+            if now - self._last_decrease < self.DECREASE_COOLDOWN:
+                return
+            self._last_decrease = now
+            self.decreases += 1
+            self.rate = max(self.min_rate, self.rate * (0.75 if ok else 0.5))
+        if ok:
+            reason = f"响应过慢: {seconds:.1f} 秒"
+        else:
+            reason = reason or "请求失败"
+        logger.warning(f"限速降低: {old_rate:.2f} -> {self.rate:.2f} 次/秒（{reason}）")
+    
+    def stats(self):
+        with self._lock:
+            return {
+                'rate': round(self.rate, 3),
+                'waits': self.waits,
+                'wait_seconds': round(self.wait_seconds, 3),
+                'decreases': self.decreases
+            }
+
+def retry_after_seconds(response):
+    """解析 Retry-After 响应头（秒数形式），没有时返回None"""
+    try:
+        return float(response.headers.get('Retry-After', ''))
+    except ValueError:
+        return None
+
+def read_deferred_balance(cookies):
+    """用签到时保存的会话读取余额，返回 (余额, 失败原因)"""
+    try:
+        return HttpCheckin(cookies_to_session(cookies)).read_balance(), None
+    except Exception as e:
+        return "未知", str(e) or type(e).__name__
 
 class MultiAccountManager:
     """多账号管理器 - 简化配置版本"""
     
-    def __init__(self):
+    def __init__(self, shard_index=None, shard_count=None, accounts_file=None, force=False, load_only=False):
+        """load_only 为True时只解析配置和账号，不打开通知、会话缓存、账本和历史库（用于检查配置等命令）"""
         self.telegram_bot_token = os.getenv('TELEGRAM_BOT_TOKEN', '')
         self.telegram_chat_id = os.getenv('TELEGRAM_CHAT_ID', '')
+        self.notifier = None if load_only else TelegramNotifier.from_env()
+        # 多个运行器（如 workflow matrix）各自处理一个分片，所有分片合起来正好覆盖全部账号
+        self.shard_count = int(shard_count or os.getenv('LEAFLOW_SHARD_COUNT', '1') or 1)
+        self.shard_index = int(shard_index if shard_index is not None else os.getenv('LEAFLOW_SHARD_INDEX', '0') or 0)
+        if self.shard_count < 1 or not 0 <= self.shard_index < self.shard_count:
+            raise ValueError(f"分片参数无效: 第 {self.shard_index} 片 / 共 {self.shard_count} 片")
+        self.accounts_file = accounts_file or os.getenv('LEAFLOW_ACCOUNTS_FILE', '').strip()
+        # 使用远程WebDriver时默认并发数等于所有端点的槽位总数
+        remote = RemoteWebDriverPool.shared()
+        self.concurrency = max(1, int(os.getenv('LEAFLOW_CONCURRENCY', '') or (remote.capacity if remote else 1)))
+        self.account_timeout = float(os.getenv('LEAFLOW_ACCOUNT_TIMEOUT', '600') or 600)
+        # 可重试的失败（页面超时、浏览器崩溃、网络错误等）最多尝试的次数及首次重试前的等待
+        self.max_attempts = max(1, int(os.getenv('LEAFLOW_MAX_ATTEMPTS', '3') or 3))
+        self.retry_backoff = float(os.getenv('LEAFLOW_RETRY_BACKOFF', '15') or 15)
+        # 被看门狗强制结束的账号每次都会耗满整个时间预算，单独限制其尝试次数
+        self.max_timeout_attempts = max(1, int(os.getenv('LEAFLOW_TIMEOUT_ATTEMPTS', '2') or 2))
+        self.shared_browser = os.getenv('LEAFLOW_SHARED_BROWSER', '').lower() in ('1', 'true', 'yes')
+        self._local = threading.local()
+        self._browsers = []
+        self._browsers_lock = threading.Lock()
+        self._launchers = []
+        self._pending = 0
+        self._done = 0
+        self._succeeded = 0
+        self.session_store = None if load_only else SessionStore.from_env()
+        self.metrics = RunMetrics.from_env()
+        self.ledger = None if load_only else CheckinLedger.from_env()
+        self.history = None if load_only else HistoryStore.from_env()
+        # 每个账号最终那次尝试的 (尝试次数, 失败类型, 指标记录)，运行结束后写入历史
+        self._final_attempts = {}
+        # 所有工作线程共享，代替账号之间的固定等待
+        self.limiter = None if load_only else RateLimiter.from_env()
+        # 多节点共享的租约队列（LEAFLOW_QUEUE），同一天的运行共用一个队列
+        self.queue = None if load_only else LeaseQueue.from_env()
+        self.queue_run = os.getenv('LEAFLOW_QUEUE_RUN', '').strip() or CheckinLedger.today()
+        self.lease_seconds = float(os.getenv('LEAFLOW_QUEUE_LEASE', '300') or 300)
+        # LEAFLOW_BALANCE=defer 时各账号的会话Cookie，签到全部完成后统一读取余额
+        self._deferred_cookies = {}
+        # 常驻模式下的预热浏览器池，为None时每次运行结束都关闭浏览器
+        self.browser_pool = None
+        self._total = 0
+        # force 时忽略账本，今天已完成的账号也重新处理
+        self.force = force
         self.accounts = self.load_accounts()
     
+    def in_shard(self, email):
+        return self.shard_count == 1 or shard_of(email, self.shard_count) == self.shard_index
+    
     def load_accounts(self):
-        """从环境变量加载多账号信息，支持冒号分隔多账号和单账号"""
+        """加载账号并只保留当前分片的账号"""
+        accounts = self.load_all_accounts()
+        if self.shard_count == 1:
+            return accounts
+        
+        accounts = [account for account in accounts if self.in_shard(account['email'])]
+        logger.info(f"分片 {self.shard_index + 1}/{self.shard_count}: 分配到 {len(accounts)} 个账号")
+        return accounts
+    
+    def load_file_accounts(self):
+        """从账号文件逐条读取账号，不属于当前分片的记录在解析前就被跳过"""
+        key = os.getenv('LEAFLOW_ACCOUNTS_KEY', '')
+        accounts = []
+        seen = set()
+        for line_no, record in read_account_file(self.accounts_file, key):
+            email = str(record.get('email', '')).strip()
+            if email and not self.in_shard(email):
+                continue
+            account = parse_account_record(record, line_no)
+            if not account:
+                continue
+            if account['email'].lower() in seen:
+                logger.warning(f"账号文件第 {line_no} 行的账号重复，已跳过")
+                continue
+            seen.add(account['email'].lower())
+            accounts.append(account)
+        return accounts
+    
+    def load_all_accounts(self):
+        """从账号文件或环境变量加载多账号信息，支持账号文件、冒号分隔多账号和单账号"""
         accounts = []
         
         logger.info("开始加载账号配置...")
         
+        # 方法0: 账号文件（JSON Lines / CSV，可加密）
+        if self.accounts_file:
+            logger.info(f"从账号文件加载: {self.accounts_file}")
+            accounts = self.load_file_accounts()
+            logger.info(f"从账号文件成功加载了 {len(accounts)} 个账号")
+            return accounts
+        
         # 方法1: 冒号分隔多账号格式
         accounts_str = os.getenv('LEAFLOW_ACCOUNTS', '').strip()
         if accounts_str:
@@ -538,102 +2683,747 @@ class MultiAccountManager:
         logger.error("请检查以下环境变量设置:")
         logger.error("1. LEAFLOW_ACCOUNTS: 冒号分隔多账号 (email1:pass1,email2:pass2)")
         logger.error("2. LEAFLOW_EMAIL 和 LEAFLOW_PASSWORD: 单账号")
+        logger.error("3. LEAFLOW_ACCOUNTS_FILE: 账号文件 (.jsonl / .csv，可加密为 .enc)")
         
         raise ValueError("未找到有效的账号配置")
     
+    def send_already_done_notification(self, count):
+        """所有账号今天都已签到时发送的简短通知"""
+        if not self.notifier:
+            return
+        current_date = datetime.now().strftime("%Y/%m/%d")
+        text = (
+            f"🎁 Leaflow自动签到通知\n"
+            f"✅ 全部 {count} 个账号今天都已签到，本次运行未重复签到\n"
+            f"📅 签到时间：{current_date}\n"
+        )
+        if self.notifier.send([text]):
+            logger.info("Telegram通知发送成功")
+        else:
+            logger.error("Telegram通知发送失败")
+    
     def send_notification(self, results):
         """发送汇总通知到Telegram - 按照指定模板格式"""
-        if not self.telegram_bot_token or not self.telegram_chat_id:
+        if not self.notifier:
             logger.info("Telegram配置未设置，跳过通知")
             return
         
         try:
-            # 构建通知消息
+            # 构建通知消息，每个账号一个消息块，超长时按账号拆分为多条消息
             success_count = sum(1 for _, success, _, _ in results if success)
             total_count = len(results)
             current_date = datetime.now().strftime("%Y/%m/%d")
             
-            message = f"🎁 Leaflow自动签到通知\n"
-            message += f"📊 成功: {success_count}/{total_count}\n"
-            message += f"📅 签到时间：{current_date}\n\n"
+            header = (
+                f"🎁 Leaflow自动签到通知\n"
+                f"📊 成功: {success_count}/{total_count}\n"
+                f"📅 签到时间：{current_date}\n\n"
+            )
+            blocks = [header]
             
             for email, success, result, balance in results:
                 # 隐藏邮箱部分字符以保护隐私
-                masked_email = email[:3] + "***" + email[email.find("@"):]
+                masked_email = escape(mask_email(email))
                 
                 if success:
                     status = "✅"
-                    message += f"账号：{masked_email}\n"
-                    message += f"{status}  {result}！\n"
-                    message += f"💰  当前总余额：{balance}。\n\n"
+                    blocks.append(
+                        f"账号：{masked_email}\n"
+                        f"{status}  {escape(str(result))}！\n"
+                        f"💰  当前总余额：{escape(str(balance))}。\n\n"
+                    )
                 else:
                     status = "❌"
-                    message += f"账号：{masked_email}\n"
-                    message += f"{status}  {result}\n\n"
-            
-            url = f"https://api.telegram.org/bot{self.telegram_bot_token}/sendMessage"
-            data = {
-                "chat_id": self.telegram_chat_id,
-                "text": message,
-                "parse_mode": "HTML"
-            }
+                    blocks.append(
+                        f"账号：{masked_email}\n"
+                        f"{status}  {escape(str(result))}\n\n"
+                    )
             
-            response = requests.post(url, data=data, timeout=10)
-            if response.status_code == 200:
+            if self.notifier.send(blocks):
                 logger.info("Telegram汇总通知发送成功")
             else:
-                logger.error(f"Telegram通知发送失败: {response.text}")
+                logger.error("Telegram通知发送失败")
                 
         except Exception as e:
             logger.error(f"发送Telegram通知时出错: {e}")
     
-    def run_all(self):
-        """运行所有账号的签到流程"""
-        logger.info(f"开始执行 {len(self.accounts)} 个账号的签到任务")
+    def progress_text(self, finished=False):
+        """实时进度消息的内容"""
+        title = "🏁 Leaflow签到已完成" if finished else "⏳ Leaflow签到进行中"
+        return (
+            f"{title}\n"
+            f"📊 进度: {self._done}/{self._total}\n"
+            f"✅ 成功: {self._succeeded}  ❌ 失败: {self._done - self._succeeded}"
+        )
+    
+    def report_progress(self, success):
+        """记录一个账号完成，更新实时进度（只更新内存状态，不会阻塞工作线程）"""
+        with self._browsers_lock:
+            self._done += 1
+            if success:
+                self._succeeded += 1
+            text = self.progress_text()
+        if self.notifier:
+            self.notifier.update_live(text)
+    
+    def run_all(self, accounts=None, notify=True):
+        """运行所有账号（或指定的部分账号）的签到流程，notify为False时不发送通知"""
+        accounts = self.accounts if accounts is None else accounts
+        if not accounts:
+            logger.info("当前分片没有需要处理的账号")
+            return True, []
         
-        results = []
+        logger.info(f"开始执行 {len(accounts)} 个账号的签到任务")
+        self.metrics = RunMetrics.from_env()
         
-        for i, account in enumerate(self.accounts, 1):
-            logger.info(f"处理第 {i}/{len(self.accounts)} 个账号")
-            
-            try:
-                auto_checkin = LeaflowAutoCheckin(account['email'], account['password'])
-                success, result, balance = auto_checkin.run()
-                results.append((account['email'], success, result, balance))
-                
-                # 在账号之间添加间隔，避免请求过于频繁
-                if i < len(self.accounts):
-                    wait_time = 5
-                    logger.info(f"等待{wait_time}秒后处理下一个账号...")
-                    time.sleep(wait_time)
-                    
-            except Exception as e:
-                error_msg = f"处理账号时发生异常: {str(e)}"
-                logger.error(error_msg)
-                results.append((account['email'], False, error_msg, "未知"))
+        # 今天已经完成的账号直接使用账本中的结果，不再启动浏览器；共享队列模式下由队列记录完成状态
+        completed = {}
+        if self.ledger and not self.force and not self.queue:
+            completed = self.ledger.completed(account['email'] for account in accounts)
+            for email, (status, message, balance) in completed.items():
+                if balance == BALANCE_DEFERRED:
+                    # 上次运行在读取延迟余额之前就中断了
+                    logger.warning(f"账号 {mask_email(email)} 的余额读取失败，记为未知: 上次运行没有读取到余额")
+                    completed[email] = (status, message, "未知")
+        pending = [account for account in accounts if account['email'] not in completed]
+        self.metrics.already_done = len(completed)
+        if completed:
+            logger.info(f"签到账本中今天已完成 {len(completed)} 个账号，本次处理剩余 {len(pending)} 个")
+        if not pending:
+            logger.info("所有账号今天都已完成签到，无需重复运行")
+            # 仍然发送简短通知并记录本次运行，重复触发的运行也能被看到
+            if notify:
+                with self.metrics.phase('notification'):
+                    self.send_already_done_notification(len(completed))
+            self.metrics.export()
+            return True, [
+                (account['email'], True, completed[account['email']][1], completed[account['email']][2])
+                for account in accounts
+            ]
+        
+        # 清理之前被终止的运行遗留的浏览器进程
+        reap_orphans()
+        
+        self._total = len(accounts)
+        self._pending = len(pending)
+        self._done = self._succeeded = len(completed)
+        if self.notifier and notify:
+            self.notifier.start_live(self.progress_text())
+        
+        work = None
+        if self.queue:
+            self.queue.seed(self.queue_run, [CheckinLedger.account_key(account['email']) for account in pending])
+            work = LeasedRetryQueue(pending, self.queue, self.queue_run, self.lease_seconds)
+            logger.info(f"从共享队列 {self.queue_run} 领取账号，节点 {work.owner}")
+        try:
+            if self.concurrency > 1:
+                results = self.run_concurrent(pending, work)
+            else:
+                results = self.run_sequential(pending, work)
+        finally:
+            self.close_browsers()
+        
+        results = self.fill_deferred_balances(results)
+        self.record_history([result for result in results if result])
+        if work:
+            results = self.merge_queue_results(pending, results, work)
+            notify = notify and self.queue.claim_summary(self.queue_run, work.owner, work.started)
+            if not notify:
+                logger.info("汇总通知由其他节点发送")
+        
+        # 按原始顺序合并本次结果和账本中的结果
+        results = iter(results)
+        results = [
+            (account['email'], True, completed[account['email']][1], completed[account['email']][2])
+            if account['email'] in completed else next(results)
+            for account in accounts
+        ]
+        
+        SelectorStats.shared().save()
+        
+        if self.limiter:
+            self.metrics.limiter = self.limiter.stats()
+            logger.info(
+                f"限速统计: 当前速率 {self.metrics.limiter['rate']} 次/秒，等待 {self.metrics.limiter['waits']} 次"
+                f"（共 {self.metrics.limiter['wait_seconds']:.1f} 秒），降速 {self.metrics.limiter['decreases']} 次"
+            )
+        
+        network = self.metrics.network_totals()
+        if network:
+            logger.info(
+                f"网络统计: 请求 {network['requests']} 个，传输 {network['transferred_bytes'] / 1024:.0f} KB，"
+                f"精简模式拦截 {network['blocked_requests']} 个请求"
+            )
+            if network.get('static_requests'):
+                logger.info(
+                    f"静态资源缓存: 命中 {network['cache_hits']}/{network['static_requests']} "
+                    f"（{network['cache_hits'] / network['static_requests']:.0%}），"
+                    f"约节省 {network['cache_saved_bytes'] / 1024:.0f} KB"
+                )
+        
+        remote = RemoteWebDriverPool.shared()
+        if remote:
+            for endpoint in remote.stats():
+                logger.info(
+                    f"远程WebDriver {endpoint['endpoint']}: 会话 {endpoint['sessions']} 个，失败 {endpoint['errors']} 次，"
+                    f"健康检查延迟 {endpoint['latency_ms']} ms，会话创建 {endpoint['startup_seconds']} 秒"
+                    f"{'' if endpoint['healthy'] else '（已移出轮换）'}"
+                )
         
         # 发送汇总通知
-        self.send_notification(results)
+        if notify:
+            with self.metrics.phase('notification'):
+                if self.notifier:
+                    self.notifier.finish_live(self.progress_text(finished=True))
+                self.send_notification(results)
+        self.metrics.export()
         
         # 返回总体结果
         success_count = sum(1 for _, success, _, _ in results if success)
-        return success_count == len(self.accounts), results
+        return success_count == len(accounts), results
+    
+    def close(self):
+        """释放管理器持有的资源"""
+        if self.browser_pool:
+            self.browser_pool.close()
+        if self.ledger:
+            self.ledger.close()
+        if self.history:
+            self.history.close()
+        if self.queue:
+            self.queue.close()
+    
+    def record_history(self, results):
+        """把本次处理的账号结果追加到历史记录"""
+        final_attempts, self._final_attempts = self._final_attempts, {}
+        if not self.history:
+            return
+        rows = []
+        for email, success, _, balance in results:
+            attempts, failure_class, record = final_attempts.get(email, (1, 'timeout', None))
+            rows.append((email, success, None if success else failure_class or 'error', balance_value(balance), attempts, record))
+        self.history.append(self.metrics.run_id, rows)
+    
+    def merge_queue_results(self, accounts, results, work):
+        """合并本节点和其他节点在共享队列中的结果，本节点稍后读取到的延迟余额也写回队列"""
+        shared = self.queue.results(self.queue_run)
+        merged = []
+        for account, result in zip(accounts, results):
+            key = CheckinLedger.account_key(account['email'])
+            item = shared.get(key)
+            if result:
+                if item and item['balance'] != result[3]:
+                    self.queue.complete(self.queue_run, work.owner, key, queue_result(result))
+            elif item:
+                result = (account['email'], item['success'], item['message'], item['balance'])
+                if item['balance'] == BALANCE_DEFERRED:
+                    # 处理该账号的节点没能写回余额
+                    result = result[:3] + ("未知",)
+                    logger.warning(f"账号 {mask_email(account['email'])} 的余额读取失败，记为未知: 处理节点没有写回余额")
+            else:
+                result = (account['email'], False, "共享队列中没有该账号的结果", "未知")
+            merged.append(result)
+        logger.info(f"共享队列: 本节点处理了 {sum(1 for result in results if result)}/{len(merged)} 个账号")
+        return merged
+    
+    def fill_deferred_balances(self, results):
+        """defer 模式下，所有账号签到完成后再用各自的会话并发读取余额，不占用浏览器时间
+        
+        读取失败或没有可用会话的账号记为"未知"并记录原因，"待获取"不会留在最终结果中。
+        """
+        results = list(results)
+        pending = []
+        for index, result in enumerate(results):
+            if not result or result[3] != BALANCE_DEFERRED:
+                continue
+            cookies = self._deferred_cookies.pop(result[0], None)
+            if cookies:
+                pending.append((index, cookies))
+            else:
+                results[index] = self.settle_deferred_balance(result, "未知", "没有可用的登录会话")
+        self._deferred_cookies.clear()
+        if not pending:
+            return results
+        
+        from concurrent.futures import ThreadPoolExecutor
+        
+        logger.info(f"读取 {len(pending)} 个账号的余额...")
+        with self.metrics.phase('deferred_balance'):
+            with ThreadPoolExecutor(max_workers=min(8, len(pending)), thread_name_prefix='balance') as executor:
+                balances = executor.map(lambda item: read_deferred_balance(item[1]), pending)
+                for (index, _), (balance, reason) in zip(pending, balances):
+                    results[index] = self.settle_deferred_balance(results[index], balance, reason)
+        return results
+    
+    def settle_deferred_balance(self, result, balance, reason=None):
+        """写入延迟读取的余额，读取失败时记录原因"""
+        email, success, message, _ = result
+        if reason:
+            logger.warning(f"账号 {mask_email(email)} 的余额读取失败，记为未知: {reason}")
+        self.record_ledger(email, success, message, balance)
+        return email, success, message, balance
+    
+    def get_browser(self):
+        """获取当前工作线程专用的共享浏览器，未启用共享模式时返回None"""
+        if not self.shared_browser:
+            return None
+        browser = getattr(self._local, 'browser', None)
+        if browser is None:
+            browser = self.browser_pool.acquire() if self.browser_pool else SharedBrowser()
+            self._local.browser = browser
+            with self._browsers_lock:
+                self._browsers.append(browser)
+        return browser
+    
+    def get_launcher(self):
+        """获取当前工作线程的浏览器启动器，共享浏览器模式下不需要"""
+        if self.shared_browser:
+            return None
+        launcher = getattr(self._local, 'launcher', None)
+        if launcher is None:
+            launcher = BrowserLauncher(has_pending=lambda: self._pending > 0)
+            self._local.launcher = launcher
+            with self._browsers_lock:
+                self._launchers.append(launcher)
+        return launcher
+    
+    def close_browsers(self):
+        """关闭所有共享浏览器和未使用的预启动浏览器，有浏览器池时把共享浏览器归还到池中"""
+        with self._browsers_lock:
+            browsers, self._browsers = self._browsers, []
+            launchers, self._launchers = self._launchers, []
+            # 丢弃各线程持有的浏览器引用，下次运行重新分配
+            self._local = threading.local()
+        for browser in browsers:
+            if self.browser_pool:
+                self.browser_pool.release(browser)
+            else:
+                browser.quit()
+        for launcher in launchers:
+            launcher.close()
+        # 被强制中断的账号或退出失败的浏览器可能留下进程（池中的浏览器需要保留）
+        if not self.browser_pool:
+            reap_orphans(include_own=True)
+    
+    def record_ledger(self, email, success, result, balance, failure_class=None):
+        """把账号的最终结果写入签到账本"""
+        if not self.ledger:
+            return
+        if success:
+            status = 'already_checked_in' if result == "今日已签到" else 'success'
+            self.ledger.record(email, status, result, balance=balance)
+        else:
+            self.ledger.record(email, 'failed', result, failure_class or 'error')
+    
+    def run_attempt(self, account, attempt, on_start=None):
+        """处理账号的一次尝试，返回 (结果, 失败类型, 指标)，任何异常都转换为失败结果"""
+        with self._browsers_lock:
+            self._pending -= 1
+        if self.ledger:
+            self.ledger.record(account['email'], 'running')
+        auto_checkin = None
+        try:
+            auto_checkin = LeaflowAutoCheckin(
+                account['email'], account['password'],
+                browser=self.get_browser(), session_store=self.session_store,
+                launcher=self.get_launcher(),
+                http_checkin=account.get('http_checkin'),
+                phase_timeout=account.get('phase_timeout'),
+                result_timeout=account.get('result_timeout'),
+                limiter=self.limiter
+            )
+            auto_checkin.metrics.attempt = attempt
+            if on_start:
+                on_start(auto_checkin)
+            success, result, balance = auto_checkin.run()
+            if auto_checkin.session_cookies:
+                self._deferred_cookies[account['email']] = auto_checkin.session_cookies
+            if auto_checkin.aborted:
+                timeout = account.get('account_timeout', self.account_timeout)
+                return (account['email'], False, f"处理账号超时（超过 {timeout} 秒）", "未知"), 'timeout', auto_checkin.metrics
+            return (account['email'], success, result, balance), auto_checkin.failure_class, auto_checkin.metrics
+        except Exception as e:
+            error_msg = f"处理账号时发生异常: {str(e)}"
+            logger.error(error_msg)
+            metrics = auto_checkin.metrics if auto_checkin else None
+            return (account['email'], False, error_msg, "未知"), classify_failure(e), metrics
+    
+    def retry_delay(self, attempt):
+        """第 attempt 次失败后的退避时间，指数增长，最长5分钟"""
+        return min(self.retry_backoff * 2 ** (attempt - 1), 300)
+    
+    def schedule_retry(self, work, index, account, attempt, result, failure_class, metrics):
+        """可重试的失败且尝试次数未用完时重新排队并返回True，否则记录最终结果并返回False"""
+        success = result[1]
+        max_attempts = min(self.max_attempts, self.max_timeout_attempts) if failure_class == 'timeout' else self.max_attempts
+        retry = (not success and failure_class not in PERMANENT_FAILURES and attempt < max_attempts)
+        if metrics:
+            self.metrics.record_account(metrics, success, None if success else result[2], failure_class, retry)
+        
+        if retry:
+            delay = self.retry_delay(attempt)
+            logger.warning(
+                f"第 {index + 1} 个账号失败（{failure_class}），{delay:.0f} 秒后重新排队，"
+                f"第 {attempt + 1}/{max_attempts} 次尝试"
+            )
+            with self._browsers_lock:
+                self._pending += 1
+            work.requeue(index, account, attempt + 1, delay)
+            return True
+        
+        if not success and failure_class in PERMANENT_FAILURES:
+            logger.error(f"第 {index + 1} 个账号失败（{failure_class}），该类失败不会重试")
+        self._final_attempts[account['email']] = (attempt, failure_class, metrics.to_dict() if metrics else None)
+        self.record_ledger(account['email'], success, result[2], result[3], failure_class)
+        self.report_progress(success)
+        return False
+    
+    def expire(self, index, auto_checkin, timeout):
+        logger.error(f"第 {index + 1} 个账号处理超过 {timeout} 秒，强制结束浏览器")
+        auto_checkin.abort()
+    
+    def run_sequential(self, accounts, work=None):
+        """逐个处理账号，失败可重试的账号排到队尾，请求频率由限速器控制；work 为共享队列时只处理领取到的账号"""
+        results = [None] * len(accounts)
+        work = work or RetryQueue(accounts)
+        
+        while True:
+            item = work.get()
+            if item is None:
+                break
+            index, account, attempt = item
+            logger.info(f"处理第 {index + 1}/{len(accounts)} 个账号" + (f"（第 {attempt} 次尝试）" if attempt > 1 else ""))
+            
+            # 看门狗：超过时间预算时强制结束浏览器，卡住的WebDriver调用随即出错返回
+            timeout = account.get('account_timeout', self.account_timeout)
+            watchdogs = []
+            
+            def on_start(auto_checkin):
+                watchdog = threading.Timer(timeout, self.expire, (index, auto_checkin, timeout))
+                watchdog.name = 'watchdog'
+                watchdog.daemon = True
+                watchdog.start()
+                watchdogs.append(watchdog)
+            
+            try:
+                result, failure_class, metrics = self.run_attempt(account, attempt, on_start)
+            finally:
+                for watchdog in watchdogs:
+                    watchdog.cancel()
+            if not self.schedule_retry(work, index, account, attempt, result, failure_class, metrics):
+                results[index] = result
+                work.done(result)
+        
+        return results
+    
+    def run_concurrent(self, accounts, work=None):
+        """使用固定数量的工作线程并发处理账号，结果按输入顺序返回；work 为共享队列时只处理领取到的账号"""
+        total = len(accounts)
+        workers = min(self.concurrency, total)
+        logger.info(f"并发模式: {workers} 个工作线程，单账号超时 {self.account_timeout} 秒")
+        
+        work = work or RetryQueue(accounts)
+        results = [None] * total
+        running = {}  # index -> (开始时间, LeaflowAutoCheckin实例, 第几次尝试)
+        lock = threading.Lock()
+        done = threading.Condition(lock)
+        
+        def worker():
+            while True:
+                item = work.get()
+                if item is None:
+                    return
+                index, account, attempt = item
+                
+                logger.info(f"处理第 {index + 1}/{total} 个账号" + (f"（第 {attempt} 次尝试）" if attempt > 1 else ""))
+                with lock:
+                    running[index] = (time.monotonic(), None, attempt)
+                
+                def on_start(auto_checkin):
+                    with lock:
+                        if index in running and running[index][2] == attempt:
+                            running[index] = (running[index][0], auto_checkin, attempt)
+                
+                result, failure_class, metrics = self.run_attempt(account, attempt, on_start)
+                with done:
+                    # 已被判定超时的尝试不再覆盖结果（该账号可能已在重试），该线程的名额已由补充线程接替
+                    if index not in running or running[index][2] != attempt:
+                        return
+                    running.pop(index)
+                if self.schedule_retry(work, index, account, attempt, result, failure_class, metrics):
+                    continue
+                with done:
+                    results[index] = result
+                # 共享队列的 done 可能要请求协调器，不能在持有锁时调用，否则会阻塞其他线程和超时检查
+                work.done(result)
+                with done:
+                    done.notify_all()
+        
+        # 守护线程：即使某个浏览器调用永久卡死，也不会阻止进程退出
+        threads = [
+            threading.Thread(target=worker, name=f"worker-{n + 1}", daemon=True)
+            for n in range(workers)
+        ]
+        for thread in threads:
+            thread.start()
+        
+        while True:
+            # 在锁内只判定超时并写入结果，队列、账本和通知的调用都在释放锁之后进行
+            with done:
+                if work.finished():
+                    break
+                done.wait(timeout=1)
+                now = time.monotonic()
+                expired = []
+                for index, (started, auto_checkin, attempt) in list(running.items()):
+                    timeout = accounts[index].get('account_timeout', self.account_timeout)
+                    if now - started < timeout:
+                        continue
+                    running.pop(index)
+                    expired.append((index, attempt, timeout, auto_checkin))
+            
+            for index, attempt, timeout, auto_checkin in expired:
+                account = accounts[index]
+                result = (account['email'], False, f"处理账号超时（超过 {timeout} 秒）", "未知")
+                logger.error(f"第 {index + 1} 个账号: {result[2]}")
+                if auto_checkin:
+                    # 关闭浏览器以打断卡住的WebDriver调用
+                    threading.Thread(target=auto_checkin.abort, daemon=True).start()
+                    metrics = auto_checkin.metrics
+                else:
+                    metrics = AccountMetrics(account['email'])
+                    metrics.attempt = attempt
+                # 超时与其他失败一样记录指标，并按 LEAFLOW_TIMEOUT_ATTEMPTS 决定是否重试
+                if not self.schedule_retry(work, index, account, attempt, result, 'timeout', metrics):
+                    with done:
+                        results[index] = result
+                    work.done(result)
+                # 补充一个工作线程，保持并发度不因卡死的线程而下降
+                if work.has_waiting():
+                    thread = threading.Thread(target=worker, name=f"worker-{len(threads) + 1}", daemon=True)
+                    threads.append(thread)
+                    thread.start()
+        
+        return results
+
+# 以数字解析的配置项及其类型，validate-config 逐一检查
+NUMERIC_SETTINGS = {
+    'LEAFLOW_CONCURRENCY': int, 'LEAFLOW_ACCOUNT_TIMEOUT': float, 'LEAFLOW_PHASE_TIMEOUT': float,
+    'LEAFLOW_RESULT_TIMEOUT': float, 'LEAFLOW_MAX_ATTEMPTS': int, 'LEAFLOW_RETRY_BACKOFF': float,
+    'LEAFLOW_RATE_BURST': int, 'LEAFLOW_RATE_MIN': float, 'LEAFLOW_RATE_MAX': float, 'LEAFLOW_SLOW_RESPONSE': float,
+    'LEAFLOW_BROWSER_MAX_ACCOUNTS': int, 'LEAFLOW_BROWSER_MAX_RSS_MB': float, 'LEAFLOW_SESSION_MAX_AGE_DAYS': float,
+    'LEAFLOW_SHARD_INDEX': int, 'LEAFLOW_SHARD_COUNT': int, 'LEAFLOW_POOL_SIZE': int, 'LEAFLOW_SCHEDULE_JITTER': float,
+    'LEAFLOW_QUEUE_LEASE': float, 'LEAFLOW_REMOTE_WAIT': float, 'LEAFLOW_TIMEOUT_ATTEMPTS': int
+}
+
+def validate_config(args):
+    """检查环境变量和账号配置，返回 (问题列表, 只加载了配置的管理器)，无法加载账号时管理器为None"""
+    problems = []
+    for name, convert in NUMERIC_SETTINGS.items():
+        value = os.getenv(name, '').strip()
+        try:
+            if value:
+                convert(value)
+        except ValueError:
+            problems.append(f"{name}={value} 不是有效的数字")
+    
+    rate = os.getenv('LEAFLOW_RATE_LIMIT', '').strip().lower()
+    if rate and rate not in ('0', 'off', 'false', 'no'):
+        try:
+            float(rate)
+        except ValueError:
+            problems.append(f"LEAFLOW_RATE_LIMIT={rate} 不是有效的数字")
+    
+    balance_mode = os.getenv('LEAFLOW_BALANCE', '').strip().lower()
+    if balance_mode and balance_mode not in LeaflowAutoCheckin.BALANCE_MODES:
+        problems.append(f"LEAFLOW_BALANCE={balance_mode} 无效，可选: {', '.join(LeaflowAutoCheckin.BALANCE_MODES)}")
+    
+    backend = os.getenv('LEAFLOW_BACKEND', '').strip().lower()
+    if backend and backend not in BROWSER_BACKENDS:
+        problems.append(f"LEAFLOW_BACKEND={backend} 无效，可选: {', '.join(BROWSER_BACKENDS)}")
+    
+    try:
+        remote = RemoteWebDriverPool.parse(os.getenv('LEAFLOW_REMOTE_WEBDRIVERS', ''))
+    except ValueError as e:
+        problems.append(str(e))
+        remote = None
+    if remote and backend == 'cdp':
+        problems.append("LEAFLOW_BACKEND=cdp 只能控制本机Chrome，不能与 LEAFLOW_REMOTE_WEBDRIVERS 同时使用")
+    
+    schedule = os.getenv('LEAFLOW_SCHEDULE', '').strip()
+    if schedule and not CheckinDaemon.parse_time(schedule):
+        problems.append(f"LEAFLOW_SCHEDULE={schedule} 不是 HH:MM 格式")
+    if problems:
+        return problems, None
+    
+    try:
+        manager = MultiAccountManager(args.shard_index, args.shard_count, args.accounts_file, load_only=True)
+    except Exception as e:
+        problems.append(f"无法加载账号: {e}")
+        return problems, None
+    
+    for account in manager.accounts:
+        if account.get('schedule') and not CheckinDaemon.parse_time(account['schedule']):
+            problems.append(f"账号 {mask_email(account['email'])} 的 schedule={account['schedule']} 不是 HH:MM 格式")
+    
+    if bool(manager.telegram_bot_token) != bool(manager.telegram_chat_id):
+        problems.append("TELEGRAM_BOT_TOKEN 和 TELEGRAM_CHAT_ID 需要同时设置")
+    
+    emails = [account['email'].lower() for account in manager.accounts]
+    if len(set(emails)) != len(emails):
+        problems.append("存在重复的账号")
+    return problems, manager
+
+def command_run(args):
+    manager = MultiAccountManager(args.shard_index, args.shard_count, args.accounts_file, args.force)
+    if args.daemon:
+        daemon = CheckinDaemon(manager, BrowserPool(int(os.getenv('LEAFLOW_POOL_SIZE', '0') or 0) or manager.concurrency))
+        signal.signal(signal.SIGTERM, daemon.stop)
+        signal.signal(signal.SIGINT, daemon.stop)
+        daemon.run()
+        return 0
+    
+    try:
+        overall_success, detailed_results = manager.run_all()
+    finally:
+        manager.close()
+    
+    if overall_success:
+        logger.info("✅ 所有账号签到成功")
+    else:
+        success_count = sum(1 for _, success, _, _ in detailed_results if success)
+        logger.warning(f"⚠️ 部分账号签到失败: {success_count}/{len(detailed_results)} 成功")
+    # 即使有失败，也不退出错误状态，因为可能部分成功
+    return 0
+
+def command_validate_config(args):
+    problems, manager = validate_config(args)
+    for problem in problems:
+        logger.error(f"❌ {problem}")
+    if problems:
+        return 1
+    logger.info(
+        f"✅ 配置有效: {len(manager.accounts)} 个账号（分片 {manager.shard_index + 1}/{manager.shard_count}），"
+        f"并发 {manager.concurrency}，{'共享浏览器' if manager.shared_browser else '独立浏览器'}，"
+        f"Telegram通知{'已启用' if manager.telegram_bot_token else '未启用'}"
+    )
+    return 0
+
+def command_status(args):
+    ledger = CheckinLedger.from_env()
+    if not ledger:
+        logger.error("未启用签到账本（LEAFLOW_LEDGER_DB）")
+        return 1
+    try:
+        results = ledger.day_results()
+    finally:
+        ledger.close()
+    
+    counts = {}
+    for status, *_ in results.values():
+        counts[status] = counts.get(status, 0) + 1
+    print(f"{CheckinLedger.today()} 签到状态: " + ('，'.join(f"{status} {count}" for status, count in sorted(counts.items())) or '暂无记录'))
+    
+    try:
+        accounts = MultiAccountManager(args.shard_index, args.shard_count, args.accounts_file, load_only=True).accounts
+    except ValueError:
+        # 没有账号配置时只能输出汇总
+        return 0
+    for account in accounts:
+        status, message, failure_class, balance, updated_at = results.get(
+            CheckinLedger.account_key(account['email']), ('pending', None, None, None, None)
+        )
+        updated = datetime.fromtimestamp(updated_at, CheckinLedger.TIMEZONE).strftime('%H:%M:%S') if updated_at else '-'
+        detail = message or ''
+        if failure_class:
+            detail += f"（{failure_class}）"
+        if balance:
+            detail += f"，余额 {balance}"
+        print(f"  {mask_email(account['email'])}: {status} {updated} {detail}".rstrip())
+    return 0
+
+def command_report(args):
+    history = HistoryStore.from_env()
+    if not history:
+        logger.error("未启用历史记录（LEAFLOW_HISTORY_DB）")
+        return 1
+    try:
+        print(format_report(history.report(args.days, args.top), args.top))
+    finally:
+        history.close()
+    return 0
+
+def command_queue_server(args):
+    """为多主机运行提供共享队列的HTTP协调器"""
+    queue = LeaseQueue(args.db)
+    token = os.getenv('LEAFLOW_QUEUE_TOKEN', '')
+    server = make_queue_server(queue, args.listen, token)
+    signal.signal(signal.SIGTERM, lambda *_: threading.Thread(target=server.shutdown).start())
+    logger.info(f"共享队列协调器: http://{args.listen}，数据库 {args.db}" + ("" if token else "（未设置 LEAFLOW_QUEUE_TOKEN，不校验身份）"))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        queue.close()
+    return 0
+
+def command_encrypt_accounts(args):
+    key = os.getenv('LEAFLOW_ACCOUNTS_KEY', '')
+    if not key:
+        logger.error("请先设置 LEAFLOW_ACCOUNTS_KEY")
+        return 1
+    logger.info(f"已生成加密账号文件: {encrypt_account_file(args.path, key)}")
+    return 0
+
+COMMANDS = {
+    'run': command_run,
+    'validate-config': command_validate_config,
+    'status': command_status,
+    'report': command_report,
+    'encrypt-accounts': command_encrypt_accounts,
+    'queue-server': command_queue_server
+}
+
+def parse_args(argv=None):
+    accounts = argparse.ArgumentParser(add_help=False)
+    accounts.add_argument('--accounts-file', help='账号文件路径（.jsonl / .csv，加密文件以 .enc 结尾），也可用 LEAFLOW_ACCOUNTS_FILE 设置')
+    accounts.add_argument('--shard-index', type=int, help='当前分片序号，从 0 开始，也可用 LEAFLOW_SHARD_INDEX 设置')
+    accounts.add_argument('--shard-count', type=int, help='分片总数，也可用 LEAFLOW_SHARD_COUNT 设置')
+    
+    parser = argparse.ArgumentParser(description='Leaflow 多账号自动签到，不指定命令时执行 run')
+    commands = parser.add_subparsers(dest='command', metavar='命令')
+    
+    run = commands.add_parser('run', parents=[accounts], help='执行签到（默认）')
+    run.add_argument('--daemon', action='store_true', help='常驻运行，每天按 LEAFLOW_SCHEDULE 定时签到并提供状态接口')
+    run.add_argument('--force', action='store_true', help='忽略签到账本，今天已完成的账号也重新处理')
+    
+    commands.add_parser('validate-config', parents=[accounts], help='检查环境变量和账号配置，不访问网络')
+    commands.add_parser('status', parents=[accounts], help='查看签到账本中今天各账号的状态')
+    
+    report = commands.add_parser('report', help='输出历史记录报表（LEAFLOW_HISTORY_DB）')
+    report.add_argument('--days', type=int, default=30, help='统计最近多少天，默认30')
+    report.add_argument('--top', type=int, default=20, help='列出失败最多的前几个账号，默认20')
+    
+    encrypt = commands.add_parser('encrypt-accounts', help='用 LEAFLOW_ACCOUNTS_KEY 加密账号文件')
+    encrypt.add_argument('path', help='要加密的账号文件')
+    
+    queue_server = commands.add_parser('queue-server', help='运行多主机共享队列的HTTP协调器（配合 LEAFLOW_QUEUE=http://...）')
+    queue_server.add_argument('--listen', default='127.0.0.1:8788', help='监听地址，默认 127.0.0.1:8788')
+    queue_server.add_argument('--db', default='.leaflow_queue.db', help='队列数据库路径，默认 .leaflow_queue.db')
+    
+    # 兼容不带命令的旧用法，如 python leaflow_checkin.py --shard-index 0 --shard-count 4
+    argv = sys.argv[1:] if argv is None else list(argv)
+    if not argv or (argv[0] not in COMMANDS and argv[0] not in ('-h', '--help')):
+        argv = ['run'] + argv
+    return parser.parse_args(argv)
 
 def main():
     """主函数"""
+    args = parse_args()
     try:
-        manager = MultiAccountManager()
-        overall_success, detailed_results = manager.run_all()
-        
-        if overall_success:
-            logger.info("✅ 所有账号签到成功")
-            exit(0)
-        else:
-            success_count = sum(1 for _, success, _, _ in detailed_results if success)
-            logger.warning(f"⚠️ 部分账号签到失败: {success_count}/{len(detailed_results)} 成功")
-            # 即使有失败，也不退出错误状态，因为可能部分成功
-            exit(0)
-            
+        exit(COMMANDS[args.command](args))
     except Exception as e:
         logger.error(f"❌ 脚本执行出错: {e}")
         exit(1)
@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+"""
+Leaflow 本地模拟站点，用于离线测试和基准测试
+提供登录页、仪表板和签到页，可配置延迟、弹窗、已签到状态和签到结果的展示方式
+
+单独运行：python mock_leaflow.py --port 8080 --checkin-port 8081
+任意邮箱使用密码 password 即可登录，密码为 wrong 时返回登录失败
+"""
+
+import time
+import json
+import random
+import secrets
+import argparse
+import threading
+from html import escape
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from http.cookies import SimpleCookie
+from urllib.parse import urlparse, parse_qs
+
+PAGE_TEMPLATE = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>{title}</title>
+<link rel="stylesheet" href="/static/app.css">
+<script src="/static/app.js"></script>
+</head>
+<body>
+{body}
+<img src="/static/banner.png" alt="">
+</body>
+</html>"""
+
+POPUP_HTML = """
+<div class="popup-overlay" style="position:fixed;inset:0;background:rgba(0,0,0,.5);z-index:999"
+     onclick="this.remove()">
+  <div style="margin:200px auto;width:300px;background:#fff;padding:20px">公告：欢迎使用 Leaflow</div>
+</div>
+"""
+
+LOGIN_BODY = """
+<h1>登录</h1>
+{error}
+<form method="post" action="/login">
+  <input type="email" name="email" placeholder="邮箱">
+  <input type="password" name="password" placeholder="密码">
+  <button type="submit">登录</button>
+</form>
+{popup}
+"""
+
+DASHBOARD_BODY = """
+<h1>仪表板</h1>
+<div class="wallet">
+  <span class="label">总余额</span>
+  <span class="font-medium">¥ {balance:.2f}</span>
+</div>
+"""
+
+CHECKIN_FORM_BODY = """
+<h1>每日签到</h1>
+{message}
+<form method="post" action="/checkin">
+  <input type="hidden" name="_token" value="{token}">
+  {button}
+</form>
+"""
+
+CHECKIN_JS_BODY = """
+<h1>每日签到</h1>
+{button}
+<script>
+fetch('/api/checkin/status', {{credentials: 'include'}})
+  .then(function (r) {{ return r.json(); }})
+  .then(function (data) {{ document.body.dataset.checkedIn = data.checked_in; }});
+document.addEventListener('click', function (event) {{
+  var btn = event.target.closest('button.checkin-btn');
+  if (!btn || btn.disabled) return;
+  fetch('/api/checkin', {{method: 'POST', credentials: 'include'}})
+    .then(function (r) {{ return r.json(); }})
+    .then(function (data) {{
+      var toast = document.createElement('div');
+      toast.className = 'toast';
+      toast.textContent = data.message;
+      document.body.appendChild(toast);
+      setTimeout(function () {{ toast.remove(); }}, {toast_ms});
+      btn.disabled = true;
+      btn.textContent = '已签到';
+    }});
+}});
+</script>
+"""
+
+
+class MockState:
+    """模拟站点的共享状态"""
+
+    def __init__(self, latency=0.0, jitter=0.0, popup=True, already_checked_in=False,
+                 checkin_mode='form', toast_ms=1500, asset_kb=64, reject_message=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.popup = popup
+        self.already_checked_in = already_checked_in
+        self.checkin_mode = checkin_mode
+        self.toast_ms = toast_ms
+        # 设置后签到接口返回 success=false 和该消息，模拟站点拒绝签到
+        self.reject_message = reject_message
+        self.asset = b'/* ' + b'x' * (asset_kb * 1024) + b' */'
+        self.sessions = {}
+        self.checked_in = set()
+        self.balances = {}
+        self.requests = 0
+        self.lock = threading.Lock()
+        self.login_url = ''
+
+    def delay(self):
+        if self.latency or self.jitter:
+            time.sleep(max(0.0, self.latency + random.uniform(-self.jitter, self.jitter)))
+
+    def is_checked_in(self, email):
+        return self.already_checked_in or email in self.checked_in
+
+    def do_checkin(self, email):
+        with self.lock:
+            if self.is_checked_in(email):
+                return False, 0.0
+            self.checked_in.add(email)
+            reward = round(random.uniform(0.1, 1.0), 2)
+            self.balances[email] = self.balances.get(email, 10.0) + reward
+            return True, reward
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    """登录站点和签到站点共用的请求处理，签到站点通过 is_checkin_site 区分"""
+
+    state = None
+    is_checkin_site = False
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_body(self, body, status=200, content_type='text/html; charset=utf-8', headers=None):
+        data = body if isinstance(body, bytes) else body.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def redirect(self, location, headers=None):
+        headers = dict(headers or {})
+        headers['Location'] = location
+        self.send_body('', status=302, headers=headers)
+
+    def page(self, title, body):
+        self.send_body(PAGE_TEMPLATE.format(title=title, body=body))
+
+    def current_email(self):
+        cookie = SimpleCookie(self.headers.get('Cookie', ''))
+        token = cookie['leaflow_session'].value if 'leaflow_session' in cookie else ''
+        return self.state.sessions.get(token)
+
+    def read_form(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        data = self.rfile.read(length).decode('utf-8') if length else ''
+        return {key: values[0] for key, values in parse_qs(data).items()}
+
+    def handle_request(self, method):
+        with self.state.lock:
+            self.state.requests += 1
+        path = urlparse(self.path).path
+        # 连接保持打开，未处理的请求体也要读完，否则会被当作下一个请求解析
+        self.form = self.read_form() if method == 'POST' else {}
+
+        if path.startswith('/static/'):
+            return self.serve_static(path)
+
+        self.state.delay()
+        if self.is_checkin_site:
+            return self.handle_checkin_site(method, path)
+        return self.handle_main_site(method, path)
+
+    def do_GET(self):
+        self.handle_request('GET')
+
+    def do_POST(self):
+        self.handle_request('POST')
+
+    def serve_static(self, path):
+        content_types = {
+            '.css': 'text/css',
+            '.js': 'application/javascript',
+            '.png': 'image/png'
+        }
+        extension = path[path.rfind('.'):]
+        body = b'' if extension == '.js' else self.state.asset
+        self.send_body(body, content_type=content_types.get(extension, 'application/octet-stream'),
+                       headers={'Cache-Control': 'public, max-age=86400'})
+
+    def handle_main_site(self, method, path):
+        if path == '/login' and method == 'POST':
+            form = self.form
+            if form.get('password') != 'password' or not form.get('email'):
+                error = '<div class="alert-danger">邮箱或密码错误</div>'
+                return self.page('登录', LOGIN_BODY.format(error=error, popup=''))
+            token = secrets.token_hex(16)
+            self.state.sessions[token] = form['email']
+            return self.redirect('/dashboard', {
+                'Set-Cookie': f'leaflow_session={token}; Path=/; HttpOnly; SameSite=Lax'
+            })
+
+        if path == '/login':
+            popup = POPUP_HTML if self.state.popup else ''
+            return self.page('登录', LOGIN_BODY.format(error='', popup=popup))
+
+        email = self.current_email()
+        if not email:
+            return self.redirect('/login')
+
+        if path in ('/', '/dashboard'):
+            balance = self.state.balances.get(email, 10.0)
+            return self.page('仪表板', DASHBOARD_BODY.format(balance=balance))
+
+        self.send_body('Not Found', status=404)
+
+    def handle_checkin_site(self, method, path):
+        email = self.current_email()
+        if not email:
+            return self.redirect(self.state.login_url)
+
+        if path == '/api/checkin/status':
+            return self.send_body(json.dumps({'checked_in': self.state.is_checked_in(email)}),
+                                  content_type='application/json')
+
+        if path == '/api/checkin' and method == 'POST':
+            if self.state.reject_message:
+                return self.send_body(json.dumps({'success': False, 'message': self.state.reject_message},
+                                                 ensure_ascii=False), content_type='application/json')
+            success, reward = self.state.do_checkin(email)
+            message = f'签到成功，获得 {reward} 元' if success else '今日已签到'
+            return self.send_body(json.dumps({'success': success, 'message': message}, ensure_ascii=False),
+                                  content_type='application/json')
+
+        if path == '/checkin' and method == 'POST':
+            success, reward = self.state.do_checkin(email)
+            message = f'签到成功，获得 {reward} 元' if success else '今日已签到'
+            return self.render_checkin(email, f'<div class="alert alert-success">{escape(message)}</div>')
+
+        if path == '/':
+            return self.render_checkin(email)
+
+        self.send_body('Not Found', status=404)
+
+    def render_checkin(self, email, message=''):
+        if self.state.is_checked_in(email):
+            button = '<button class="checkin-btn" disabled>已签到</button>'
+        else:
+            button = '<button type="submit" class="checkin-btn" name="checkin" value="1">立即签到</button>'
+
+        if self.state.checkin_mode == 'js':
+            button = button.replace('type="submit" ', '')
+            body = CHECKIN_JS_BODY.format(button=button, toast_ms=self.state.toast_ms)
+        else:
+            body = CHECKIN_FORM_BODY.format(message=message, token=secrets.token_hex(8), button=button)
+        self.page('签到', body)
+
+
+class MockLeaflow:
+    """在后台线程中同时运行登录站点和签到站点"""
+
+    def __init__(self, host='127.0.0.1', port=0, checkin_port=0, **options):
+        self.state = MockState(**options)
+        main_handler = type('MainHandler', (MockHandler,), {'state': self.state, 'is_checkin_site': False})
+        checkin_handler = type('CheckinHandler', (MockHandler,), {'state': self.state, 'is_checkin_site': True})
+        self.servers = [
+            ThreadingHTTPServer((host, port), main_handler),
+            ThreadingHTTPServer((host, checkin_port), checkin_handler)
+        ]
+        for server in self.servers:
+            server.daemon_threads = True
+        self.host = host
+        self.state.login_url = f'{self.base_url}/login'
+
+    @property
+    def base_url(self):
+        return f'http://{self.host}:{self.servers[0].server_port}'
+
+    @property
+    def checkin_url(self):
+        return f'http://{self.host}:{self.servers[1].server_port}/'
+
+    def start(self):
+        for server in self.servers:
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        for server in self.servers:
+            server.shutdown()
+            server.server_close()
+
+
+def add_mock_arguments(parser):
+    """添加模拟站点的通用命令行参数"""
+    parser.add_argument('--latency', type=float, default=0.0, help='每个页面请求的额外延迟（秒）')
+    parser.add_argument('--jitter', type=float, default=0.0, help='延迟的随机抖动（秒）')
+    parser.add_argument('--no-popup', action='store_true', help='登录页不显示弹窗')
+    parser.add_argument('--already-checked-in', action='store_true', help='所有账号都处于今日已签到状态')
+    parser.add_argument('--checkin-mode', choices=['form', 'js'], default='form',
+                        help='form: 表单提交后页面显示结果；js: 脚本请求接口并显示短暂的toast')
+    parser.add_argument('--toast-ms', type=int, default=1500, help='js模式下toast显示的毫秒数')
+    parser.add_argument('--asset-kb', type=int, default=64, help='每个静态资源的大小（KB）')
+
+
+def mock_options(args):
+    return {
+        'latency': args.latency,
+        'jitter': args.jitter,
+        'popup': not args.no_popup,
+        'already_checked_in': args.already_checked_in,
+        'checkin_mode': args.checkin_mode,
+        'toast_ms': args.toast_ms,
+        'asset_kb': args.asset_kb
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Leaflow 本地模拟站点')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080, help='登录/仪表板站点端口')
+    parser.add_argument('--checkin-port', type=int, default=8081, help='签到站点端口')
+    add_mock_arguments(parser)
+    args = parser.parse_args()
+
+    mock = MockLeaflow(args.host, args.port, args.checkin_port, **mock_options(args)).start()
+    print(f'LEAFLOW_BASE_URL={mock.base_url}')
+    print(f'LEAFLOW_CHECKIN_URL={mock.checkin_url}')
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        mock.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""账号文件读取的测试"""
+
+import pytest
+
+from leaflow_checkin import read_account_file, parse_account_record
+
+def load(path, key=None):
+    return [parse_account_record(record, line_no) for line_no, record in read_account_file(str(path), key)]
+
+def test_csv_keeps_password_verbatim(tmp_path):
+    path = tmp_path / 'accounts.csv'
+    path.write_text(' email , password ,schedule\n  a@example.com ,  p@ss word  ,08:30\nb@example.com,x,\n',
+                    encoding='utf-8')
+    assert load(path) == [
+        {'email': 'a@example.com', 'password': '  p@ss word  ', 'schedule': '08:30'},
+        {'email': 'b@example.com', 'password': 'x'}
+    ]
+
+def test_jsonl_skips_comments_and_invalid_lines(tmp_path):
+    path = tmp_path / 'accounts.jsonl'
+    path.write_text('# 注释\n{"email": "a@example.com", "password": " p ", "account_timeout": "30"}\nnot json\n\n',
+                    encoding='utf-8')
+    assert load(path) == [{'email': 'a@example.com', 'password': ' p ', 'account_timeout': 30.0}]
+
+def test_encrypted_csv(tmp_path):
+    pytest.importorskip('cryptography')
+    from leaflow_checkin import encrypt_account_file
+
+    path = tmp_path / 'accounts.csv'
+    path.write_text('email,password\na@example.com, secret \n', encoding='utf-8')
+    encrypted = encrypt_account_file(str(path), 'passphrase')
+    assert load(encrypted, 'passphrase') == [{'email': 'a@example.com', 'password': ' secret '}]
+    with pytest.raises(ValueError, match='LEAFLOW_ACCOUNTS_KEY'):
+        load(encrypted)
+
+def test_encrypted_file_uses_random_salt(tmp_path):
+    pytest.importorskip('cryptography')
+    from leaflow_checkin import encrypt_account_file, ACCOUNT_FILE_SALT_HEADER
+
+    path = tmp_path / 'accounts.jsonl'
+    path.write_text('{"email": "a@example.com", "password": "p"}\n', encoding='utf-8')
+    first = open(encrypt_account_file(str(path), 'passphrase'), 'rb').read()
+    second = open(encrypt_account_file(str(path), 'passphrase'), 'rb').read()
+    assert first.startswith(ACCOUNT_FILE_SALT_HEADER)
+    assert first.split(b'\n', 1)[0] != second.split(b'\n', 1)[0]
+    with pytest.raises(Exception):
+        load(tmp_path / 'accounts.jsonl.enc', 'wrong')
+
+def test_raw_fernet_key_and_legacy_file(tmp_path):
+    pytest.importorskip('cryptography')
+    from cryptography.fernet import Fernet
+    from leaflow_checkin import encrypt_account_file, legacy_fernet_from_key
+
+    path = tmp_path / 'accounts.jsonl'
+    path.write_text('{"email": "a@example.com", "password": "p"}\n', encoding='utf-8')
+    key = Fernet.generate_key().decode('ascii')
+    encrypted = encrypt_account_file(str(path), key)
+    token = open(encrypted, 'rb').read().split(b'\n', 1)[1]
+    assert Fernet(key).decrypt(token) == path.read_bytes()
+    assert load(encrypted, key) == [{'email': 'a@example.com', 'password': 'p'}]
+
+    # 旧版本生成的不带盐的文件仍可读取
+    legacy = tmp_path / 'legacy.jsonl.enc'
+    legacy.write_bytes(legacy_fernet_from_key('passphrase').encrypt(path.read_bytes()))
+    assert load(legacy, 'passphrase') == [{'email': 'a@example.com', 'password': 'p'}]
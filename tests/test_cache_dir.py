@@ -0,0 +1,75 @@
+"""共享磁盘缓存槽位的测试：同时运行的浏览器各锁定一个槽位，用完后留给下一个浏览器"""
+
+import sys
+import subprocess
+
+import pytest
+
+pytest.importorskip('fcntl')
+
+import leaflow_checkin
+from leaflow_checkin import acquire_cache_dir, release_cache_dir
+
+class FakeDriver:
+    def __init__(self, cache):
+        self.cache_dir, self._leaflow_cache_lock = cache
+
+@pytest.fixture
+def root(tmp_path, monkeypatch):
+    monkeypatch.setenv('LEAFLOW_CACHE_DIR', str(tmp_path / 'cache'))
+    return tmp_path / 'cache'
+
+@pytest.fixture
+def drivers():
+    started = []
+    yield started
+    for driver in started:
+        release_cache_dir(driver)
+
+def acquire(drivers):
+    driver = FakeDriver(acquire_cache_dir())
+    drivers.append(driver)
+    return driver
+
+def test_disabled_without_root(monkeypatch):
+    monkeypatch.delenv('LEAFLOW_CACHE_DIR', raising=False)
+    assert acquire_cache_dir() == (None, None)
+
+def test_concurrent_browsers_get_distinct_slots(root, drivers):
+    first, second = acquire(drivers), acquire(drivers)
+    assert first.cache_dir == str(root / 'slot-0')
+    assert second.cache_dir == str(root / 'slot-1')
+
+def test_released_slot_is_reused(root, drivers):
+    first = acquire(drivers)
+    acquire(drivers)
+    release_cache_dir(first)
+    assert first._leaflow_cache_lock is None
+    # 重复释放不出错
+    release_cache_dir(first)
+    assert acquire(drivers).cache_dir == str(root / 'slot-0')
+
+def test_slot_locked_by_other_process_is_skipped(root, drivers):
+    root.mkdir()
+    holder = subprocess.Popen(
+        [sys.executable, '-c', 'import fcntl, sys, time; f = open(sys.argv[1], "w"); '
+         'fcntl.flock(f, fcntl.LOCK_EX); print("locked", flush=True); time.sleep(60)', str(root / 'slot-0.lock')],
+        stdout=subprocess.PIPE, text=True
+    )
+    try:
+        assert holder.stdout.readline().strip() == 'locked'
+        assert acquire(drivers).cache_dir == str(root / 'slot-1')
+    finally:
+        holder.kill()
+        holder.wait()
+    # 持有锁的进程退出后槽位重新可用
+    assert acquire(drivers).cache_dir == str(root / 'slot-0')
+
+def test_exhausted_slots_run_without_cache(root, drivers, monkeypatch, caplog):
+    monkeypatch.setattr(leaflow_checkin, 'CACHE_MAX_SLOTS', 2)
+    acquire(drivers)
+    acquire(drivers)
+    assert acquire(drivers).cache_dir is None
+    assert '2 个槽位都在使用中' in caplog.text
+    release_cache_dir(drivers[0])
+    assert acquire(drivers).cache_dir == str(root / 'slot-0')
@@ -0,0 +1,203 @@
+"""
+DevTools后端测试
+
+回放测试使用 fixtures/cdp_transcript.jsonl 中从真实Chrome录制的协议消息，不需要浏览器；
+设置 CHROME_PATH 后还会启动真实Chrome，在模拟站点上完整签到一次。
+
+重新录制：CHROME_PATH=/path/to/chrome PYTHONPATH=. python tests/test_cdp.py --record
+"""
+
+import os
+import sys
+import json
+import socket
+import tempfile
+from collections import deque
+
+import pytest
+
+pytest.importorskip('selenium')
+
+from selenium.webdriver.common.by import By
+from selenium.common.exceptions import NoSuchElementException, StaleElementReferenceException
+
+import leaflow_checkin
+from leaflow import cdp
+from mock_leaflow import MockLeaflow
+
+TRANSCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'cdp_transcript.jsonl')
+
+def scenario(driver, base_url):
+    """录制和回放执行同一组操作，返回观察到的结果"""
+    seen = {}
+    leaflow_checkin.apply_stealth(driver)
+    driver.get(f'{base_url}/login')
+    seen['title'] = driver.title
+    seen['webdriver'] = driver.execute_script('return navigator.webdriver')
+
+    email = driver.find_element(By.CSS_SELECTOR, 'input[type="email"]')
+    email.send_keys('u1@example.com')
+    seen['email'] = email.get_attribute('value')
+    seen['inputs'] = len(driver.find_elements(By.TAG_NAME, 'input'))
+
+    driver.find_element(By.XPATH, '//div[contains(@class, "popup-overlay")]').click()
+    seen['popups'] = len(driver.find_elements(By.CSS_SELECTOR, '.popup-overlay'))
+
+    seen['login'] = driver.execute_async_script("""
+        const [email, done] = arguments;
+        fetch('/login', {method: 'POST', body: new URLSearchParams({email: email, password: 'password'})})
+            .then(response => done(new URL(response.url).pathname));
+    """, 'u1@example.com')
+    driver.get(f'{base_url}/dashboard')
+    seen['balance'] = driver.find_element(By.CSS_SELECTOR, '.font-medium').text
+    seen['url'] = driver.current_url
+
+    try:
+        email.get_attribute('value')
+        seen['stale'] = False
+    except StaleElementReferenceException:
+        seen['stale'] = True
+    try:
+        driver.find_element(By.ID, 'missing')
+        seen['missing'] = False
+    except NoSuchElementException:
+        seen['missing'] = True
+    seen['handles'] = len(driver.window_handles)
+    return seen
+
+def check_scenario(seen, base_url):
+    assert seen == {
+        'title': '登录',
+        'webdriver': None,
+        'email': 'u1@example.com',
+        'inputs': 2,
+        'popups': 0,
+        'login': '/dashboard',
+        'balance': '¥ 10.00',
+        'url': f'{base_url}/dashboard',
+        'stale': True,
+        'missing': True,
+        'handles': 1
+    }
+
+class ReplaySocket:
+    """按录制顺序回放DevTools消息，并核对驱动发出的每条命令"""
+
+    def __init__(self, entries):
+        self.entries = deque(entries)
+
+    def send(self, text, opcode=0x1):
+        sent = json.loads(text)
+        assert self.entries, f"录制中没有更多命令，却发送了 {sent['method']}"
+        kind, expected = self.entries.popleft()
+        assert kind == 'send', f"录制中此处应先收到消息，却发送了 {sent['method']}"
+        # 脚本正文不在录制中保存，其余字段（命令编号、会话、参数）必须完全一致
+        sent['params'].pop('expression', None)
+        assert sent == expected
+
+    def recv(self, timeout=None):
+        if not self.entries or self.entries[0][0] != 'recv':
+            raise socket.timeout()
+        return json.dumps(self.entries.popleft()[1])
+
+    def close(self):
+        pass
+
+class FinishedProcess:
+    pid = None
+
+    def wait(self, timeout=None):
+        return 0
+
+def load_transcript():
+    with open(TRANSCRIPT, 'r', encoding='utf-8') as f:
+        header = json.loads(f.readline())
+        return header, [json.loads(line) for line in f]
+
+def test_transcript_replay(monkeypatch):
+    header, entries = load_transcript()
+    replay = ReplaySocket(entries)
+    monkeypatch.setattr(cdp, 'DevToolsSocket', lambda url: replay)
+
+    driver = cdp.CdpDriver(FinishedProcess(), 'ws://127.0.0.1:9222/devtools/browser/replay')
+    check_scenario(scenario(driver, header['base_url']), header['base_url'])
+    driver.quit()
+    assert not replay.entries
+
+def test_transcript_stealth_applied_once(monkeypatch):
+    """新页面的脚本环境要在注册页面脚本之前创建，否则 apply_stealth 会在同一文档上执行两次而报错"""
+    _, entries = load_transcript()
+    methods = [message['method'] for kind, message in entries if kind == 'send']
+    assert methods.index('Runtime.evaluate') < methods.index('Page.addScriptToEvaluateOnNewDocument')
+
+@pytest.mark.skipif(not os.getenv('CHROME_PATH'), reason='需要设置 CHROME_PATH 指向本机Chrome')
+def test_real_chrome_scenario(monkeypatch):
+    monkeypatch.setenv('LEAFLOW_HEADLESS', '1')
+    mock = MockLeaflow().start()
+    options = leaflow_checkin.build_chrome_options()
+    driver = cdp.launch_cdp_driver(leaflow_checkin.find_chrome_binary(options), options, tempfile.mkdtemp())
+    try:
+        check_scenario(scenario(driver, mock.base_url), mock.base_url)
+    finally:
+        driver.quit()
+        mock.stop()
+
+@pytest.mark.skipif(not os.getenv('CHROME_PATH'), reason='需要设置 CHROME_PATH 指向本机Chrome')
+@pytest.mark.parametrize('mode', ['form', 'js'])
+def test_real_chrome_checkin(mode, monkeypatch):
+    mock = MockLeaflow(checkin_mode=mode).start()
+    monkeypatch.setattr(leaflow_checkin, 'LEAFLOW_URL', mock.base_url)
+    monkeypatch.setattr(leaflow_checkin, 'CHECKIN_URL', mock.checkin_url)
+    for name, value in {'LEAFLOW_BACKEND': 'cdp', 'LEAFLOW_HEADLESS': '1', 'LEAFLOW_HTTP_CHECKIN': 'false',
+                        'LEAFLOW_LEDGER_DB': 'off', 'LEAFLOW_HISTORY_DB': 'off'}.items():
+        monkeypatch.setenv(name, value)
+
+    account = leaflow_checkin.LeaflowAutoCheckin('u1@example.com', 'password')
+    try:
+        account.ensure_driver()
+        success, message, balance = account.run()
+    finally:
+        account.release_driver()
+        mock.stop()
+    assert success, message
+    assert '签到成功' in message
+    assert balance.endswith('元')
+
+def record():
+    """用 CHROME_PATH 指定的Chrome执行一遍测试场景并写入录制文件"""
+    entries = []
+
+    class RecordingSocket(cdp.DevToolsSocket):
+        def send(self, text, opcode=0x1):
+            if opcode == 0x1:
+                message = json.loads(text)
+                message['params'].pop('expression', None)
+                entries.append(['send', message])
+            super().send(text, opcode)
+
+        def recv(self, timeout=None):
+            text = super().recv(timeout)
+            entries.append(['recv', json.loads(text)])
+            return text
+
+    os.environ.setdefault('LEAFLOW_HEADLESS', '1')
+    cdp.DevToolsSocket = RecordingSocket
+    mock = MockLeaflow().start()
+    options = leaflow_checkin.build_chrome_options()
+    driver = cdp.launch_cdp_driver(leaflow_checkin.find_chrome_binary(options), options, tempfile.mkdtemp())
+    try:
+        check_scenario(scenario(driver, mock.base_url), mock.base_url)
+    finally:
+        driver.quit()
+        mock.stop()
+
+    os.makedirs(os.path.dirname(TRANSCRIPT), exist_ok=True)
+    with open(TRANSCRIPT, 'w', encoding='utf-8') as f:
+        f.write(json.dumps({'base_url': mock.base_url}) + '\n')
+        for entry in entries:
+            f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+    print(f"已写入 {len(entries)} 条消息到 {TRANSCRIPT}")
+
+if __name__ == '__main__':
+    if '--record' in sys.argv:
+        record()
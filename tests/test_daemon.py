@@ -0,0 +1,212 @@
+"""常驻模式的测试：每日计划和随机延迟、错过时间后的补签、每天一次的汇总通知和状态接口"""
+
+import json
+import time
+import threading
+from datetime import datetime
+from urllib.error import HTTPError
+from urllib.request import urlopen
+
+import pytest
+
+from leaflow.daemon import CheckinDaemon
+from leaflow.store import CheckinLedger, mask_email
+
+ACCOUNTS = ['a@example.com', 'b@example.com', 'c@example.com']
+
+class FakePool:
+    def __init__(self):
+        self.prewarmed = 0
+
+    def prewarm(self):
+        self.prewarmed += 1
+
+    def stats(self):
+        return {'idle': 0}
+
+class FakeManager:
+    def __init__(self, accounts, ledger=None):
+        self.accounts = accounts
+        self.ledger = ledger
+        self.force = False
+        self.limiter = None
+        self.batches = []
+        self.notifications = []
+        self.closed = False
+        self.error = None
+
+    def run_all(self, accounts, notify=True):
+        assert not notify
+        self.batches.append([account['email'] for account in accounts])
+        if self.error:
+            raise self.error
+        return True, [(account['email'], True, '签到成功', '10.00元') for account in accounts]
+
+    def send_notification(self, results):
+        self.notifications.append(results)
+
+    def close(self):
+        self.closed = True
+
+@pytest.fixture
+def env(monkeypatch):
+    monkeypatch.setenv('LEAFLOW_SCHEDULE', '08:30')
+    monkeypatch.setenv('LEAFLOW_SCHEDULE_JITTER', '600')
+    monkeypatch.setenv('LEAFLOW_STATUS_ADDR', 'off')
+    return monkeypatch
+
+def make_daemon(accounts=None, ledger=None):
+    accounts = [{'email': email, 'password': 'password'} for email in ACCOUNTS] if accounts is None else accounts
+    return CheckinDaemon(FakeManager(accounts, ledger), FakePool())
+
+def at(hour, minute, second=0):
+    return datetime(2026, 1, 2, hour, minute, second, tzinfo=CheckinLedger.TIMEZONE)
+
+def test_parse_time():
+    assert CheckinDaemon.parse_time(' 7:05 ') == (7, 5)
+    assert CheckinDaemon.parse_time('24:00') is None
+    assert CheckinDaemon.parse_time('08:60') is None
+    assert CheckinDaemon.parse_time('0805') is None
+
+def test_invalid_schedule_falls_back(env):
+    env.setenv('LEAFLOW_SCHEDULE', 'later')
+    assert make_daemon().schedule == (0, 5)
+
+def test_day_plan_spreads_accounts_within_jitter(env):
+    daemon = make_daemon()
+    assert daemon.manager.shared_browser and daemon.manager.browser_pool
+    daemon.plan_day(at(0, 0))
+    assert daemon.day == at(0, 0).date()
+    assert sorted(daemon.due) == ACCOUNTS
+    for due in daemon.due.values():
+        assert at(8, 30) <= due <= at(8, 40)
+    assert len(set(daemon.due.values())) == len(ACCOUNTS)
+
+def test_account_schedule_overrides_default(env):
+    env.setenv('LEAFLOW_SCHEDULE_JITTER', '0')
+    daemon = make_daemon([
+        {'email': ACCOUNTS[0], 'password': 'password', 'schedule': '06:15'},
+        {'email': ACCOUNTS[1], 'password': 'password', 'schedule': 'bad'},
+        {'email': ACCOUNTS[2], 'password': 'password'}
+    ])
+    daemon.plan_day(at(0, 0))
+    assert daemon.due == {ACCOUNTS[0]: at(6, 15), ACCOUNTS[1]: at(8, 30), ACCOUNTS[2]: at(8, 30)}
+
+def test_completed_accounts_are_not_planned(env, tmp_path):
+    ledger = CheckinLedger(str(tmp_path / 'ledger.db'))
+    ledger.record(ACCOUNTS[1], 'already_checked_in', '今日已签到', balance='3.00元')
+    daemon = make_daemon(ledger=ledger)
+    daemon.plan_day(datetime.now(CheckinLedger.TIMEZONE))
+    assert sorted(daemon.due) == [ACCOUNTS[0], ACCOUNTS[2]]
+    assert daemon.results == {ACCOUNTS[1]: (ACCOUNTS[1], True, '今日已签到', '3.00元')}
+    ledger.close()
+
+def test_accounts_run_in_batches_as_they_fall_due(env):
+    daemon = make_daemon()
+    daemon.plan_day(at(0, 0))
+    daemon.due = {ACCOUNTS[0]: at(8, 31), ACCOUNTS[1]: at(8, 35), ACCOUNTS[2]: at(8, 35)}
+
+    assert daemon.due_accounts(at(8, 30)) == []
+    daemon.run_batch(daemon.due_accounts(at(8, 32)))
+    assert daemon.due_accounts(at(8, 32)) == []
+    daemon.run_batch(daemon.due_accounts(at(8, 36)))
+    assert daemon.manager.batches == [[ACCOUNTS[0]], ACCOUNTS[1:]]
+    assert daemon.last_run['accounts'] == 2 and daemon.last_run['success'] == 2
+
+def test_missed_schedule_is_caught_up_in_one_batch(env):
+    # 在计划时间之后启动（或主机休眠错过了时间）时，所有过期账号立即补签
+    daemon = make_daemon()
+    daemon.plan_day(at(12, 0))
+    assert [account['email'] for account in daemon.due_accounts(at(12, 0))] == ACCOUNTS
+
+def test_batch_error_is_recorded_as_failure(env):
+    daemon = make_daemon()
+    daemon.plan_day(at(0, 0))
+    daemon.manager.error = RuntimeError('浏览器池已关闭')
+    daemon.run_batch(daemon.manager.accounts[:1])
+    assert daemon.results[ACCOUNTS[0]][1] is False
+    assert '浏览器池已关闭' in daemon.results[ACCOUNTS[0]][2]
+    assert daemon.running == set()
+
+def test_notifies_once_per_day(env):
+    daemon = make_daemon()
+    daemon.plan_day(at(0, 0))
+    daemon.run_batch(daemon.manager.accounts[1:])
+    daemon.notify_if_complete()
+    assert daemon.manager.notifications == []
+
+    daemon.run_batch(daemon.manager.accounts[:1])
+    daemon.notify_if_complete()
+    daemon.notify_if_complete()
+    assert len(daemon.manager.notifications) == 1
+    # 汇总按账号配置顺序排列，而不是完成顺序
+    assert [result[0] for result in daemon.manager.notifications[0]] == ACCOUNTS
+
+    daemon.plan_day(at(0, 0).replace(day=3))
+    assert not daemon.notified and daemon.results == {}
+
+def test_run_loop_catches_up_notifies_and_stops(env):
+    env.setenv('LEAFLOW_SCHEDULE', '00:00')
+    env.setenv('LEAFLOW_SCHEDULE_JITTER', '0')
+    daemon = make_daemon()
+    daemon.manager.send_notification = lambda results: (daemon.manager.notifications.append(results), daemon.stop())
+
+    thread = threading.Thread(target=daemon.run, daemon=True)
+    thread.start()
+    thread.join(5)
+    assert not thread.is_alive()
+    assert daemon.manager.batches == [ACCOUNTS]
+    assert len(daemon.manager.notifications) == 1
+    assert daemon.manager.browser_pool.prewarmed == 2
+    assert daemon.manager.closed
+
+def get(daemon, path):
+    host, port = daemon._server.server_address[:2]
+    try:
+        with urlopen(f'http://{host}:{port}{path}', timeout=5) as response:
+            return response.status, json.loads(response.read())
+    except HTTPError as e:
+        return e.code, json.loads(e.read())
+
+@pytest.fixture
+def served(env):
+    env.setenv('LEAFLOW_STATUS_ADDR', '127.0.0.1:0')
+    daemon = make_daemon()
+    daemon.start_status_server()
+    yield daemon
+    daemon._server.shutdown()
+
+def test_health_endpoint(served):
+    assert get(served, '/health') == (200, {'status': 'ok', 'running': False})
+
+    served.heartbeat = time.monotonic() - served.TICK_SECONDS * 5
+    assert get(served, '/health') == (503, {'status': 'stalled', 'running': False})
+
+    # 运行账号期间主循环不更新心跳，仍视为健康
+    served.running = {ACCOUNTS[0]}
+    assert get(served, '/health') == (200, {'status': 'ok', 'running': True})
+
+def test_status_endpoint(served):
+    served.plan_day(at(0, 0))
+    served.run_batch(served.manager.accounts[:1])
+    served.running = {ACCOUNTS[1]}
+
+    status, payload = get(served, '/status')
+    assert status == 200
+    assert payload['day'] == '2026-01-02'
+    assert payload['pool'] == {'idle': 0}
+    assert payload['last_run']['accounts'] == 1
+    accounts = payload['accounts']
+    assert [account['account'] for account in accounts] == [mask_email(email) for email in ACCOUNTS]
+    assert [account['status'] for account in accounts] == ['success', 'running', 'scheduled']
+    assert accounts[0]['result'] == '签到成功' and accounts[0]['balance'] == '10.00元'
+    assert accounts[2]['scheduled'] == served.due[ACCOUNTS[2]].isoformat(timespec='seconds')
+    assert ACCOUNTS[0] not in json.dumps(payload)
+
+def test_unknown_path(served):
+    assert get(served, '/metrics') == (404, {'error': 'not found'})
+
+def test_status_server_can_be_disabled(env):
+    daemon = make_daemon()
+    daemon.start_status_server()
+    assert daemon._server is None
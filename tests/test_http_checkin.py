@@ -0,0 +1,98 @@
+"""HTTP签到引擎在模拟站点上的测试，不需要浏览器"""
+
+import pytest
+
+pytest.importorskip('requests')
+
+import leaflow_checkin
+from leaflow_checkin import HttpCheckin, CheckinError, CheckinProtocolError, parse_page
+from mock_leaflow import MockLeaflow
+
+EMAIL = 'u1@example.com'
+
+@pytest.fixture
+def mock_site(request):
+    mock = MockLeaflow(checkin_mode=request.param, popup=False).start()
+    yield mock
+    mock.stop()
+
+@pytest.fixture
+def rejecting_site():
+    mock = MockLeaflow(checkin_mode='js', popup=False, reject_message='账号异常，暂不能签到').start()
+    yield mock
+    mock.stop()
+
+def login(mock):
+    leaflow_checkin.load_requests()
+    session = leaflow_checkin.requests.Session()
+    response = session.post(f'{mock.base_url}/login', data={'email': EMAIL, 'password': 'password'})
+    assert response.url.endswith('/dashboard')
+    return session
+
+def engine_for(mock, session):
+    return HttpCheckin(session, leaflow_url=mock.base_url, checkin_url=mock.checkin_url)
+
+@pytest.mark.parametrize('mock_site', ['form', 'js'], indirect=True)
+def test_checkin_and_balance(mock_site):
+    engine = engine_for(mock_site, login(mock_site))
+
+    message = engine.checkin()
+    assert message.startswith('签到成功')
+    assert mock_site.state.is_checked_in(EMAIL)
+    assert engine.get_balance() == f"{mock_site.state.balances[EMAIL]:.2f}元"
+
+    # 已签到时按钮被禁用，不会再次提交
+    requests_before = mock_site.state.requests
+    assert engine.checkin() == '今日已签到'
+    assert mock_site.state.requests == requests_before + 1
+
+@pytest.mark.parametrize('mock_site', ['form', 'js'], indirect=True)
+def test_expired_session_falls_back(mock_site):
+    leaflow_checkin.load_requests()
+    engine = engine_for(mock_site, leaflow_checkin.requests.Session())
+    with pytest.raises(CheckinProtocolError, match='登录页'):
+        engine.checkin()
+    assert not mock_site.state.is_checked_in(EMAIL)
+
+def test_rejected_json_checkin_is_a_failure(rejecting_site):
+    engine = engine_for(rejecting_site, login(rejecting_site))
+    with pytest.raises(CheckinError, match='账号异常'):
+        engine.checkin()
+    assert not rejecting_site.state.is_checked_in(EMAIL)
+
+def test_find_checkin_api():
+    page = parse_page("""
+        <meta name="csrf-token" content="abc">
+        <button class="checkin-btn">立即签到</button>
+        <script>
+          $('.checkin-btn').on('click', () => axios.post("/user/check-in", {}).then(showToast));
+        </script>
+    """)
+    assert page.csrf_token == 'abc'
+    assert HttpCheckin(None).find_checkin_api('https://checkin.example.com/', page) == 'https://checkin.example.com/user/check-in'
+
+def test_script_button_without_api():
+    page = parse_page('<button class="checkin-btn">立即签到</button><script>init();</script>')
+    with pytest.raises(CheckinProtocolError, match='签到接口'):
+        HttpCheckin(None).find_checkin_api('https://checkin.example.com/', page)
+
+def test_find_checkin_api_skips_status_requests():
+    engine = HttpCheckin(None)
+    page = parse_page("""
+        <button class="checkin-btn">立即签到</button>
+        <script>
+          fetch('/api/checkin/status').then(render);
+          btn.onclick = function () { fetch('/api/checkin', {credentials: 'include', method: 'POST'}); };
+        </script>
+    """)
+    assert engine.find_checkin_api('https://checkin.example.com/', page) == 'https://checkin.example.com/api/checkin'
+
+    page = parse_page("""
+        <button class="checkin-btn">立即签到</button>
+        <script>$.get('/checkin/today'); $.ajax({type: 'POST', url: '/checkin/do'});</script>
+    """)
+    assert engine.find_checkin_api('https://checkin.example.com/', page) == 'https://checkin.example.com/checkin/do'
+
+    page = parse_page('<button class="checkin-btn">立即签到</button><script>fetch("/api/checkin/status");</script>')
+    with pytest.raises(CheckinProtocolError, match='签到接口'):
+        engine.find_checkin_api('https://checkin.example.com/', page)
@@ -0,0 +1,46 @@
+"""精简模式的测试：默认只按URL拦截重资源，设置白名单后才按域名拦截"""
+
+import pytest
+
+pytest.importorskip('selenium')
+
+from leaflow_checkin import build_chrome_options, apply_resource_blocking, LEAN_BLOCKED_PATTERNS
+
+class RecordingDriver:
+    def __init__(self):
+        self.commands = []
+
+    def execute_cdp_cmd(self, command, params):
+        self.commands.append((command, params))
+
+def resolver_rules(options):
+    return [argument for argument in options.arguments if argument.startswith('--host-resolver-rules=')]
+
+@pytest.fixture(autouse=True)
+def lean(monkeypatch):
+    monkeypatch.setenv('LEAFLOW_LEAN', 'true')
+    monkeypatch.delenv('LEAFLOW_LEAN_ALLOW_HOSTS', raising=False)
+
+def test_default_blocks_only_heavy_urls():
+    assert resolver_rules(build_chrome_options()) == []
+
+    driver = RecordingDriver()
+    apply_resource_blocking(driver)
+    assert driver.commands == [('Network.enable', {}), ('Network.setBlockedURLs', {'urls': LEAN_BLOCKED_PATTERNS})]
+    assert '*google-analytics.com/*' in LEAN_BLOCKED_PATTERNS
+
+def test_allow_hosts_enables_resolver_allowlist(monkeypatch):
+    monkeypatch.setenv('LEAFLOW_LEAN_ALLOW_HOSTS', 'cdn.example.org, ')
+    rules = resolver_rules(build_chrome_options())
+    assert len(rules) == 1
+    assert rules[0].startswith('--host-resolver-rules=MAP * ~NOTFOUND, ')
+    assert 'EXCLUDE cdn.example.org' in rules[0]
+    assert 'EXCLUDE challenges.cloudflare.com' in rules[0]
+
+def test_off_by_default(monkeypatch):
+    monkeypatch.setenv('LEAFLOW_LEAN', 'false')
+    monkeypatch.setenv('LEAFLOW_LEAN_ALLOW_HOSTS', 'cdn.example.org')
+    assert resolver_rules(build_chrome_options()) == []
+    driver = RecordingDriver()
+    apply_resource_blocking(driver)
+    assert driver.commands == []
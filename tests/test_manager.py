@@ -0,0 +1,185 @@
+"""多账号管理器的运行流程测试，不启动浏览器"""
+
+import json
+import time
+import threading
+
+import pytest
+
+import leaflow_checkin
+from leaflow_checkin import (
+    MultiAccountManager, HttpCheckin, CheckinProtocolError, RunMetrics, AccountMetrics, BALANCE_DEFERRED
+)
+
+ACCOUNTS = ['a@example.com', 'b@example.com']
+
+class RecordingNotifier:
+    def __init__(self):
+        self.messages = []
+
+    def send(self, blocks):
+        self.messages.append(''.join(blocks))
+        return True
+
+    def start_live(self, text):
+        pass
+
+    def finish_live(self, text=None):
+        pass
+
+@pytest.fixture
+def manager(tmp_path, monkeypatch):
+    for name in ('TELEGRAM_BOT_TOKEN', 'LEAFLOW_SESSION_KEY', 'LEAFLOW_QUEUE', 'LEAFLOW_REMOTE_WEBDRIVERS',
+                 'LEAFLOW_ACCOUNTS_FILE', 'LEAFLOW_PROM_FILE'):
+        monkeypatch.delenv(name, raising=False)
+    monkeypatch.setenv('LEAFLOW_ACCOUNTS', ','.join(f'{email}:password' for email in ACCOUNTS))
+    monkeypatch.setenv('LEAFLOW_LEDGER_DB', str(tmp_path / 'ledger.db'))
+    monkeypatch.setenv('LEAFLOW_HISTORY_DB', 'off')
+    monkeypatch.setenv('LEAFLOW_METRICS_FILE', str(tmp_path / 'metrics.jsonl'))
+    manager = MultiAccountManager()
+    manager.notifier = RecordingNotifier()
+    yield manager
+    manager.close()
+
+def read_metrics(tmp_path):
+    with open(tmp_path / 'metrics.jsonl', encoding='utf-8') as f:
+        return [json.loads(line) for line in f]
+
+def test_all_done_run_still_notifies_and_records(manager, tmp_path, monkeypatch):
+    for email in ACCOUNTS:
+        manager.ledger.record(email, 'success', '签到成功', balance='10.00元')
+    # 所有账号都已完成时不应启动任何浏览器
+    monkeypatch.setattr(leaflow_checkin, 'create_chrome_driver', lambda: pytest.fail('不应启动浏览器'))
+
+    success, results = manager.run_all()
+    assert success
+    assert results == [(email, True, '签到成功', '10.00元') for email in ACCOUNTS]
+
+    assert len(manager.notifier.messages) == 1
+    assert '全部 2 个账号今天都已签到' in manager.notifier.messages[0]
+
+    summary = read_metrics(tmp_path)[-1]
+    assert summary['type'] == 'run'
+    assert summary['accounts'] == 0
+    assert summary['already_done'] == 2
+    assert 'notification' in summary['phases']
+
+def test_all_done_run_without_notify(manager, tmp_path):
+    for email in ACCOUNTS:
+        manager.ledger.record(email, 'already_checked_in', '今日已签到', balance='10.00元')
+
+    success, _ = manager.run_all(notify=False)
+    assert success
+    assert manager.notifier.messages == []
+    assert read_metrics(tmp_path)[-1]['already_done'] == 2
+
+def test_deferred_balance_never_stays_pending(manager, monkeypatch, caplog):
+    leaflow_checkin.load_requests()
+
+    def read_balance(engine):
+        if engine.session.cookies.get('session') == 'expired':
+            raise CheckinProtocolError("会话已失效，被重定向到登录页")
+        return '5.00元'
+
+    monkeypatch.setattr(HttpCheckin, 'read_balance', read_balance)
+    manager.metrics = RunMetrics.from_env()
+    manager._deferred_cookies = {
+        ACCOUNTS[0]: [{'name': 'session', 'value': 'valid', 'domain': 'leaflow.net'}],
+        ACCOUNTS[1]: [{'name': 'session', 'value': 'expired', 'domain': 'leaflow.net'}]
+    }
+    results = manager.fill_deferred_balances([
+        (ACCOUNTS[0], True, '签到成功', BALANCE_DEFERRED),
+        (ACCOUNTS[1], True, '签到成功', BALANCE_DEFERRED),
+        ('c@example.com', True, '今日已签到', BALANCE_DEFERRED),
+        None
+    ])
+
+    assert [result and result[3] for result in results] == ['5.00元', '未知', '未知', None]
+    assert '会话已失效' in caplog.text
+    assert '没有可用的登录会话' in caplog.text
+    assert manager.ledger.completed(ACCOUNTS)[ACCOUNTS[1]][2] == '未知'
+
+def test_interrupted_deferred_balance_in_ledger(manager):
+    for email in ACCOUNTS:
+        manager.ledger.record(email, 'success', '签到成功', balance=BALANCE_DEFERRED)
+
+    _, results = manager.run_all(notify=False)
+    assert [result[3] for result in results] == ['未知', '未知']
+
+class ScriptedCheckin:
+    """按 (邮箱, 第几次尝试) 预设行为的 LeaflowAutoCheckin 替身：'hang' 卡住直到被看门狗结束，其他值为签到结果"""
+
+    script = {}
+    attempts = {}
+
+    def __init__(self, email, password, **kwargs):
+        self.email = email
+        self.metrics = AccountMetrics(email)
+        self.session_cookies = None
+        self.failure_class = None
+        self.aborted = False
+        self._aborted = threading.Event()
+        ScriptedCheckin.attempts[email] = ScriptedCheckin.attempts.get(email, 0) + 1
+        self.action = self.script[email][ScriptedCheckin.attempts[email] - 1]
+
+    def abort(self):
+        self.aborted = True
+        self._aborted.set()
+
+    def run(self):
+        if self.action == 'hang':
+            self._aborted.wait(10)
+            return False, '浏览器已被结束', '未知'
+        self.failure_class = None if self.action == 'ok' else self.action
+        return self.action == 'ok', '签到成功' if self.action == 'ok' else '失败', '10.00元'
+
+@pytest.fixture
+def scripted(monkeypatch):
+    ScriptedCheckin.attempts = {}
+    monkeypatch.setattr(leaflow_checkin, 'LeaflowAutoCheckin', ScriptedCheckin)
+    monkeypatch.setenv('LEAFLOW_RETRY_BACKOFF', '0')
+    monkeypatch.setenv('LEAFLOW_ACCOUNT_TIMEOUT', '0.5')
+    return ScriptedCheckin
+
+def make_manager(monkeypatch, concurrency):
+    monkeypatch.setenv('LEAFLOW_CONCURRENCY', str(concurrency))
+    monkeypatch.setenv('LEAFLOW_SHARED_BROWSER', 'true')
+    manager = MultiAccountManager()
+    manager.notifier = None
+    return manager
+
+@pytest.mark.parametrize('concurrency', [1, 2])
+def test_timeout_is_retried_and_recorded(manager, scripted, monkeypatch, tmp_path, concurrency):
+    scripted.script = {ACCOUNTS[0]: ['hang', 'ok'], ACCOUNTS[1]: ['page_timeout', 'ok']}
+    manager = make_manager(monkeypatch, concurrency)
+    if concurrency == 1:
+        # 顺序模式由看门狗在 on_start 之后结束卡住的账号
+        monkeypatch.setattr(manager, 'expire', lambda index, auto_checkin, timeout: auto_checkin.abort())
+
+    started = time.monotonic()
+    success, results = manager.run_all(notify=False)
+    manager.close()
+    assert time.monotonic() - started < 5
+    assert success
+    assert [result[1] for result in results] == [True, True]
+    assert scripted.attempts == {ACCOUNTS[0]: 2, ACCOUNTS[1]: 2}
+
+    records = [record for record in read_metrics(tmp_path) if record['type'] == 'account']
+    by_account = {}
+    for record in records:
+        by_account.setdefault(record['account'], []).append((record['attempt'], record['failure_class'], record['retried']))
+    assert sorted(by_account.values()) == [
+        [(1, 'page_timeout', True), (2, None, False)],
+        [(1, 'timeout', True), (2, None, False)]
+    ]
+
+def test_timeout_attempts_are_capped(manager, scripted, monkeypatch):
+    scripted.script = {ACCOUNTS[0]: ['hang', 'hang', 'hang'], ACCOUNTS[1]: ['bad_credentials']}
+    monkeypatch.setenv('LEAFLOW_TIMEOUT_ATTEMPTS', '2')
+    manager = make_manager(monkeypatch, 2)
+
+    success, results = manager.run_all(notify=False)
+    manager.close()
+    assert not success
+    assert '超时' in results[0][2]
+    assert scripted.attempts == {ACCOUNTS[0]: 2, ACCOUNTS[1]: 1}
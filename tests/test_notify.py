@@ -0,0 +1,151 @@
+"""TelegramNotifier 对本地模拟Bot API的测试"""
+
+import json
+import time
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import parse_qs
+
+import pytest
+
+pytest.importorskip('requests')
+
+from leaflow import notify
+from leaflow.notify import TelegramNotifier
+
+class FakeBotApi:
+    """按预设的响应依次回复请求，记录收到的每次调用"""
+
+    def __init__(self):
+        self.calls = []
+        self.responses = []
+        # 清除后请求会一直等待，用于模拟响应很慢的Bot API
+        self.gate = threading.Event()
+        self.gate.set()
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                data = {key: values[0] for key, values in parse_qs(self.rfile.read(length).decode('utf-8')).items()}
+                method = self.path.rsplit('/', 1)[-1]
+                api.gate.wait(10)
+                api.calls.append((method, data))
+                status, payload = api.responses.pop(0) if api.responses else (200, None)
+                if payload is None:
+                    payload = {'ok': True, 'result': {'message_id': len(api.calls)}}
+                body = json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f'http://127.0.0.1:{self.server.server_port}'
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+@pytest.fixture
+def api():
+    api = FakeBotApi()
+    yield api
+    api.stop()
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    waited = []
+    monkeypatch.setattr(notify.time, 'sleep', waited.append)
+    return waited
+
+def test_rate_limited_waits_retry_after(api, sleeps):
+    api.responses = [(429, {'ok': False, 'description': 'Too Many Requests', 'parameters': {'retry_after': 7}})]
+    notifier = TelegramNotifier('123:abc', '42', api_url=api.url)
+
+    assert notifier.send(['<b>签到完成</b>'])
+    assert sleeps == [7.0]
+    assert [method for method, _ in api.calls] == ['sendMessage', 'sendMessage']
+    assert api.calls[-1][1] == {'chat_id': '42', 'text': '<b>签到完成</b>', 'parse_mode': 'HTML'}
+
+def test_server_errors_back_off(api, sleeps):
+    api.responses = [(502, {'ok': False, 'description': 'Bad Gateway'})] * 2
+    notifier = TelegramNotifier('123:abc', '42', api_url=api.url)
+
+    assert notifier.call('sendMessage', {'chat_id': '42', 'text': 'x'}) == {'message_id': 3}
+    assert sleeps == [1.0, 2.0]
+
+def test_client_error_is_not_retried(api, sleeps):
+    api.responses = [(400, {'ok': False, 'description': 'Bad Request: chat not found'})]
+    notifier = TelegramNotifier('123:abc', '42', api_url=api.url)
+
+    assert not notifier.send(['hello'])
+    assert len(api.calls) == 1
+    assert sleeps == []
+
+def test_oversized_message_is_split(api, sleeps):
+    blocks = [f"账号 {index:03d}: 签到成功，余额 10.00元\n" * 3 for index in range(200)]
+    notifier = TelegramNotifier('123:abc', '42', api_url=api.url)
+
+    assert notifier.send(blocks)
+    texts = [data['text'] for _, data in api.calls]
+    assert len(texts) > 1
+    assert all(len(text) <= TelegramNotifier.MAX_MESSAGE_LENGTH for text in texts)
+    assert ''.join(texts) == ''.join(blocks)
+    # 没有在消息块中间断开
+    assert all(text.endswith('\n') and text.startswith('账号') for text in texts)
+
+def test_split_single_block_longer_than_limit():
+    assert TelegramNotifier.split_message(['a' * 10, 'b' * 3], limit=4) == ['aaaa', 'aaaa', 'aa', 'bbb']
+
+def test_split_keeps_html_entities_and_tags_intact():
+    line = '<b>' + 'R&amp;D 签到' * 30 + '</b>\n'
+    chunks = TelegramNotifier.split_message([line], limit=50)
+    assert len(chunks) > 1
+    for chunk in chunks:
+        assert len(chunk) <= 50
+        assert chunk.startswith('<b>') and chunk.rstrip('\n').endswith('</b>')
+        assert chunk.count('&') == chunk.count('&amp;')
+    assert ''.join(chunks).replace('</b><b>', '') == line
+
+def test_split_prefers_line_boundaries():
+    block = ''.join(f'<code>{index}</code> 签到成功\n' for index in range(20))
+    chunks = TelegramNotifier.split_message([block], limit=60)
+    assert ''.join(chunks) == block
+    assert all(chunk.endswith('\n') for chunk in chunks)
+
+def test_length_counts_utf16_units():
+    emoji = '💰' * 30
+    assert TelegramNotifier.message_length(emoji) == 60
+    chunks = TelegramNotifier.split_message([emoji], limit=21)
+    assert [len(chunk) for chunk in chunks] == [10, 10, 10]
+
+def test_start_live_does_not_block(api):
+    notifier = TelegramNotifier('123:abc', '42', api_url=api.url, live=True, live_interval=0.01)
+    api.gate.clear()
+
+    started = time.monotonic()
+    notifier.start_live('进度 0/1')
+    notifier.update_live('进度 1/1')
+    assert time.monotonic() - started < 1
+    api.gate.set()
+    notifier.finish_live()
+    assert [data['text'] for _, data in api.calls] == ['进度 0/1', '进度 1/1']
+
+def test_live_message_is_edited_with_latest_text(api):
+    notifier = TelegramNotifier('123:abc', '42', api_url=api.url, live=True, live_interval=0.01)
+
+    notifier.start_live('进度 0/2')
+    notifier.update_live('进度 1/2')
+    notifier.finish_live('进度 2/2')
+    methods = [method for method, _ in api.calls]
+    assert methods[0] == 'sendMessage'
+    assert set(methods[1:]) == {'editMessageText'}
+    assert api.calls[-1][1]['text'] == '进度 2/2'
+    assert api.calls[-1][1]['message_id'] == '1'
@@ -0,0 +1,125 @@
+"""遗留浏览器进程清理的测试：只结束本脚本启动的进程"""
+
+import os
+import sys
+import time
+import shutil
+import subprocess
+
+import pytest
+
+from leaflow import process
+from leaflow.process import OWNER_SWITCH, reap_orphans, record_owned_process, owned_processes
+
+pytestmark = pytest.mark.skipif(not os.path.isdir('/proc'), reason='依赖Linux的/proc')
+
+SLEEP = [sys.executable, '-c', 'import time; time.sleep(60)']
+
+@pytest.fixture(autouse=True)
+def pid_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(process, 'PID_DIR', str(tmp_path / 'pids'))
+    return tmp_path / 'pids'
+
+@pytest.fixture
+def spawn():
+    started = []
+
+    def start(args=SLEEP, **kwargs):
+        child = subprocess.Popen(args, **kwargs)
+        started.append(child)
+        return child
+
+    yield start
+    for child in started:
+        child.kill()
+        child.wait()
+
+def dead_pid():
+    child = subprocess.Popen(['true'])
+    child.wait()
+    return child.pid
+
+def exited(child):
+    try:
+        child.wait(timeout=5)
+    except subprocess.TimeoutExpired:
+        return False
+    return True
+
+def write_record(pid_dir, pid, owner, start_time):
+    pid_dir.mkdir(exist_ok=True)
+    (pid_dir / str(pid)).write_text(f'{owner} {start_time}')
+
+def test_unrelated_chromedriver_is_left_alone(spawn, tmp_path):
+    # 与本脚本无关、名为chromedriver的进程（例如其他任务或远程端点）
+    sleep = shutil.which('sleep')
+    if not sleep:
+        pytest.skip('需要 sleep 命令')
+    binary = tmp_path / 'chromedriver'
+    shutil.copy(sleep, binary)
+    child = spawn([str(binary), '60'])
+    # 子进程可能还没有完成exec
+    deadline = time.monotonic() + 5
+    while process.read_proc(child.pid, 'comm').strip() != b'chromedriver':
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+    assert reap_orphans(include_own=True) == 0
+    assert child.poll() is None
+
+def test_recorded_process_of_dead_owner_is_reaped(spawn, pid_dir):
+    child = spawn()
+    write_record(pid_dir, child.pid, dead_pid(), process.process_start_time(child.pid))
+
+    assert reap_orphans() == 1
+    assert exited(child)
+    assert owned_processes() == {}
+
+def test_recorded_process_of_live_owner_is_kept_until_run_end(spawn):
+    child = spawn()
+    record_owned_process(child.pid)
+    assert owned_processes() == {child.pid: os.getpid()}
+
+    assert reap_orphans() == 0
+    assert child.poll() is None
+    assert reap_orphans(include_own=True) == 1
+    assert exited(child)
+
+def test_reused_pid_is_not_killed(spawn, pid_dir):
+    child = spawn()
+    write_record(pid_dir, child.pid, dead_pid(), '1')
+
+    assert reap_orphans() == 0
+    assert child.poll() is None
+    assert owned_processes() == {}
+
+def test_marked_browser_of_dead_owner_is_reaped(spawn):
+    marked = spawn(SLEEP + [f'{OWNER_SWITCH}={dead_pid()}'])
+    own = spawn(SLEEP + [f'{OWNER_SWITCH}={os.getpid()}'])
+
+    assert reap_orphans() == 1
+    assert exited(marked)
+    assert own.poll() is None
+
+def test_malformed_owner_is_skipped(spawn):
+    empty = spawn(SLEEP + [f'{OWNER_SWITCH}='])
+    garbage = spawn(SLEEP + [f'{OWNER_SWITCH}=abc'])
+
+    assert reap_orphans(include_own=True) == 0
+    assert empty.poll() is None
+    assert garbage.poll() is None
+
+def test_other_children_keep_their_exit_status(spawn, pid_dir):
+    # 其他线程的 Popen 对象（如 chromedriver Service）创建的子进程，退出状态必须留给它们自己
+    exited_child = spawn([sys.executable, '-c', 'raise SystemExit(3)'])
+    deadline = time.monotonic() + 5
+    while process.process_alive(exited_child.pid):
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    orphan = spawn()
+    write_record(pid_dir, orphan.pid, dead_pid(), process.process_start_time(orphan.pid))
+
+    assert reap_orphans() == 1
+    assert exited_child.wait(timeout=5) == 3
+    # 被结束的子进程已被回收，不会留下僵尸进程
+    assert process.process_stat(orphan.pid) is None
@@ -0,0 +1,104 @@
+"""共享签到队列的租约、过期接手和重复确认测试"""
+
+import time
+import threading
+
+import pytest
+
+from leaflow.queue import LeaseQueue, HttpLeaseQueue, make_queue_server
+
+RUN = 'run-1'
+
+@pytest.fixture
+def queue(tmp_path):
+    queue = LeaseQueue(str(tmp_path / 'queue.db'))
+    queue.seed(RUN, ['a', 'b'])
+    yield queue
+    queue.close()
+
+def test_lease_in_order_and_seed_is_idempotent(queue):
+    assert queue.lease(RUN, 'node-1', 60) == 'a'
+    # 其他节点重复 seed 不会把已领取的账号重置为待处理
+    queue.seed(RUN, ['a', 'b'])
+    assert queue.lease(RUN, 'node-2', 60) == 'b'
+    assert queue.lease(RUN, 'node-2', 60) is None
+    assert queue.state(RUN)['leased'] == 2
+
+def test_expired_lease_is_reclaimed(queue):
+    assert queue.lease(RUN, 'node-1', 0.05, exclude=['b']) == 'a'
+    assert queue.lease(RUN, 'node-2', 60, exclude=['b']) is None
+    time.sleep(0.1)
+    assert queue.lease(RUN, 'node-2', 60, exclude=['b']) == 'a'
+
+def test_renew_keeps_lease(queue):
+    assert queue.lease(RUN, 'node-1', 0.2, exclude=['b']) == 'a'
+    queue.renew(RUN, 'node-1', ['a'], 60)
+    # 其他节点的续约不影响租约
+    queue.renew(RUN, 'node-2', ['a'], 0)
+    time.sleep(0.3)
+    assert queue.lease(RUN, 'node-2', 60, exclude=['b']) is None
+    assert queue.state(RUN)['next_expiry'] > 50
+
+def test_release_makes_account_available(queue):
+    assert queue.lease(RUN, 'node-1', 60) == 'a'
+    queue.release(RUN, 'node-2', 'a')
+    assert queue.lease(RUN, 'node-2', 60) == 'b'
+    queue.release(RUN, 'node-1', 'a')
+    assert queue.lease(RUN, 'node-2', 60) == 'a'
+
+def test_late_ack_after_reclaim_does_not_overwrite(queue):
+    assert queue.lease(RUN, 'node-1', 0.05) == 'a'
+    time.sleep(0.1)
+    assert queue.lease(RUN, 'node-2', 60) == 'a'
+    queue.complete(RUN, 'node-2', 'a', {'success': True, 'message': '签到成功', 'balance': '10元'})
+    # 原持有者在租约过期后才确认，先完成的结果保留
+    queue.complete(RUN, 'node-1', 'a', {'success': False, 'message': '超时', 'balance': '未知'})
+    assert queue.results(RUN) == {'a': {'success': True, 'message': '签到成功', 'balance': '10元'}}
+    assert queue.lease(RUN, 'node-1', 60) == 'b'
+
+def test_double_ack_from_same_owner_updates_result(queue):
+    assert queue.lease(RUN, 'node-1', 60) == 'a'
+    queue.complete(RUN, 'node-1', 'a', {'success': True, 'message': '签到成功', 'balance': '待获取'})
+    queue.complete(RUN, 'node-1', 'a', {'success': True, 'message': '签到成功', 'balance': '10元'})
+    assert queue.results(RUN)['a']['balance'] == '10元'
+    assert queue.state(RUN) == {'pending': 1, 'leased': 0, 'done': 1, 'next_expiry': None}
+
+def test_claim_summary_once(queue):
+    assert queue.claim_summary(RUN, 'node-2')
+    assert not queue.claim_summary(RUN, 'node-1')
+    assert queue.claim_summary(RUN, 'node-2')
+
+def test_rerun_takes_over_summary(queue):
+    first_round = time.time()
+    assert queue.claim_summary(RUN, 'host-100', first_round)
+    # 同一轮中稍后完成的节点不重复发送
+    assert not queue.claim_summary(RUN, 'host-101', first_round)
+
+    # 同一天重新运行：新进程在上次认领之后才开始
+    time.sleep(0.01)
+    second_round = time.time()
+    assert queue.claim_summary(RUN, 'host-200', second_round)
+    assert not queue.claim_summary(RUN, 'host-100', first_round)
+    assert not queue.claim_summary(RUN, 'host-201', second_round)
+
+def test_http_coordinator(queue):
+    requests = pytest.importorskip('requests')
+    server = make_queue_server(queue, '127.0.0.1:0', token='secret')
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f'http://127.0.0.1:{server.server_port}'
+    try:
+        remote = HttpLeaseQueue(url, 'secret')
+        assert remote.lease(RUN, 'node-1', 60) == 'a'
+        remote.complete(RUN, 'node-1', 'a', {'success': True, 'message': 'ok', 'balance': '1元'})
+        assert remote.results(RUN) == {'a': {'success': True, 'message': 'ok', 'balance': '1元'}}
+        assert remote.state(RUN)['done'] == 1
+        assert remote.claim_summary(RUN, 'node-1', time.time())
+        assert not remote.claim_summary(RUN, 'node-2')
+
+        assert requests.post(f'{url}/state', json={'run_id': RUN}).status_code == 401
+        assert requests.post(f'{url}/close', json={}, headers={'Authorization': 'Bearer secret'}).status_code == 404
+        assert requests.post(f'{url}/state', json={}, headers={'Authorization': 'Bearer secret'}).status_code == 400
+        remote.close()
+    finally:
+        server.shutdown()
+        server.server_close()
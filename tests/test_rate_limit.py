@@ -0,0 +1,79 @@
+"""全局限速器的降速原因测试：日志中的原因必须对应实际触发条件"""
+
+import logging
+
+import pytest
+
+requests = pytest.importorskip('requests')
+
+import leaflow_checkin
+from leaflow_checkin import RateLimiter, HttpCheckin, LeaflowAutoCheckin
+
+leaflow_checkin.load_requests()
+
+class FakeResponse:
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+class FakeSession:
+    def __init__(self, response=None, error=None):
+        self.response = response
+        self.error = error
+
+    def request(self, method, url, timeout=None, **kwargs):
+        if self.error:
+            raise self.error
+        return self.response
+
+class FakeDriver:
+    def __init__(self, title):
+        self.title = title
+
+    def get(self, url):
+        pass
+
+@pytest.fixture
+def limiter():
+    # 每次报告都允许降速，便于逐条检查
+    limiter = RateLimiter(rate=1.0, slow_seconds=8.0)
+    limiter.DECREASE_COOLDOWN = 0
+    return limiter
+
+def reasons(caplog):
+    return [record.getMessage().rsplit('（', 1)[-1].rstrip('）') for record in caplog.records
+            if record.levelno == logging.WARNING and '限速降低' in record.getMessage()]
+
+def request(limiter, session):
+    return HttpCheckin(session, leaflow_url='http://leaflow.test', limiter=limiter)._request('GET', 'http://leaflow.test/')
+
+def test_fast_failures_report_status(limiter, caplog):
+    request(limiter, FakeSession(FakeResponse(429, {'Retry-After': '0'})))
+    request(limiter, FakeSession(FakeResponse(502)))
+    assert reasons(caplog) == ['状态码 429', '状态码 502']
+
+def test_slow_success_reports_duration(limiter, caplog, monkeypatch):
+    ticks = iter([0.0, 9.5])
+    monkeypatch.setattr('leaflow_checkin.time.perf_counter', lambda: next(ticks))
+    request(limiter, FakeSession(FakeResponse(200)))
+    assert reasons(caplog) == ['响应过慢: 9.5 秒']
+
+def test_fast_success_does_not_slow_down(limiter, caplog):
+    request(limiter, FakeSession(FakeResponse(200)))
+    request(limiter, FakeSession(FakeResponse(404)))
+    assert reasons(caplog) == []
+    assert limiter.rate > 1.0
+
+def test_network_error(limiter, caplog):
+    with pytest.raises(requests.ConnectionError):
+        request(limiter, FakeSession(error=requests.ConnectionError('refused')))
+    assert reasons(caplog) == ['网络错误']
+
+def test_error_page_reports_title(limiter, caplog, monkeypatch):
+    monkeypatch.setenv('LEAFLOW_HTTP_CHECKIN', 'false')
+    checkin = LeaflowAutoCheckin('a@example.com', 'password', limiter=limiter)
+    checkin.driver = FakeDriver('503 Service Unavailable')
+    checkin.open_page('http://leaflow.test/', '登录页')
+    checkin.driver = FakeDriver('Leaflow')
+    checkin.open_page('http://leaflow.test/', '签到页')
+    assert reasons(caplog) == ['错误页: 503 Service Unavailable']
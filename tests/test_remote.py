@@ -0,0 +1,145 @@
+"""远程WebDriver端点池对本地模拟端点（/status 和 /session）的测试"""
+
+import json
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import pytest
+
+pytest.importorskip('selenium')
+pytest.importorskip('requests')
+
+from selenium.common.exceptions import SessionNotCreatedException
+from selenium.webdriver.chrome.options import Options
+
+from leaflow.remote import RemoteWebDriverPool, launch_remote_driver, release_remote_endpoint
+
+class FakeEndpoint:
+    """只实现会话创建和删除的WebDriver端点"""
+
+    def __init__(self, ready=True, session_error=None):
+        self.ready = ready
+        self.session_error = session_error
+        self.sessions = []
+        self.deleted = []
+        endpoint = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def reply(self, status, value):
+                body = json.dumps({'value': value}).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                if self.path == '/status':
+                    return self.reply(200, {'ready': endpoint.ready, 'message': ''})
+                self.reply(404, {'error': 'unknown command', 'message': self.path})
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get('Content-Length') or 0))
+                if self.path != '/session':
+                    return self.reply(404, {'error': 'unknown command', 'message': self.path})
+                if endpoint.session_error:
+                    return self.reply(500, {'error': 'session not created', 'message': endpoint.session_error})
+                session_id = f'session-{len(endpoint.sessions) + 1}'
+                endpoint.sessions.append(session_id)
+                self.reply(200, {'sessionId': session_id, 'capabilities': {'browserName': 'chrome'}})
+
+            def do_DELETE(self):
+                endpoint.deleted.append(self.path.rsplit('/', 1)[-1])
+                self.reply(200, None)
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f'http://127.0.0.1:{self.server.server_port}'
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+@pytest.fixture
+def endpoints():
+    created = []
+
+    def create(**kwargs):
+        endpoint = FakeEndpoint(**kwargs)
+        created.append(endpoint)
+        return endpoint
+
+    yield create
+    for endpoint in created:
+        endpoint.stop()
+
+def test_parse():
+    assert RemoteWebDriverPool.parse('http://a:9515*2, http://b:4444/wd/hub/') == [
+        ('http://a:9515', 2), ('http://b:4444/wd/hub', 1)
+    ]
+    for value in ('ftp://a:1', 'http://a:1*0', 'http://a:1*x'):
+        with pytest.raises(ValueError):
+            RemoteWebDriverPool.parse(value)
+
+def test_sessions_go_to_healthy_endpoints(endpoints):
+    good, down = endpoints(), endpoints(ready=False)
+    pool = RemoteWebDriverPool([(good.url, 2), (down.url, 2)], wait_timeout=5)
+
+    drivers = [launch_remote_driver(pool, Options()) for _ in range(2)]
+    assert good.sessions == ['session-1', 'session-2']
+    assert down.sessions == []
+    stats = {item['endpoint'].split(':')[-1]: item for item in pool.stats()}
+    assert stats[str(good.server.server_port)]['in_use'] == 2
+    assert not stats[str(down.server.server_port)]['healthy']
+
+    for driver in drivers:
+        driver.quit()
+        release_remote_endpoint(driver)
+    assert sorted(good.deleted) == ['session-1', 'session-2']
+    assert all(item['in_use'] == 0 for item in pool.stats())
+
+def test_waits_for_free_slot(endpoints):
+    endpoint = endpoints()
+    pool = RemoteWebDriverPool([(endpoint.url, 1)], wait_timeout=0.5)
+
+    driver = launch_remote_driver(pool, Options())
+    with pytest.raises(SessionNotCreatedException):
+        pool.acquire()
+
+    # 槽位归还后等待中的请求立即得到端点
+    pool.wait_timeout = 5
+    threading.Timer(0.2, release_remote_endpoint, args=(driver,)).start()
+    assert pool.acquire()['url'] == endpoint.url
+
+def test_failed_session_moves_to_next_endpoint(endpoints):
+    broken, good = endpoints(session_error='Chrome failed to start'), endpoints()
+    pool = RemoteWebDriverPool([(broken.url, 1), (good.url, 1)], wait_timeout=5)
+    for endpoint in pool.endpoints:
+        pool.check(endpoint)
+    # 让损坏的端点先被选中
+    pool.endpoints[0]['latency'], pool.endpoints[1]['latency'] = 0.001, 1.0
+
+    driver = launch_remote_driver(pool, Options())
+    assert good.sessions == ['session-1']
+    assert pool.endpoints[0]['errors'] == 1
+    assert pool.endpoints[0]['in_use'] == 0
+    release_remote_endpoint(driver)
+
+    # 连续失败达到上限后暂停使用
+    pool.endpoints[1]['in_use'] = 1
+    pool.wait_timeout = 0.5
+    with pytest.raises(SessionNotCreatedException):
+        launch_remote_driver(pool, Options())
+    assert not pool.endpoints[0]['healthy']
+
+def test_all_endpoints_failing_raises(endpoints):
+    first, second = endpoints(session_error='no chrome'), endpoints(session_error='no chrome')
+    pool = RemoteWebDriverPool([(first.url, 1), (second.url, 1)], wait_timeout=5)
+    with pytest.raises(SessionNotCreatedException, match='no chrome'):
+        launch_remote_driver(pool, Options())
+    assert len(first.sessions + second.sessions) == 0
+    assert all(item['in_use'] == 0 and item['errors'] == 1 for item in pool.stats())
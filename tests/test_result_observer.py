@@ -0,0 +1,100 @@
+"""签到结果观察器的测试：点击前安装的页面观察器，以及观察器不可用时的回退查找
+
+设置 CHROME_PATH 后会在模拟站点上用真实Chrome验证很快消失的提示消息也能被记录。
+"""
+
+import os
+
+import pytest
+
+pytest.importorskip('selenium')
+
+from selenium.common.exceptions import TimeoutException, JavascriptException
+
+import leaflow_checkin
+from leaflow_checkin import LeaflowAutoCheckin, Deadline
+from mock_leaflow import MockLeaflow
+
+leaflow_checkin.load_selenium()
+
+class FakeDriver:
+    def __init__(self, observed=None, error=None):
+        self.observed = observed
+        self.error = error
+        self.scripts = []
+
+    def execute_script(self, script, *args):
+        if self.error:
+            raise self.error
+        self.scripts.append((script, args))
+
+    def execute_async_script(self, script, *args):
+        if self.error:
+            raise self.error
+        return self.observed
+
+def account(driver):
+    checkin = LeaflowAutoCheckin('u1@example.com', 'password', http_checkin=False)
+    checkin.driver = driver
+    return checkin
+
+def test_observer_receives_css_selectors_only():
+    driver = FakeDriver()
+    account(driver).install_result_observer()
+    (script, (selectors,)), = driver.scripts
+    assert script == LeaflowAutoCheckin.RESULT_OBSERVER_SCRIPT
+    assert selectors and not any(selector.startswith('//') for selector in selectors)
+
+def test_observer_install_failure_is_ignored():
+    account(FakeDriver(error=JavascriptException('blocked'))).install_result_observer()
+
+@pytest.mark.parametrize('observed, expected', [
+    ({'messages': ['欢迎回来', '签到成功，获得 0.5 元']}, '签到成功，获得 0.5 元'),
+    ({'messages': ['欢迎回来']}, '欢迎回来'),
+    ({'buttonDone': True}, '今日已签到完成'),
+    # 点击后页面跳转，观察器随旧页面一起消失，交给回退查找
+    ({'navigated': True}, None)
+])
+def test_observed_result(observed, expected):
+    assert account(FakeDriver(observed)).wait_for_observed_result(Deadline(1)) == expected
+
+def test_nothing_observed_times_out():
+    with pytest.raises(TimeoutException):
+        account(FakeDriver({})).wait_for_observed_result(Deadline(1))
+
+def test_interrupted_wait_falls_back():
+    assert account(FakeDriver(error=JavascriptException('navigated'))).wait_for_observed_result(Deadline(1)) is None
+
+def run_account(monkeypatch, backend, **options):
+    mock = MockLeaflow(popup=False, **options).start()
+    monkeypatch.setattr(leaflow_checkin, 'LEAFLOW_URL', mock.base_url)
+    monkeypatch.setattr(leaflow_checkin, 'CHECKIN_URL', mock.checkin_url)
+    for name, value in {'LEAFLOW_BACKEND': backend, 'LEAFLOW_HEADLESS': '1', 'LEAFLOW_HTTP_CHECKIN': 'false',
+                        'LEAFLOW_BALANCE': 'skip'}.items():
+        monkeypatch.setenv(name, value)
+    checkin = LeaflowAutoCheckin('u1@example.com', 'password')
+    try:
+        return checkin.run()
+    finally:
+        mock.stop()
+
+@pytest.mark.skipif(not os.getenv('CHROME_PATH'), reason='需要设置 CHROME_PATH 指向本机Chrome')
+@pytest.mark.parametrize('backend', ['selenium', 'cdp'])
+def test_short_lived_toast_is_captured(monkeypatch, backend):
+    # 提示消息只显示50毫秒，轮询查找几乎不可能看到，观察器在它出现时就记录下来
+    success, message, _ = run_account(monkeypatch, backend, checkin_mode='js', toast_ms=50)
+    assert success, message
+    assert message.startswith('签到成功')
+
+@pytest.mark.skipif(not os.getenv('CHROME_PATH'), reason='需要设置 CHROME_PATH 指向本机Chrome')
+def test_falls_back_when_observer_is_unavailable(monkeypatch):
+    monkeypatch.setattr(LeaflowAutoCheckin, 'RESULT_OBSERVER_SCRIPT', 'throw new Error("CSP")')
+    success, message, _ = run_account(monkeypatch, 'cdp', checkin_mode='js', toast_ms=5000)
+    assert success, message
+    assert message.startswith('签到成功')
+
+@pytest.mark.skipif(not os.getenv('CHROME_PATH'), reason='需要设置 CHROME_PATH 指向本机Chrome')
+def test_form_submit_result_found_after_navigation(monkeypatch):
+    success, message, _ = run_account(monkeypatch, 'cdp', checkin_mode='form')
+    assert success, message
+    assert message.startswith('签到成功')
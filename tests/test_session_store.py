@@ -0,0 +1,52 @@
+"""会话缓存加密的测试：口令派生用的随机盐保存在缓存目录中"""
+
+import pytest
+
+pytest.importorskip('cryptography')
+
+from leaflow_checkin import SessionStore, SALT_BYTES
+
+EMAIL = 'a@example.com'
+COOKIES = [{'name': 'session', 'value': 'abc', 'domain': 'leaflow.net', 'path': '/'}]
+
+def test_salt_is_created_once_and_reused(tmp_path):
+    directory = tmp_path / 'sessions'
+    SessionStore(str(directory), 'passphrase').save(EMAIL, COOKIES)
+    salt = (directory / 'salt').read_bytes()
+    assert len(salt) == SALT_BYTES
+
+    assert SessionStore(str(directory), 'passphrase').load(EMAIL) == COOKIES
+    assert (directory / 'salt').read_bytes() == salt
+    assert not list(directory.glob('*.tmp'))
+
+def test_lost_salt_drops_sessions(tmp_path):
+    directory = tmp_path / 'sessions'
+    SessionStore(str(directory), 'passphrase').save(EMAIL, COOKIES)
+    (directory / 'salt').unlink()
+
+    store = SessionStore(str(directory), 'passphrase')
+    assert store.load(EMAIL) is None
+    assert not list(directory.glob('*.session'))
+
+def test_same_passphrase_different_salt(tmp_path):
+    first = SessionStore(str(tmp_path / 'first'), 'passphrase')
+    second = SessionStore(str(tmp_path / 'second'), 'passphrase')
+    first.save(EMAIL, COOKIES)
+    token = next((tmp_path / 'first').glob('*.session')).read_bytes()
+    with pytest.raises(Exception):
+        second.fernet.decrypt(token)
+
+def test_raw_fernet_key(tmp_path):
+    from cryptography.fernet import Fernet
+
+    key = Fernet.generate_key().decode('ascii')
+    store = SessionStore(str(tmp_path), key)
+    store.save(EMAIL, COOKIES)
+    token = next(tmp_path.glob('*.session')).read_bytes()
+    assert b'abc' in Fernet(key).decrypt(token)
+
+def test_corrupted_salt_disables_cache(tmp_path, monkeypatch):
+    (tmp_path / 'salt').write_bytes(b'short')
+    monkeypatch.setenv('LEAFLOW_SESSION_KEY', 'passphrase')
+    monkeypatch.setenv('LEAFLOW_SESSION_DIR', str(tmp_path))
+    assert SessionStore.from_env() is None
@@ -0,0 +1,89 @@
+"""历史记录报表的测试：连续成功天数、失败日和余额变化"""
+
+from datetime import datetime, timedelta
+
+import pytest
+
+from leaflow import store
+from leaflow.store import CheckinLedger, HistoryStore, format_report, mask_email
+
+A, B, C = 'a@example.com', 'b@example.com', 'c@example.com'
+
+def day(offset):
+    return (datetime.now(CheckinLedger.TIMEZONE) - timedelta(days=offset)).strftime('%Y-%m-%d')
+
+@pytest.fixture
+def history(tmp_path, monkeypatch):
+    history = HistoryStore(str(tmp_path / 'history.db'))
+
+    def add(offset, run_id, rows):
+        monkeypatch.setattr(store.CheckinLedger, 'today', classmethod(lambda cls: day(offset)))
+        history.append(run_id, [
+            (email, success, None if success else 'page_timeout', balance, attempts, None)
+            for email, success, balance, attempts in rows
+        ])
+
+    history.add = add
+    yield history
+    history.close()
+
+def details(report):
+    return {item['account']: item for item in report['account_details']}
+
+def test_streak_is_broken_by_a_day_without_runs(history):
+    for offset in (6, 5, 2, 1, 0):
+        history.add(offset, f'run-{offset}', [(A, True, None, 1)])
+
+    assert details(history.report())[mask_email(A)]['streak_days'] == 3
+
+def test_streak_is_broken_by_a_failed_day(history):
+    history.add(3, 'run-3', [(A, True, None, 1), (B, True, None, 1)])
+    history.add(2, 'run-2', [(A, False, None, 3), (B, True, None, 1)])
+    # 同一天重新运行成功，这一天仍算成功日
+    history.add(1, 'run-1a', [(A, True, None, 1), (B, False, None, 3)])
+    history.add(1, 'run-1b', [(B, True, None, 2)])
+    history.add(0, 'run-0', [(A, True, None, 1), (B, False, None, 3)])
+
+    report = history.report()
+    accounts = details(report)
+    assert accounts[mask_email(A)]['streak_days'] == 2
+    # 最近一天失败时连续天数为0
+    assert accounts[mask_email(B)]['streak_days'] == 0
+    assert accounts[mask_email(B)]['failures'] == 2
+    assert accounts[mask_email(A)]['retries'] == 2
+    assert report['failure_classes'] == {'page_timeout': 3}
+    assert report['runs'] == 5
+
+def test_balance_delta_uses_first_and_last_known_balance(history):
+    history.add(4, 'run-4', [(A, True, 10.0, 1), (B, True, None, 1)])
+    history.add(2, 'run-2a', [(A, True, 10.5, 1), (B, True, 20.0, 1)])
+    history.add(2, 'run-2b', [(A, True, 11.0, 1)])
+    # 最近一次没有读到余额时沿用之前的最后余额
+    history.add(0, 'run-0', [(A, True, 12.25, 1), (B, True, None, 1)])
+    history.add(10, 'run-old', [(C, True, 1.0, 1)])
+
+    report = history.report(days=7)
+    accounts = details(report)
+    assert accounts[mask_email(A)]['balance'] == 12.25
+    assert accounts[mask_email(A)]['balance_delta'] == 2.25
+    assert accounts[mask_email(B)]['balance_delta'] == 0.0
+    # 统计范围之外的记录不计入
+    assert mask_email(C) not in accounts
+    assert report['balance_delta'] == 2.25
+    assert report['first_day'] == day(4)
+
+def test_format_report(history):
+    history.add(1, 'run-1', [(A, True, 10.0, 1), (B, False, None, 2)])
+    history.add(0, 'run-0', [(A, True, 11.0, 1), (B, True, 5.0, 1)])
+
+    text = format_report(history.report())
+    assert '2 次运行，2 个账号，4 条结果' in text
+    assert '成功率: 75.0%' in text
+    assert '余额合计变化: +1.00元' in text
+    assert '失败类型: page_timeout 1' in text
+    assert f'{mask_email(B)}: 失败 1/2（50%），重试 1 次，连续成功 1 天' in text
+
+def test_empty_report(history):
+    report = history.report(days=7)
+    assert report['results'] == 0
+    assert format_report(report) == f"{day(6)} 以来没有历史记录"